@@ -1,412 +1,483 @@
 # ChemCalc_main.py (updated)
-from tkinter import *
-import ttkbootstrap as tb
-from ttkbootstrap.dialogs import Messagebox
-from UserInterface import main_menu, eGFR_menu, eGFR_ped_menu, uacr_menu, uosm_menu, sosm_menu, ldl_menu, hdl_menu
-import formulas
+import time
+_T0 = time.perf_counter()  # start of the startup-timing window
+
+import argparse
+import os
+import sys
+from collections import deque
+
+import engine
+
+# GUI modules (tkinter, ttkbootstrap, UserInterface) are imported by load_gui() when a
+# window is created, so importing this module for the engine costs no GUI start-up.
+tk = tb = Messagebox = UserInterface = None
+
+
+def load_gui():
+    global tk, tb, Messagebox, UserInterface
+    if UserInterface is None:
+        import tkinter as tk
+        import ttkbootstrap as tb
+        from ttkbootstrap.dialogs import Messagebox
+        import UserInterface
+
+
+class PageManager:
+    """
+    Pages stacked in the same grid cell of one container; showing a page raises it
+    (tkraise), so navigating never re-packs or re-lays out the other pages. Pages are
+    registered by name with a builder, builder(frame), that fills the frame the first
+    time the page is shown (or asked for with frame()).
+    latencies: name -> recent navigation times in seconds, from show() until Tk has
+    gone idle again (geometry and redraw done); on_navigate(name, seconds), if set, is
+    called with each one.
+    """
+    def __init__(self, root, history=256):
+        self.root = root
+        self.container = tk.Frame(root)
+        self.container.pack(fill="both", expand=True)
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
+        self.builders = {}
+        self.frames = {}
+        self.current = None
+        self.latencies = {}
+        self.history = history
+        self.on_navigate = None
+
+    def register(self, name, builder):
+        self.builders[name] = builder
+
+    def frame(self, name):
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = tk.Frame(self.container)
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[name] = frame
+            self.builders[name](frame)
+        return frame
+
+    def show(self, name):
+        start = time.perf_counter()
+        self.frame(name).tkraise()
+        self.current = name
+        self.root.after_idle(self._record, name, start)
+
+    def _record(self, name, start):
+        seconds = time.perf_counter() - start
+        self.latencies.setdefault(name, deque(maxlen=self.history)).append(seconds)
+        if self.on_navigate is not None:
+            self.on_navigate(name, seconds)
+
 
 class ChemCalc:
-    def __init__(self, root):
+    # calculator pages, built the first time they are opened:
+    # name -> (UserInterface class, attribute holding the UI, calculate button, handler)
+    PAGES = {
+        "eGFR": ("eGFR_menu", "eGFR_ui", "calcEGFRBtn", "calculate_egfr"),
+        "eGFR_ped": ("eGFR_ped_menu", "eGFR_ped_ui", "calcPedGFRBtn", "calculate_pediatric_egfr"),
+        "uacr": ("uacr_menu", "uacr_ui", "calcUACRBtn", "calculate_urine_acr"),
+        "uosm": ("uosm_menu", "uosm_ui", "calcUOSMBtn", "calculate_urine_osmolality"),
+        "ldl": ("ldl_menu", "ldl_ui", "calcLDLBtn", "calculate_ldl"),
+        "hdl": ("hdl_menu", "hdl_ui", "calcHDLBtn", "calculate_hdl_from_sampson"),
+        "sosm": ("sosm_menu", "sosm_ui", "calcSOSMBtn", "calculate_serum_osmolarity"),
+        "batch": ("batch_menu", "batch_ui", "startBatchBtn", "start_batch"),
+    }
+    LIVE_DELAY_MS = 300   # live mode: recalculate once input has been still this long
+
+    def __init__(self, root, calc_engine=engine, live=False):
+        load_gui()
         self.root = root
+        # engine module, or anything with the same functions (e.g. cache.CachedEngine)
+        self.engine = calc_engine
+        self.batch_job = None   # the running or last batch_job.BatchJob
         self.back_btn  = tb.Button(root, text="<", bootstyle="success", command=self.back_to_mainMenu)
 
-        # pages
-        self.page1 = Frame(root)
-        self.page2 = Frame(root)
-        self.page3 = Frame(root)
-        self.page4 = Frame(root)
-        self.page5 = Frame(root)
-        self.page6 = Frame(root)
-        self.page7 = Frame(root)
-        self.page8 = Frame(root)
-
-        self.show_page(self.page1)
-
-        # create UI modules
-        self.menu_ui = main_menu(self.page1)
-        self.eGFR_ui = eGFR_menu(self.page2)
-        self.eGFR_ped_ui = eGFR_ped_menu(self.page3)
-        self.uacr_ui = uacr_menu(self.page4)
-        self.uosm_ui = uosm_menu(self.page5)
-        self.ldl_ui = ldl_menu(self.page6)
-        self.hdl_ui = hdl_menu(self.page7)
-        self.sosm_ui = sosm_menu(self.page8)
+        # live mode: calculator pages recalculate as their inputs change
+        self.live_var = tk.BooleanVar(value=live)
+        self.live_chk = tb.Checkbutton(root, text="Live", variable=self.live_var,
+                                       bootstyle="success-round-toggle", command=self._live_toggled)
+        self.live_stats = {"edits": 0, "recalculations": 0, "redraws": 0}
+        self.current = None          # name of the calculator on screen
+        self._live = False           # True while a live recalculation runs
+        self._live_pending = None    # (after id, page name) of the debounced recalculation
+        self._label_state = {}       # label -> (text, bootstyle) last configured
+
+        # pages: only the main menu is built at start-up, calculators on first use
+        self.pages = PageManager(root)
+        self.pages.register("menu", self._build_menu)
+        for name in self.PAGES:
+            self.pages.register(name, lambda frame, name=name: self._build_page(name, frame))
+        self.page1 = self.pages.frame("menu")
+        self.show_page("menu")
 
         # ASSIGN COMMANDS TO BUTTONS
         self.menu_ui.eGFRBtn.config(command=self.show_eGFR)
-        self.eGFR_ui.calcEGFRBtn.config(command=self.calculate_egfr)
-
         self.menu_ui.eGFR_pedBtn.config(command=self.show_eGFR_ped)
-        self.eGFR_ped_ui.calcPedGFRBtn.config(command=self.calculate_pediatric_egfr)
-
         self.menu_ui.UACRBtn.config(command=self.show_uacr)
-        self.uacr_ui.calcUACRBtn.config(command=self.calculate_urine_acr)
-
         self.menu_ui.uOsmBtn.config(command=self.show_uosm)
-        self.uosm_ui.calcUOSMBtn.config(command=self.calculate_urine_osmolality)
-
         self.menu_ui.LDLBtn.config(command=self.show_ldl)
-        self.ldl_ui.calcLDLBtn.config(command=self.calculate_ldl)
-
         self.menu_ui.HDLBtn.config(command=self.show_hdl)
-        self.hdl_ui.calcHDLBtn.config(command=self.calculate_hdl_from_sampson)
-
         self.menu_ui.sOsmBtn.config(command=self.show_sosm)
-        self.sosm_ui.calcSOSMBtn.config(command=self.calculate_serum_osmolarity)
+        self.menu_ui.batchBtn.config(command=self.show_batch)
 
     # ---------- navigation ----------
-    def show_page(self, page):
-        for p in [self.page1, self.page2, self.page3, self.page4, self.page5, self.page6, self.page7, self.page8]:
-            p.pack_forget()
-        page.pack()
+    def _build_menu(self, frame):
+        self.menu_ui = UserInterface.main_menu(frame)
+
+    def _build_page(self, name, frame):
+        ui_class, ui_attr, button, handler = self.PAGES[name]
+        page_ui = getattr(UserInterface, ui_class)(frame)
+        setattr(self, ui_attr, page_ui)
+        getattr(page_ui, button).config(command=getattr(self, handler))
+        if hasattr(page_ui, "result"):
+            for var in self._inputs(page_ui):
+                var.trace_add("write", lambda *_, name=name: self._edited(name))
+        # the page has entries now: build the shared keypad while idle, before the first tap
+        self.root.after_idle(UserInterface.NumpadPopup.pooled, self.root)
+
+    def page(self, name):
+        """Returns the frame of calculator `name`, building and wiring it on first use."""
+        return self.pages.frame(name)
+
+    def show_page(self, name):
+        self.pages.show(name)
+
+    def show_calculator(self, name):
+        self.show_page(name)
+        self.current = name
+        self.back_btn.place(x=10, y=10)
+        self.back_btn.lift()
+        if hasattr(getattr(self, self.PAGES[name][1]), "result"):
+            self.live_chk.place(relx=1.0, x=-10, y=10, anchor="ne")
+            self.live_chk.lift()
+        else:
+            self.live_chk.place_forget()
 
     def show_eGFR(self):
-        self.show_page(self.page2)
-        self.back_btn.place(x=10, y=10)
+        self.show_calculator("eGFR")
     def show_eGFR_ped(self):
-        self.show_page(self.page3)
-        self.back_btn.place(x=10, y=10)
+        self.show_calculator("eGFR_ped")
     def show_uacr(self):
-        self.show_page(self.page4)
-        self.back_btn.place(x=10, y=10)
+        self.show_calculator("uacr")
     def show_uosm(self):
-        self.show_page(self.page5)
-        self.back_btn.place(x=10, y=10)
+        self.show_calculator("uosm")
     def show_sosm(self):
-        self.show_page(self.page8)
-        self.back_btn.place(x=10, y=10)
+        self.show_calculator("sosm")
     def show_ldl(self):
-        self.show_page(self.page6)
-        self.back_btn.place(x=10, y=10)
+        self.show_calculator("ldl")
     def show_hdl(self):
-        self.show_page(self.page7)
-        self.back_btn.place(x=10, y=10)
+        self.show_calculator("hdl")
+    def show_batch(self):
+        self.show_calculator("batch")
     def back_to_mainMenu(self):
-        self.show_page(self.page1)
+        self.show_page("menu")
+        self.current = None
         self.back_btn.place_forget()
+        self.live_chk.place_forget()
+
+    # ---------- live mode ----------
+    # Every input variable of a calculator page (entries, unit radios, gender, toggles)
+    # is traced. An edit restarts a LIVE_DELAY_MS timer, so a burst of keystrokes costs
+    # one recalculation. Labels are only reconfigured when their text or bootstyle
+    # changes (_set_label); live_stats counts edits, live recalculations and the label
+    # redraws they caused.
+    def _inputs(self, ui):
+        """The Tk variables a calculator page reads, including its unit selectors."""
+        for value in vars(ui).values():
+            if isinstance(value, tk.Variable):
+                yield value
+            elif isinstance(value, UserInterface.CreateEntryField) and value.unit_var is not None:
+                yield value.unit_var
+
+    def _edited(self, name):
+        if not self.live_var.get():
+            return
+        self.live_stats["edits"] += 1
+        if self._live_pending is not None:
+            self.root.after_cancel(self._live_pending[0])
+        self._live_pending = (self.root.after(self.LIVE_DELAY_MS, self._recalculate, name), name)
+
+    def _recalculate(self, name):
+        self._live_pending = None
+        self.live_stats["recalculations"] += 1
+        self._live = True
+        try:
+            return getattr(self, self.PAGES[name][3])()
+        finally:
+            self._live = False
+
+    def flush_live(self):
+        """Runs a pending live recalculation now instead of after the delay."""
+        if self._live_pending is not None:
+            after_id, name = self._live_pending
+            self.root.after_cancel(after_id)
+            return self._recalculate(name)
+        return None
+
+    def _live_toggled(self):
+        if self.live_var.get() and self.current is not None:
+            self._edited(self.current)
+
+    def redraws_per_edit(self):
+        return self.live_stats["redraws"] / max(self.live_stats["edits"], 1)
+
+    def _set_label(self, label, text, bootstyle=None):
+        """Configures `label` with what changed since the last call; bootstyle None leaves it as is."""
+        state = self._label_state.get(label)
+        if state == (text, bootstyle):
+            return
+        options = {}
+        if state is None or state[0] != text:
+            options["text"] = text
+        if bootstyle is not None and (state is None or state[1] != bootstyle):
+            options["bootstyle"] = bootstyle
+        self._label_state[label] = (text, bootstyle)
+        if options:
+            label.config(**options)
+            if self._live:
+                self.live_stats["redraws"] += 1
 
     # ---------- calculations ----------
-    def calculate_egfr(self):
+    # The math and interpretation live in engine.py; these handlers only read the
+    # page, call the engine and render the Result.
+    def _unit(self, ui, field_name, default):
+        field = getattr(ui, field_name, None)
+        if field and getattr(field, "unit_var", None):
+            return field.unit_var.get()
+        return default
+
+    def _run(self, ui, calc, *args, **kwargs):
         try:
-            creat_val = self.eGFR_ui.creatinine_var.get()
-            age = self.eGFR_ui.age_var.get()
-            height = self.eGFR_ui.height_var.get()
-            weight = self.eGFR_ui.weight_var.get()
-            gender = self.eGFR_ui.patient_gender.get()
-            adjust_bsa = self.eGFR_ui.adjust_bsa_var.get()
-
-
-            creat_unit = "µmol/L"
-            try:
-                # try to find attribute creatinine_field on eGFR_ui (we saved in UI for many entries)
-                creat_field = getattr(self.eGFR_ui, "creatinine_field", None)
-                if creat_field and getattr(creat_field, "unit_var", None):
-                    creat_unit = creat_field.unit_var.get()
-            except Exception:
-                pass
-
-            # call formula (CKD-EPI)
-            egfr = formulas.egfr_ckdepi2021(creat_val, creat_unit, age=float(age), sex=gender.lower(), adjust_to_bsa= adjust_bsa, weight_kg=float(weight), height_cm=float(height))
-            # Do NOT auto-adjust BSA; if you want absolute GFR, enable adjust_to_bsa=True and pass weight & height
-            unit = "mL/min/1.73 m²" if adjust_bsa else "mL/min"
-
-
-            # stage interpretation
-            if egfr >= 90:
-                stage, color, msg = "G1 (Normal)", "success", "Normal kidney function."
-            elif egfr >= 60:
-                stage, color, msg = "G2 (Mildly decreased)", "info", "Slightly reduced kidney function."
-            elif egfr >= 45:
-                stage, color, msg = "G3a (Mild–Moderate)", "warning", "Mild to moderate reduction in GFR."
-            elif egfr >= 30:
-                stage, color, msg = "G3b (Moderate–Severe)", "warning", "Moderate to severe kidney damage."
-            elif egfr >= 15:
-                stage, color, msg = "G4 (Severe)", "danger", "Severe kidney damage. Nephrology care required."
-            else:
-                stage, color, msg = "G5 (Kidney Failure)", "danger", "End-stage renal disease. Dialysis likely needed."
-            
-            if creat_unit.lower() in ("umol/L", "umol", "µmol/l", "µmol/L"): scr_mgdl = formulas.creat_umoll_to_mgdl(float(creat_val))
-            else: scr_mgdl = float(creat_val)
-            equation = (
-            "Equation Used: CKD-EPI 2021\n"
-            f"kappa = 0.7 if sex is female and 0.9 for male\n"
-            f"alpha = -0.241 if sex is female and -0.302 for male\n"
-            f"sex_factor = 1.012 if sex is female and 1.0 for male;\n"
-            f" y = creatinine[{scr_mgdl:.2f}] / kappa\n"
-            f"eGFR = 142 x (min(y, 1)^alpha) x (max(y, 1)^-1.200) x (0.9938^age[{age}]) x sex_factor\n"
-            )
-            if adjust_bsa:
-                equation += (
-                f"BSA Adjustment: BSA = 0.007184 × Height[{height}]^0.725 × Weight[{weight}]^0.425\n"
-                f"Adjusted eGFR = eGFR × (BSA / 1.73) = {egfr:.1f} {unit}"
-
-            )
-            else: equation += ( f"eGFR = {egfr:.1f} {unit}")
-            self.eGFR_ui.result.config(text=f"eGFR: {egfr:.1f} {unit}", bootstyle=color)
-            self.eGFR_ui.interpret_text.config(text=f"{stage} => {msg}", bootstyle=color)
-            self.eGFR_ui.equation_text.config(text=f"{equation}")
-
+            result = calc(*args, **kwargs)
         except ValueError as e:
+            if self._live:
+                # half-typed input: show why there is no result instead of a dialog per keystroke
+                self._set_label(ui.result, "Result", "success")
+                self._set_label(ui.interpret_text, str(e), "secondary")
+                self._set_label(ui.equation_text, "Awaiting calculation...")
+                return None
             Messagebox.show_error("Invalid input", str(e))
+            return None
+        self.render(ui, result)
+        return result
+
+    def render(self, ui, result):
+        interpretation = result.interpretation_text()
+        if self._live:
+            interpretation = "\n".join([interpretation, *result.warnings])
+        else:
+            for warning in result.warnings:
+                Messagebox.show_warning(warning)
+        self._set_label(ui.result, result.text(), result.severity)
+        self._set_label(ui.interpret_text, interpretation, result.severity)
+        self._set_label(ui.equation_text, result.equation)
 
-    def calculate_pediatric_egfr(self):
-        try:
-            creat_val = self.eGFR_ped_ui.creatinine_var.get()
-            age = float(self.eGFR_ped_ui.age_var.get())
-            height = float(self.eGFR_ped_ui.height_var.get())
-            gender = self.eGFR_ped_ui.patient_gender.get()
-
-            creat_unit = "µmol/L"
-            try:
-                # try to find attribute creatinine_field on eGFR_ped_ui (we saved in UI for many entries)
-                creat_field = getattr(self.eGFR_ped_ui, "creatinine_field", None)
-                if creat_field and getattr(creat_field, "unit_var", None):
-                    creat_unit = creat_field.unit_var.get()
-            except Exception:
-                pass
-
-            #egfr = formulas.egfr_schwartz(height_cm=height, creat_value=creat_val, creat_unit=creat_unit)
-            egfr = formulas.calc_pediatric_egfr(height=height, age_var=age, sex=gender.lower(), creat_value=creat_val, creat_unit=creat_unit)
-
-            # interpretation (age-sensitive)
-            if egfr >= 90:
-                stage, msg, color = "Normal", "Kidney function is normal for age.", "success"
-            elif egfr >= 60:
-                if age < 2:
-                    stage, msg, color = "Likely Normal (Infant Range)", "Slightly lower GFR may be normal under age 2.", "info"
-                else:
-                    stage, msg, color = "Mildly Decreased", "Slightly reduced kidney function; monitor if persistent.", "info"
-            elif egfr >= 45:
-                stage, msg, color = "Mild–Moderate Decrease", "Possible CKD Stage 3a; evaluate underlying causes.", "warning"
-            elif egfr >= 30:
-                stage, msg, color = "Moderate–Severe Decrease", "CKD Stage 3b; nephrology assessment recommended.", "warning"
-            elif egfr >= 15:
-                stage, msg, color = "Severe Decrease", "Advanced CKD (Stage 4); close monitoring required.", "danger"
-            else:
-                stage, msg, color = "Kidney Failure", "End-stage kidney disease (Stage 5); dialysis likely indicated.", "danger"
-
-            if creat_unit.lower() in ("umol/L", "umol", "µmol/l", "µmol/L"): scr_mgdl = formulas.creat_umoll_to_mgdl(float(creat_val))
-            else: scr_mgdl = float(creat_val)
-            equation = (
-                "\n\nEquation Used\n NB: creatinine is first converted to mg/dL and height to cm\n"
-                f" if age is < 1 then k = 0.45,\n"
-                f" if age is >=1 but < 13 then k = 0.55,\n"
-                f" if age >= 13 and sex is male then k = 0.70\n"
-                f" if age >= 13 and sex is female then k = 0.55\n"
-                f"eGFR = k × Height[{height}] / Creatinine[{scr_mgdl:.2f}]\n"
-                f"eGFR = {egfr:.1f} mL/min/1.73m²"
-            )
-            self.eGFR_ped_ui.result.config(text=f"eGFR: {egfr:.1f} mL/min/1.73m²", bootstyle=color)
-            self.eGFR_ped_ui.interpret_text.config(text=f"{stage}\n{msg}", bootstyle=color)
-            self.eGFR_ped_ui.equation_text.config(text=f"{equation}")
+    def calculate_egfr(self):
+        ui = self.eGFR_ui
+        return self._run(ui, self.engine.egfr,
+                         ui.creatinine_var.get(), self._unit(ui, "creatinine_field", "µmol/L"),
+                         ui.age_var.get(), ui.patient_gender.get(),
+                         adjust_to_bsa=ui.adjust_bsa_var.get(),
+                         weight=ui.weight_var.get(), weight_unit=self._unit(ui, "weight_field", "kg"),
+                         height=ui.height_var.get(), height_unit=self._unit(ui, "height_field", "cm"))
 
-        except ValueError as e:
-            Messagebox.show_error("Invalid input", str(e))
+    def calculate_pediatric_egfr(self):
+        ui = self.eGFR_ped_ui
+        return self._run(ui, self.engine.pediatric_egfr,
+                         ui.creatinine_var.get(), self._unit(ui, "creatinine_field", "µmol/L"),
+                         ui.age_var.get(), ui.patient_gender.get(),
+                         ui.height_var.get(), self._unit(ui, "height_field", "cm"))
 
     def calculate_urine_acr(self):
-        try:
-            # read albumin & creatinine and their units from fields (we saved albumin_field and creatinine_field on UI)
-            alb_val = self.uacr_ui.albumin_var.get()
-            alb_unit = getattr(self.uacr_ui, "albumin_field").unit_var.get() if getattr(self.uacr_ui, "albumin_field", None) else "mg/L"
-            cr_val = self.uacr_ui.creatinine_var.get()
-            cr_unit = getattr(self.uacr_ui, "creatinine_field").unit_var.get() if getattr(self.uacr_ui, "creatinine_field", None) else "mg/dL"
-
-            acr = formulas.calc_uacr(alb_val, alb_unit, cr_val, cr_unit)
-            # interpretation
-            if acr < 30:
-                category, color, message = "Normal", "success", "Normal albumin excretion."
-            elif acr <= 300:
-                category, color, message = "Microalbuminuria", "warning", "Early sign of kidney damage (moderately increased)."
-            else:
-                category, color, message = "Macroalbuminuria", "danger", "Severe kidney damage (overt nephropathy)."
-
-            if alb_unit.lower() in ("mg/l", "mg/L"): alb_mgdl = formulas.mgl_to_mgdl(float(alb_val))
-            else: alb_mgdl = float(alb_val)
-            if cr_unit.lower() in ("umol/l", "umol", "µmol/l", "µmol/L"): creat_mgdl = formulas.creat_umoll_to_mgdl(float(cr_val))
-            else: creat_mgdl = float(cr_val)
-            equation = (
-                "\nEquation Used:\n NB: Creatinine and Albumin values\n are first converted to mg/dL\n"
-                f"UACR = (Albumin[{alb_mgdl:.2f}] / Creatinine[{creat_mgdl:.2f} ])x1000\n"
-                f"UACR = {acr:.2f} mg/g"
-            )
-            self.uacr_ui.result.config(text=f"UACR: {acr:.2f} mg/g", bootstyle=color)
-            self.uacr_ui.interpret_text.config(text=f"{category}\n{message}", bootstyle=color)
-            self.uacr_ui.equation_text.config(text=f"{equation}")
-        except ValueError as e:
-            Messagebox.show_error("Invalid input", str(e))
+        ui = self.uacr_ui
+        return self._run(ui, self.engine.uacr,
+                         ui.albumin_var.get(), self._unit(ui, "albumin_field", "mg/L"),
+                         ui.creatinine_var.get(), self._unit(ui, "creatinine_field", "mg/dL"))
 
     def calculate_urine_osmolality(self):
-        try:
-            na = self.uosm_ui.sodium_var.get()
-            k = self.uosm_ui.potassium_var.get()
-            # urea & glucose read along with unit selections (we stored fields)
-            urea_val = self.uosm_ui.urea_var.get()
-            urea_unit = getattr(self.uosm_ui, "urea_field").unit_var.get() if getattr(self.uosm_ui, "urea_field", None) else "mmol/L"
-            glucose_val = self.uosm_ui.glucose_var.get()
-            glucose_unit = getattr(self.uosm_ui, "glucose_field").unit_var.get() if getattr(self.uosm_ui, "glucose_field", None) else "mmol/L"
-
-            uosm = formulas.calc_urine_osm(na=float(na), k=float(k), urea_value=urea_val, urea_unit=urea_unit, glucose_value=glucose_val, glucose_unit=glucose_unit)
-            # interpretation
-            if uosm < 100:
-                category = "Very Dilute Urine"
-                color = "info"
-                msg = "Possible diabetes insipidus or water intoxication."
-            elif uosm <= 600:
-                category = "Normal Range"
-                color = "success"
-                msg = "Typical urine concentration (normal hydration)."
-            elif uosm <= 800:
-                category = "Concentrated Urine"
-                color = "warning"
-                msg = "Suggests dehydration or increased ADH activity."
-            else:
-                category = "Highly Concentrated / Glycosuria"
-                color = "danger"
-                msg = "Strongly concentrated urine or solute load (e.g. high glucose)."
-
-            if glucose_unit.lower() in ("mmol/l", "mmol"): glucose_mgdl = formulas.glucose_mmol_to_mgdl(float(glucose_val))
-            else: glucose_mgdl = float(glucose_val)
-            if urea_unit.lower() in ("mmol/l", "mmol"): urea_mgdl = formulas.urea_mmol_to_mgdl(float(urea_val))
-            else:  urea_mgdl = float(urea_val)
-            equation = (
-                "\n\nEquation Used:\n NB: Glucose and Urea values are first converted to mg/dL\n"
-                f"Uosm = 2(Na[{na}] + K[{k}]) + (Urea[{urea_mgdl}] / 5.6)\n"
-                f"     + (Glucose[{glucose_mgdl}] / 18)\n"
-                f"Uosm = {uosm:.1f} mOsm/kg"
-            )
-            self.uosm_ui.result.config(text=f"Uosm: {uosm:.1f} mOsm/kg", bootstyle=color)
-            self.uosm_ui.interpret_text.config(text=f"{category}\n{msg}", bootstyle=color)
-            self.uosm_ui.equation_text.config(text=f"{equation}")
-        except ValueError as e:
-            Messagebox.show_error("Invalid input", str(e))
+        ui = self.uosm_ui
+        return self._run(ui, self.engine.urine_osm,
+                         ui.sodium_var.get(), ui.potassium_var.get(),
+                         ui.urea_var.get(), self._unit(ui, "urea_field", "mmol/L"),
+                         ui.glucose_var.get(), self._unit(ui, "glucose_field", "mmol/L"))
 
     def calculate_serum_osmolarity(self):
-        try:
-            na = float(self.sosm_ui.sodium_var.get())
-            k = float(self.sosm_ui.potassium_var.get())
-            glucose_val = self.sosm_ui.glucose_var.get()
-            glucose_unit = getattr(self.sosm_ui, "glucose_field").unit_var.get() if getattr(self.sosm_ui, "glucose_field", None) else "mmol/L"
-            urea_val = self.sosm_ui.urea_var.get()
-            urea_unit = getattr(self.sosm_ui, "urea_field").unit_var.get() if getattr(self.sosm_ui, "urea_field", None) else "mmol/L"
-
-            osm = formulas.calc_serum_osm(na=na, k=k, glucose_value=glucose_val, glucose_unit=glucose_unit, urea_value=urea_val, urea_unit=urea_unit)
-            # interpretation
-            if osm < 275:
-                interpretation = "Low Osmolarity (Hypoosmolar)"
-                color = "info"
-            elif osm <= 295:
-                interpretation = "Normal Osmolarity"
-                color = "success"
-            else:
-                interpretation = "High Osmolarity (Hyperosmolar)"
-                color = "danger"
-            
-            if glucose_unit.lower() in ("mmol/l", "mmol"): glucose_mgdl = formulas.glucose_mmol_to_mgdl(float(glucose_val))
-            else: glucose_mgdl = float(glucose_val)
-            if urea_unit.lower() in ("mmol/l", "mmol"): urea_mgdl = formulas.urea_mmol_to_mgdl(float(urea_val))
-            else:  urea_mgdl = float(urea_val)
-            equation = (
-                "\n\nEquation Used:\n NB: Glucose and Urea values are first converted to mg/dL\n"
-                f"Serum Osm = 2(Na[{na}] + K[{k}] + (Glucose[{glucose_mgdl}] / 18)\n" 
-                f"             + (Urea[{urea_mgdl}] / 5.6)\n"
-                f"Serum Osm = {osm:.2f} mOsm/kg"
-            )
-            self.sosm_ui.result.config(text=f"{osm:.2f} mOsm/kg", bootstyle=color)
-            self.sosm_ui.interpret_text.config(text=f"{interpretation}", bootstyle=color)
-            self.sosm_ui.equation_text.config(text=f"{equation}")
-
-        except ValueError as e:
-            Messagebox.show_error("Invalid input", str(e))
+        ui = self.sosm_ui
+        return self._run(ui, self.engine.serum_osm,
+                         ui.sodium_var.get(), ui.potassium_var.get(),
+                         ui.glucose_var.get(), self._unit(ui, "glucose_field", "mmol/L"),
+                         ui.urea_var.get(), self._unit(ui, "urea_field", "mmol/L"))
 
     def calculate_ldl(self):
-        try:
-            tc_val = self.ldl_ui.tc_var.get()
-            tg_val = self.ldl_ui.tg_var.get()
-            hdl_val = self.ldl_ui.hdl_var.get()
-            non_hdl_val = formulas._to_float(tc_val)-formulas._to_float(hdl_val)
-
-            tc_unit = getattr(self.ldl_ui, "tc_field").unit_var.get() if getattr(self.ldl_ui, "tc_field", None) else "mmol/L"
-            tg_unit = getattr(self.ldl_ui, "tg_field").unit_var.get() if getattr(self.ldl_ui, "tg_field", None) else "mmol/L"
-            hdl_unit = getattr(self.ldl_ui, "hdl_field").unit_var.get() if getattr(self.ldl_ui, "hdl_field", None) else "mmol/L"
-
-            # read units; if field has unit_var, convert mg/dL accordingly. For simplicity here we assume mg/dL input default
-            ldl = formulas.calc_ldl_sampson(tc_val, tc_unit, tg_val, tg_unit, hdl_val, hdl_unit)
-
-            # Interpretation
-            if ldl < 100:
-                category = "Optimal"; color = "success"; msg = "Low risk of ASCVD."
-            elif ldl < 130:
-                category = "Near Optimal"; color = "info"; msg = "Acceptable for most individuals."
-            elif ldl < 160:
-                category = "Borderline High"; color = "warning"; msg = "Lifestyle modification recommended."
-            elif ldl < 190:
-                category = "High"; color = "danger"; msg = "Consider medication if persistent."
-            else:
-                category = "Very High"; color = "danger"; msg = "Aggressive lipid-lowering therapy advised."
-
-            tc_mg = formulas.lipid_to_mgdl(float(tc_val), tc_unit, "TC")
-            tg_mg = formulas.lipid_to_mgdl(float(tg_val), tg_unit, "TG")
-            hdl_mg = formulas.lipid_to_mgdl(float(hdl_val), hdl_unit, "HDL")
-            non_hdl_mg = formulas.lipid_to_mgdl(float(non_hdl_val), hdl_unit, "HDL")
-            equation = (
-                "\n\nEquation Used: Sampson Formula\n Values are first converted to mg/dL \n"
-                f"non_hdl = TC[{tc_mg:.2f}] + HDL[{hdl_mg:.2f}] = {non_hdl_mg:.2f}\n"
-                f"LDL = (TC[{tc_mg:.2f}]/0.948) - (HDL[{hdl_mg:.2f}]/0.971) - [(TG[{tg_mg:.2f}]/8.56)\n"
-                f"      + (TG[{tg_mg:.2f}] × non_hdl[{non_hdl_mg:.2f}] / 2140.)\n"
-                f"      - (TG[{tg_mg:.2f}]² / 16,100)]-9.44\n"
-                f"LDL = {ldl:.2f}{hdl_unit}"
-            )
-            self.ldl_ui.result.config(text=f"LDL: {ldl:.2f}{hdl_unit}", bootstyle=color)
-            self.ldl_ui.interpret_text.config(text=f"{category}\n{msg}", bootstyle=color)
-            self.ldl_ui.equation_text.config(text=f"{equation}")
-        except ValueError as e:
-            Messagebox.show_error("Invalid input", str(e))
+        ui = self.ldl_ui
+        return self._run(ui, self.engine.ldl,
+                         ui.tc_var.get(), self._unit(ui, "tc_field", "mmol/L"),
+                         ui.tg_var.get(), self._unit(ui, "tg_field", "mmol/L"),
+                         ui.hdl_var.get(), self._unit(ui, "hdl_field", "mmol/L"))
 
     def calculate_hdl_from_sampson(self):
+        ui = self.hdl_ui
+        return self._run(ui, self.engine.hdl,
+                         ui.tc_var.get(), self._unit(ui, "tc_field", "mmol/L"),
+                         ui.tg_var.get(), self._unit(ui, "tg_field", "mmol/L"),
+                         ui.ldl_var.get(), self._unit(ui, "ldl_field", "mmol/L"))
+
+    # ---------- batch import ----------
+    # The job runs on a worker thread (batch_job.py); _poll_batch drains its messages
+    # from the Tk event loop every batch_job.POLL_MS, so the window stays responsive
+    # however large the file is.
+    def _batch_units(self, text):
+        units = {}
+        for item in text.replace(";", ",").split(","):
+            if not item.strip():
+                continue
+            name, sep, unit = item.partition("=")
+            if not sep:
+                raise ValueError(f"Units expects NAME=UNIT, got '{item.strip()}'")
+            units[name.strip()] = unit.strip()
+        return units
+
+    def start_batch(self):
+        import batch_job
+        ui = self.batch_ui
+        if self.batch_job is not None and self.batch_job.running:
+            return None
+        path = ui.file_var.get().strip()
+        calc_names = ui.selected_calculators()
         try:
-            tc = self.hdl_ui.tc_var.get()
-            tg = self.hdl_ui.tg_var.get()
-            ldl = self.hdl_ui.ldl_var.get()
-
-
-            tc_unit = getattr(self.hdl_ui, "tc_field").unit_var.get() if getattr(self.hdl_ui, "tc_field", None) else "mmol/L"
-            tg_unit = getattr(self.hdl_ui, "tg_field").unit_var.get() if getattr(self.hdl_ui, "tg_field", None) else "mmol/L"
-            ldl_unit = getattr(self.hdl_ui, "ldl_field").unit_var.get() if getattr(self.hdl_ui, "ldl_field", None) else "mmol/L"
-
-
-            hdl = formulas.calc_hdl_from_sampson(tc_val=tc, tc_unit=tc_unit, tg_val=tg, tg_unit=tg_unit, ldl_val=ldl, ldl_unit=ldl_unit)
-            # clamp unrealistic
-            if hdl < 0:
-                Messagebox.show_warning("Estimated HDL negative — value likely invalid. Direct measurement recommended.")
-            # Interpretation
-            if hdl < 40:
-                category = "Low HDL (High Risk)"; color = "danger"; msg = "Low protective cholesterol — higher heart disease risk."
-            elif hdl < 60:
-                category = "Borderline HDL"; color = "warning"; msg = "Average protection."
-            else:
-                category = "Optimal HDL (Protective)"; color = "success"; msg = "Good HDL level."
-
-            tc_mg = formulas.lipid_to_mgdl(float(tc), tc_unit, "TC")
-            tg_mg = formulas.lipid_to_mgdl(float(tg), tg_unit, "TG")
-            ldl_mg = formulas.lipid_to_mgdl(float(ldl), ldl_unit, "LDL")
-            equation = (
-                "\n\nEquation Used: Reverse Sampson Formula\n Values are first converted to mg/dL \n"
-                f" numerator = (LDL[{ldl_mg:.2f}] - (TC[{tc_mg:.2f}] / 0.948) + (TG[{tg_mg:.2f}] / 8.56)\n" 
-                f"             + (TG[{tg_mg:.2f}] x TG[{tg_mg:.2f}] / 2140)\n" 
-                f"             - (TG[{tg_mg:.2f}]^2 / 16100) + 9.44)\n"
-                f" denominator = (TG[{tg_mg:.2f}] / 2140) - (1 / 0.971)\n\n"
-                f" HDL = numerator / denominator = {hdl:.1f}{ldl_unit}"
-            )
-            self.hdl_ui.result.config(text=f"HDL: {hdl:.1f}{ldl_unit}", bootstyle=color)
-            self.hdl_ui.interpret_text.config(text=f"{category}\n{msg}", bootstyle=color)
-            self.hdl_ui.equation_text.config(text=f"{equation}")
+            if not path:
+                raise ValueError("Choose a CSV file first.")
+            if not calc_names:
+                raise ValueError("Select at least one calculator.")
+            units = self._batch_units(ui.units_var.get())
         except ValueError as e:
             Messagebox.show_error("Invalid input", str(e))
-
-
-if __name__ == "__main__":
-    root = Tk()
+            return None
+
+        job = batch_job.BatchJob(path, os.path.splitext(path)[0] + "_results.csv", calc_names, units=units)
+        self.batch_job = job
+        ui.set_columns(job.columns)
+        ui.progress.configure(value=0, maximum=1)
+        ui.status_text.config(text="Counting rows...", bootstyle="secondary")
+        ui.startBatchBtn.config(state="disabled")
+        ui.cancelBatchBtn.config(state="normal", command=self.cancel_batch)
+        job.start()
+        self.root.after(batch_job.POLL_MS, self._poll_batch, job)
+        return job
+
+    def cancel_batch(self):
+        if self.batch_job is not None and self.batch_job.running:
+            self.batch_job.cancel()
+            self.batch_ui.cancelBatchBtn.config(state="disabled")
+            self.batch_ui.status_text.config(text="Cancelling...", bootstyle="warning")
+
+    def _poll_batch(self, job):
+        import batch_job
+        ui = self.batch_ui
+        finished = None
+        rows = None
+        for kind, *data in job.poll():
+            if kind == "total":
+                ui.progress.configure(maximum=max(data[0], 1))
+            elif kind == "progress":
+                rows, preview = data
+                for row in preview:
+                    ui.preview.insert("", "end", values=row)
+            else:
+                finished = (kind, data[0])
+        # one progress update per poll, however many chunks finished since the last one
+        if rows is not None:
+            ui.progress.configure(value=rows)
+            if not job.cancelled:
+                ui.status_text.config(text=f"{rows:,} of {int(ui.progress.cget('maximum')):,} rows", bootstyle="info")
+        if finished is None:
+            self.root.after(batch_job.POLL_MS, self._poll_batch, job)
+            return
+
+        kind, data = finished
+        ui.startBatchBtn.config(state="normal")
+        ui.cancelBatchBtn.config(state="disabled")
+        if kind == "error":
+            ui.status_text.config(text="Batch import failed", bootstyle="danger")
+            Messagebox.show_error("Batch import failed", data)
+        elif kind == "cancelled":
+            ui.status_text.config(text=f"Cancelled after {data:,} rows, kept in {job.outfile}", bootstyle="warning")
+        else:
+            ui.progress.configure(value=ui.progress.cget("maximum"))
+            ui.status_text.config(text=f"{data:,} rows written to {job.outfile}", bootstyle="success")
+        if job.errors:
+            Messagebox.show_warning(f"{len(job.errors)} chunk(s) failed and were left blank.")
+
+
+def report_startup(root, page, budget_ms=None):
+    """
+    Prints time-to-first-frame (from the start of this module's import until the main
+    menu has been mapped and drawn) to stderr and closes the window. With budget_ms the
+    process exit status is 1 when the budget is exceeded.
+    """
+    def _mapped(event):
+        page.unbind("<Map>")
+        root.after_idle(_report)
+
+    def _report():
+        elapsed_ms = (time.perf_counter() - _T0) * 1000.0
+        over = budget_ms is not None and elapsed_ms > budget_ms
+        budget = f" (budget {budget_ms:g} ms{', EXCEEDED' if over else ''})" if budget_ms is not None else ""
+        print(f"time to first frame: {elapsed_ms:.1f} ms{budget}", file=sys.stderr)
+        root.status = 1 if over else 0
+        root.destroy()
+
+    page.bind("<Map>", _mapped)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ChemCalc clinical chemistry calculator")
+    parser.add_argument("--startup-timing", action="store_true",
+                        help="report time to first frame on stderr and exit")
+    parser.add_argument("--startup-budget", type=float, metavar="MS",
+                        help="with --startup-timing, exit with status 1 if the first frame takes longer than MS")
+    parser.add_argument("--cache", action="store_true",
+                        help="memoise calculations (see cache.py)")
+    parser.add_argument("--live", action="store_true",
+                        help="start in live mode: results update as you type")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="instrument the calculators and serve Prometheus metrics on localhost:PORT/metrics")
+    parser.add_argument("--metrics-file", metavar="PATH",
+                        help="instrument the calculators and write Prometheus metrics to PATH on exit")
+    args = parser.parse_args(argv)
+
+    if args.metrics_port or args.metrics_file:
+        import metrics
+        metrics.enable()
+        metrics.instrument_methods(ChemCalc, [handler for _, _, _, handler in ChemCalc.PAGES.values()])
+        if args.metrics_port:
+            metrics.start_http_server(args.metrics_port)
+
+    calc_engine = engine
+    if args.cache:
+        import cache
+        calc_engine = cache.CachedEngine()
+
+    load_gui()
+    if args.metrics_port or args.metrics_file:
+        # keypad open latency; the first open of a root builds the window, later ones re-show it
+        UserInterface.NumpadPopup.open_hook = lambda seconds, reused: metrics.REGISTRY.observe(
+            "NumpadPopup.show" if reused else "NumpadPopup.first_show", seconds)
+    root = tk.Tk()
     root.title("ChemCalc by Sct Clinton Ohagwam v 2.1")
     root.geometry("720x840")
-    app = ChemCalc(root)
+    app = ChemCalc(root, calc_engine, live=args.live)
+    if args.metrics_port or args.metrics_file:
+        app.pages.on_navigate = lambda name, seconds: metrics.REGISTRY.observe(f"navigate.{name}", seconds)
+    if args.startup_timing:
+        report_startup(root, app.page1, args.startup_budget)
     root.mainloop()
+    if args.metrics_file:
+        metrics.write_textfile(args.metrics_file)
+    return getattr(root, "status", 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,68 @@
 # UserInterface.py  (updated)
+import time
 from tkinter import *
 import ttkbootstrap as tb
 from ttkbootstrap.constants import *
 # keep Messagebox usage from ttkbootstrap dialogs in main script
 
 class NumpadPopup:
+    """
+    On-screen keypad typing into an entry. One keypad per root window is built on first
+    use (NumpadPopup.pooled) and then hidden and re-targeted rather than destroyed, so
+    opening it again only moves and shows an existing window.
+    """
     WIDTH = 260
     HEIGHT = 180
+    # if set, called as open_hook(seconds, reused) each time a keypad is shown
+    open_hook = None
 
-    def __init__(self, parent, target_entry, on_close_callback=None):
+    def __init__(self, parent, target_entry=None, on_close_callback=None):
         self.parent = parent
-        self.target_entry = target_entry
-        self.on_close_callback = on_close_callback
+        self.target_entry = None
+        self.on_close_callback = None
+        self.shown = False
+        self.opened = 0
 
         self.top = tb.Toplevel(parent)
+        self.top.withdraw()
         self.top.title("Numpad")
         self.top.resizable(False, False)
         self.top.attributes("-topmost", True)
         self.top.transient(parent)
         self.top.configure(padx=10, pady=10)
 
-        self.top.focus_force()
         self.top.bind("<FocusOut>", self._on_focus_out)
 
         self.create_numpad()
-        self.position_popup_near_entry()
         self.top.protocol("WM_DELETE_WINDOW", self.close_popup)
+        if target_entry is not None:
+            self.show(target_entry, on_close_callback)
+
+    @classmethod
+    def pooled(cls, root):
+        """The keypad of `root`, built the first time it is asked for."""
+        popup = getattr(root, "numpad_popup", None)
+        if popup is None or not popup.top.winfo_exists():
+            popup = root.numpad_popup = cls(root)
+        return popup
+
+    def show(self, target_entry, on_close_callback=None):
+        """Shows the keypad under `target_entry` and types into it from now on."""
+        start = time.perf_counter()
+        self.target_entry = target_entry
+        self.on_close_callback = on_close_callback
+        self.position_popup_near_entry()
+        if not self.shown:
+            self.top.deiconify()
+            self.shown = True
+        self.top.lift()
+        self.top.focus_force()
+        if NumpadPopup.open_hook is not None:
+            self.top.update_idletasks()
+            NumpadPopup.open_hook(time.perf_counter() - start, self.opened > 0)
+        self.opened += 1
 
     def position_popup_near_entry(self):
-        self.parent.update_idletasks()
         self.target_entry.update_idletasks()
 
         entry_x = self.target_entry.winfo_rootx()
@@ -69,6 +103,8 @@ class NumpadPopup:
             ).grid(row=row, column=col, padx=4, pady=4)
 
     def on_button_click(self, char):
+        if self.target_entry is None:
+            return
         if char == '⌫':
             current = self.target_entry.get()
             if current:
@@ -83,13 +119,19 @@ class NumpadPopup:
             self.close_popup()
 
     def close_popup(self):
-        if self.on_close_callback:
+        """Hides the keypad; it is kept for the next entry."""
+        if not self.shown:
+            return
+        self.shown = False
+        callback, self.on_close_callback = self.on_close_callback, None
+        self.target_entry = None
+        if callback:
             try:
-                self.on_close_callback()
+                callback()
             except Exception:
                 pass
         try:
-            self.top.destroy()
+            self.top.withdraw()
         except Exception:
             pass
 
@@ -121,6 +163,7 @@ class CreateEntryField:
                          font=("Helvetica", 14), foreground="green", width=16)
         entry.pack(side="left", padx=(8,8))
         entry.field_name = self.label_text
+        self.entry = entry
 
         # unit radios
         if self.units:
@@ -136,25 +179,14 @@ class CreateEntryField:
 
     def open_numpad(self, entry):
         root = self.parent.winfo_toplevel()
-        existing = getattr(root, "current_popup", None)
-        if existing:
-            try:
-                existing.close_popup()
-            except Exception:
-                pass
-            root.current_popup = None
 
         def _on_close():
-            try:
-                root.current_popup = None
-            except Exception:
-                pass
             try:
                 root.focus_force()
             except Exception:
                 pass
 
-        root.current_popup = NumpadPopup(root, entry, on_close_callback=_on_close)
+        NumpadPopup.pooled(root).show(entry, on_close_callback=_on_close)
 
 
 class main_menu:
@@ -186,6 +218,7 @@ class main_menu:
         self.sOsmBtn = tb.Button(grid_frame, text="Serum Osmolarity", **btn_opts)
         self.LDLBtn = tb.Button(grid_frame, text="LDL", **btn_opts)
         self.HDLBtn = tb.Button(grid_frame, text="HDL", **btn_opts)
+        self.batchBtn = tb.Button(grid_frame, text="Batch import", **btn_opts)
 
         # Place buttons (2 × 4 grid)
         self.eGFRBtn.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
@@ -197,7 +230,8 @@ class main_menu:
         self.sOsmBtn.grid(row=2, column=0, padx=10, pady=10, sticky="nsew")
         self.LDLBtn.grid(row=2, column=1, padx=10, pady=10, sticky="nsew")
 
-        self.HDLBtn.grid(row=3, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+        self.HDLBtn.grid(row=3, column=0, padx=10, pady=10, sticky="nsew")
+        self.batchBtn.grid(row=3, column=1, padx=10, pady=10, sticky="nsew")
 
 
 class eGFR_menu :
@@ -225,7 +259,7 @@ class eGFR_menu :
         self.weight_var = StringVar(value="")
 
         # creatinine: default SI µmol/L, alt mg/dL
-        CreateEntryField(frame_1, "Creatinine", self.creatinine_var, units=["µmol/L","mg/dL"], default_unit="µmol/L")
+        self.creatinine_field = CreateEntryField(frame_1, "Creatinine", self.creatinine_var, units=["µmol/L","mg/dL"], default_unit="µmol/L")
         CreateEntryField(frame_1, "Age (years)", self.age_var, units=None)
 
         # Normalize to BSA
@@ -236,8 +270,8 @@ class eGFR_menu :
         self.adjust_bsa_chk.pack(pady=5)
 
         self.BSA_frame = tb.Frame(frame_1)
-        CreateEntryField(self.BSA_frame, "Height", self.height_var, units=["cm","m"], default_unit="cm")
-        CreateEntryField(self.BSA_frame, "Weight", self.weight_var, units=["kg","lb"], default_unit="kg")
+        self.height_field = CreateEntryField(self.BSA_frame, "Height", self.height_var, units=["cm","m"], default_unit="cm")
+        self.weight_field = CreateEntryField(self.BSA_frame, "Weight", self.weight_var, units=["kg","lb"], default_unit="kg")
 
         self.calcEGFRBtn = tb.Button(page, text="Calculate", bootstyle="success")
         self.calcEGFRBtn.pack(pady=6)
@@ -276,9 +310,9 @@ class eGFR_ped_menu :
         self.height_var = StringVar(value="")
         self.age_var = StringVar(value="")
 
-        CreateEntryField(frame_1, "Creatinine", self.creatinine_var, units=["µmol/L","mg/dL"], default_unit="µmol/L")
+        self.creatinine_field = CreateEntryField(frame_1, "Creatinine", self.creatinine_var, units=["µmol/L","mg/dL"], default_unit="µmol/L")
         CreateEntryField(frame_1, "Age (years)", self.age_var, units=None)
-        CreateEntryField(frame_1, "Height (cm)", self.height_var, units=["cm","m"], default_unit="cm")
+        self.height_field = CreateEntryField(frame_1, "Height (cm)", self.height_var, units=["cm","m"], default_unit="cm")
 
         self.calcPedGFRBtn = tb.Button(page, text="Calculate", bootstyle="success")
         self.calcPedGFRBtn.pack(pady=6)
@@ -415,3 +449,74 @@ class hdl_menu :
         self.interpret_text.pack(pady=3)
         self.equation_text = tb.Label(page,text="Awaiting calculation...", font=("Helvetica", 14),bootstyle="default")
         self.equation_text.pack(pady=5)
+
+class batch_menu :
+    # pipeline calculators offered on the page: (name, label)
+    CALCULATORS = [("egfr", "eGFR"), ("crcl", "CrCl"), ("egfr_ped", "eGFR pediatric"), ("uacr", "UACR"),
+                   ("sosm", "Serum Osm"), ("uosm", "Urine Osm"), ("ldl", "LDL"), ("hdl", "HDL"),
+                   ("bmi", "BMI"), ("bsa", "BSA")]
+
+    def __init__(self, page):
+        self.page = page
+        self.title = tb.Label(page, text="Batch import", font=("Helvetica", 28), bootstyle="default")
+        self.title.pack(pady=5)
+        self.discription = tb.Label(page, text="Calculate a CSV file of pending results", font=("Helvetica", 14), bootstyle="default")
+        self.discription.pack(pady=5)
+        frame_1 = tb.Frame(page, bootstyle="primary", padding='6 6 6 6')
+        frame_1.pack(pady=20, fill="x")
+
+        # input file; the results are written next to it as <name>_results.csv
+        file_frame = tb.Frame(frame_1)
+        file_frame.pack(pady=5, anchor="w", fill="x")
+        self.file_var = StringVar(value="")
+        tb.Label(file_frame, text="CSV file:", font=("Arial", 12)).pack(side="left")
+        tb.Entry(file_frame, textvariable=self.file_var, font=("Helvetica", 12), width=30).pack(side="left", padx=(8,8))
+        self.browseBtn = tb.Button(file_frame, text="Browse", bootstyle="info", command=self.browse)
+        self.browseBtn.pack(side="left")
+
+        calc_frame = tb.Frame(frame_1)
+        calc_frame.pack(pady=5, anchor="w")
+        self.calc_vars = {}
+        for i, (name, label) in enumerate(self.CALCULATORS):
+            self.calc_vars[name] = BooleanVar(value=name == "egfr")
+            tb.Checkbutton(calc_frame, text=label, variable=self.calc_vars[name],
+                           bootstyle="success").grid(row=i // 5, column=i % 5, padx=6, pady=4, sticky="w")
+
+        # units of the file's columns, e.g. "creat_unit=mg/dL, tc_unit=mmol/L"
+        unit_frame = tb.Frame(frame_1)
+        unit_frame.pack(pady=5, anchor="w", fill="x")
+        self.units_var = StringVar(value="creat_unit=µmol/L")
+        tb.Label(unit_frame, text="Units:", font=("Arial", 12)).pack(side="left")
+        tb.Entry(unit_frame, textvariable=self.units_var, font=("Helvetica", 12), width=36).pack(side="left", padx=(8,8))
+
+        button_frame = tb.Frame(page)
+        button_frame.pack(pady=6)
+        self.startBatchBtn = tb.Button(button_frame, text="Start", bootstyle="success")
+        self.startBatchBtn.pack(side="left", padx=6)
+        self.cancelBatchBtn = tb.Button(button_frame, text="Cancel", bootstyle="danger", state="disabled")
+        self.cancelBatchBtn.pack(side="left", padx=6)
+
+        self.progress = tb.Progressbar(page, bootstyle="success-striped", length=500, maximum=1)
+        self.progress.pack(pady=6)
+        self.status_text = tb.Label(page, text="Awaiting file...", font=("Helvetica", 14), bootstyle="secondary")
+        self.status_text.pack(pady=3)
+
+        # first rows of the results, filled in while the job runs
+        self.preview = tb.Treeview(page, show="headings", height=10, bootstyle="success")
+        self.preview.pack(pady=5, padx=10, fill="both", expand=True)
+
+    def browse(self):
+        from tkinter import filedialog
+        path = filedialog.askopenfilename(parent=self.page, filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if path:
+            self.file_var.set(path)
+
+    def selected_calculators(self):
+        return [name for name, _ in self.CALCULATORS if self.calc_vars[name].get()]
+
+    def set_columns(self, columns):
+        self.preview.delete(*self.preview.get_children())
+        self.preview.configure(columns=columns)
+        for column in columns:
+            self.preview.heading(column, text=column)
+            self.preview.column(column, width=110, anchor="center")
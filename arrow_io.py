@@ -0,0 +1,185 @@
+# arrow_io.py
+# Apache Arrow input and output for the batch formulas (needs pyarrow).
+# Numeric Arrow columns are handed to formulas_batch as NumPy views of their buffers
+# (no copy when the column is float64 without nulls) and results go back as Arrow
+# arrays that wrap the NumPy result buffer. Nulls follow formulas._to_float: a null or
+# empty input makes that row's result null, like the ValueError of the scalar formula.
+#
+#   import arrow_io
+#   ldl = arrow_io.call("calc_ldl_sampson", tc=batch["TC"], tc_unit="mmol/L", tg=batch["TG"],
+#                       tg_unit="mmol/L", hdl=batch["HDL"], hdl_unit="mmol/L")
+#   out = arrow_io.compute_batch(batch, ["egfr", "ldl"], units={"creat_unit": "mg/dL"})
+#
+# IPC stream mode (same options as pipeline.py):
+#   python arrow_io.py --calc egfr --map creat_value=SCR --unit creat_unit=mg/dL < in.arrows > out.arrows
+import argparse
+import sys
+
+import numpy as np
+import pyarrow as pa
+
+import formulas_batch
+import pipeline
+
+# -----------------------
+# Conversion
+# -----------------------
+def to_numpy(array):
+    """
+    Arrow array/chunked array -> float64 NumPy array, null -> NaN. float64 columns
+    without nulls in one chunk are returned as a read-only view of the Arrow buffer.
+    Strings are parsed with the rules of formulas._to_float (invalid -> NaN).
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks() if array.num_chunks != 1 else array.chunk(0)
+    if not isinstance(array, pa.Array):
+        return array
+    kind = array.type
+    if pa.types.is_floating(kind) or pa.types.is_integer(kind) or pa.types.is_decimal(kind):
+        if kind != pa.float64():
+            array = array.cast(pa.float64())
+        # zero_copy_only=False only copies when there are nulls (filled with NaN)
+        return array.to_numpy(zero_copy_only=array.null_count == 0)
+    if pa.types.is_dictionary(kind):
+        array = array.dictionary_decode()
+    return formulas_batch._column(array.to_numpy(zero_copy_only=False))
+
+
+def _text(array):
+    """String column -> object array, nulls kept as None (used for sex)."""
+    if isinstance(array, (pa.Array, pa.ChunkedArray)):
+        return array.to_numpy(zero_copy_only=False)
+    return array
+
+
+def to_arrow(values):
+    """float64 NumPy array -> pa.Array sharing its buffer, NaN -> null."""
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    invalid = np.isnan(values)
+    validity = None
+    null_count = int(invalid.sum())
+    if null_count:
+        validity = pa.py_buffer(np.packbits(~invalid, bitorder="little"))
+    return pa.Array.from_buffers(pa.float64(), len(values), [validity, pa.py_buffer(values)], null_count)
+
+
+def categories_to_arrow(categories):
+    """Category strings ("" for no result) -> dictionary-encoded string array with nulls."""
+    labels = np.asarray(categories, dtype=object)
+    return pa.array(labels, type=pa.string(), mask=labels == "").dictionary_encode()
+
+# -----------------------
+# Entry points
+# -----------------------
+def _arguments(kwargs):
+    out = {}
+    invalid = None
+    for name, value in kwargs.items():
+        if name == "sex" and isinstance(value, (pa.Array, pa.ChunkedArray)):
+            value = _text(value)
+            missing = np.array([v is None for v in value], dtype=bool)
+            invalid = missing if invalid is None else invalid | missing
+            out[name] = np.where(missing, "", value)
+        elif isinstance(value, (pa.Array, pa.ChunkedArray)):
+            out[name] = to_numpy(value)
+        else:
+            out[name] = value
+    return out, invalid
+
+
+def call(name, **kwargs):
+    """
+    Runs formulas_batch.<name>_batch with Arrow columns for the per-row arguments and
+    plain strings for the units; returns the result as a float64 pa.Array.
+    """
+    args, invalid = _arguments(kwargs)
+    values = getattr(formulas_batch, f"{name}_batch")(**args)
+    if invalid is not None:
+        # a null sex is a row the scalar formula rejects, not a male patient
+        values = np.where(invalid, np.nan, values)
+    return to_arrow(values)
+
+
+def egfr_ckdepi2021(creat_value, creat_unit="umol/L", age=40, sex="male", adjust_to_bsa=False, weight_kg=None, height_cm=None):
+    return call("egfr_ckdepi2021", creat_value=creat_value, creat_unit=creat_unit, age=age, sex=sex,
+                adjust_to_bsa=adjust_to_bsa, weight_kg=weight_kg, height_cm=height_cm)
+
+
+def calc_ldl_sampson(tc, tc_unit, tg, tg_unit, hdl, hdl_unit):
+    return call("calc_ldl_sampson", tc=tc, tc_unit=tc_unit, tg=tg, tg_unit=tg_unit, hdl=hdl, hdl_unit=hdl_unit)
+
+
+def calc_hdl_from_sampson(tc_val, tc_unit, tg_val, tg_unit, ldl_val, ldl_unit):
+    return call("calc_hdl_from_sampson", tc_val=tc_val, tc_unit=tc_unit, tg_val=tg_val, tg_unit=tg_unit,
+                ldl_val=ldl_val, ldl_unit=ldl_unit)
+
+
+def compute_batch(batch, calc_names, units=None, column_map=None):
+    """
+    Runs pipeline calculators over a RecordBatch (or Table) and returns it with a result
+    and, where the calculator interprets, a category column appended per calculator.
+    The input columns are passed through untouched.
+    """
+    units = units or {}
+    column_map = column_map or {}
+    names = list(batch.schema.names)
+    columns = list(batch.columns)
+    for calc_name in calc_names:
+        calc = pipeline.CALCULATORS[calc_name]
+        kwargs = {}
+        for arg in calc.columns:
+            column = column_map.get(arg, arg)
+            if column not in batch.schema.names:
+                raise ValueError(f"Column '{column}' required by {calc.name} not found in input")
+            kwargs[arg] = batch.column(column)
+        for arg, default in calc.units.items():
+            kwargs[arg] = units.get(arg, default)
+        args, invalid = _arguments(kwargs)
+        values = calc.func(**args)
+        if invalid is not None:
+            values = np.where(invalid, np.nan, values)
+        names.append(calc.name)
+        columns.append(to_arrow(values))
+        if calc.interpret:
+            names.append(f"{calc.name}_category")
+            columns.append(categories_to_arrow(calc.interpret(values, args)))
+    if isinstance(batch, pa.Table):
+        return pa.Table.from_arrays(columns, names=names)
+    return pa.RecordBatch.from_arrays(columns, names=names)
+
+
+def run_stream(source, sink, calc_names, units=None, column_map=None):
+    """Reads an Arrow IPC stream from `source`, writes the computed stream to `sink`; returns rows."""
+    reader = pa.ipc.open_stream(source)
+    writer = None
+    rows = 0
+    try:
+        for batch in reader:
+            out = compute_batch(batch, calc_names, units, column_map)
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, out.schema)
+            writer.write_batch(out)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run ChemCalc formulas over an Arrow IPC stream (stdin -> stdout).")
+    parser.add_argument("--calc", action="append", choices=sorted(pipeline.CALCULATORS), required=True,
+                        help="calculator to run; repeat for several")
+    parser.add_argument("--map", action="append", metavar="ARG=COLUMN",
+                        help="read formula argument ARG from column COLUMN")
+    parser.add_argument("--unit", action="append", metavar="UNIT_ARG=UNIT",
+                        help="unit of a column, e.g. creat_unit=mg/dL")
+    args = parser.parse_args(argv)
+    rows = run_stream(sys.stdin.buffer, sys.stdout.buffer, args.calc,
+                      pipeline._pairs(args.unit, "--unit"), pipeline._pairs(args.map, "--map"))
+    sys.stdout.buffer.flush()
+    print(f"{rows} rows processed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
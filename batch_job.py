@@ -0,0 +1,119 @@
+# batch_job.py
+# Batch recalculation of a CSV file in the background, for the desktop app.
+# A BatchJob runs pipeline.run_pipeline on a worker thread (and, with workers > 1, on
+# its process pool), so the Tk mainloop never runs the loop itself. The worker reports
+# through a bounded queue that the GUI drains from an after() callback:
+#
+#   job = batch_job.BatchJob("pending.csv", "pending_results.csv", ["egfr", "uacr"])
+#   job.start()
+#   ...
+#   for message in job.poll():      # from root.after(), never blocks
+#       kind, *data = message
+#
+# Messages are ("total", rows), ("progress", rows_done, preview_rows), ("done", rows),
+# ("cancelled", rows) and ("error", text). preview_rows are the first output rows of
+# the run (result and category values only), at most `preview_rows` of them in all.
+# When the queue is full the worker waits for the GUI to catch up, so a GUI that falls
+# behind slows the job down instead of piling up memory. Nothing here imports tkinter.
+import queue
+import threading
+
+import pipeline
+
+POLL_MS = 50               # how often the GUI drains the queue
+QUEUE_SIZE = 64            # messages waiting for the GUI at most
+DEFAULT_CHUNK_SIZE = 20000
+
+
+def count_rows(path):
+    """Data rows in a CSV file (lines minus the header), for the progress bar."""
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        lines += 1   # last line without a newline
+    return max(lines - 1, 0)
+
+
+class BatchJob:
+    def __init__(self, infile, outfile, calc_names, column_map=None, units=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 workers=1, preview_rows=200, queue_size=QUEUE_SIZE):
+        self.infile = infile
+        self.outfile = outfile
+        self.calc_names = list(calc_names)
+        self.column_map = column_map
+        self.units = units
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.preview_rows = preview_rows
+        self.errors = []     # parallel.ShardError for chunks that failed (workers > 1)
+        self.columns = [c for name in self.calc_names for c in pipeline.CALCULATORS[name].output_columns()]
+        self._messages = queue.Queue(maxsize=queue_size)
+        self._cancel = threading.Event()
+        self._previewed = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="chemcalc-batch", daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Asks the worker to stop after the chunk in progress; the rows written so far are kept."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def poll(self, max_messages=QUEUE_SIZE):
+        """Messages waiting from the worker, oldest first, without blocking."""
+        out = []
+        while len(out) < max_messages:
+            try:
+                out.append(self._messages.get_nowait())
+            except queue.Empty:
+                break
+        return out
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ---------- worker thread ----------
+    def _send(self, message):
+        # blocks while the GUI is behind, but gives up once the job is cancelled
+        while True:
+            try:
+                self._messages.put(message, timeout=0.1)
+                return
+            except queue.Full:
+                if self._cancel.is_set() and message[0] in ("total", "progress"):
+                    return
+
+    def _progress(self, rows, results):
+        take = min(self.preview_rows - self._previewed, len(results[0]) if results else 0)
+        preview = [tuple(column[i] for column in results) for i in range(take)]
+        self._previewed += take
+        self._send(("progress", rows, preview))
+
+    def _run(self):
+        rows = 0
+        try:
+            self._send(("total", count_rows(self.infile)))
+            with open(self.infile, newline="", encoding="utf-8") as infile, \
+                    open(self.outfile, "w", newline="", encoding="utf-8") as outfile:
+                rows = pipeline.run_pipeline(infile, outfile, self.calc_names, self.column_map, self.units,
+                                             self.chunk_size, self.workers, self.errors,
+                                             progress=self._progress, cancel=self._cancel.is_set)
+        except Exception as e:
+            self._send(("error", str(e) or type(e).__name__))
+            return
+        self._send(("cancelled", rows) if self._cancel.is_set() else ("done", rows))
@@ -0,0 +1,104 @@
+# bench_batch_job.py
+# Event-loop responsiveness while a batch import runs: a generated CSV is processed by
+# batch_job.BatchJob on its worker thread while a Tcl event loop (the one Tk runs, no
+# display needed) drains the job's queue every batch_job.POLL_MS and runs a 10 ms timer.
+# The lateness of that timer is the event latency a user would see in the window.
+#
+#   python benchmarks/bench_batch_job.py --rows 1000000
+#   python benchmarks/bench_batch_job.py --rows 1000000 --calc egfr --calc uacr --cancel-at 300000
+#
+# Exits with status 1 when the worst lateness exceeds --budget (default 50 ms).
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import tkinter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_job
+
+TICK_MS = 10
+
+
+def write_csv(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {
+        "creat_value": np.round(rng.uniform(40, 600, rows), 1),
+        "age": np.round(rng.uniform(18, 95, rows)),
+        "sex": rng.choice(np.array(["male", "female"]), rows),
+        "alb_value": np.round(rng.uniform(0, 30, rows), 1),
+        "tc": np.round(rng.uniform(120, 320, rows)),
+        "tg": np.round(rng.uniform(40, 700, rows)),
+        "hdl": np.round(rng.uniform(25, 90, rows)),
+    }
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(zip(*(column.tolist() for column in columns.values())))
+
+
+def run(job, cancel_at=None):
+    """Runs `job` under a Tcl event loop; returns (final message, timer lateness in seconds)."""
+    tcl = tkinter.Tcl()
+    lateness = []
+    state = {"last": time.perf_counter(), "final": None}
+
+    def tick():
+        now = time.perf_counter()
+        lateness.append(max(0.0, now - state["last"] - TICK_MS / 1000.0))
+        state["last"] = now
+        tcl.after(TICK_MS, tick)
+
+    def poll():
+        for message in job.poll():
+            if message[0] == "progress" and cancel_at is not None and message[1] >= cancel_at:
+                job.cancel()
+            if message[0] in ("done", "cancelled", "error"):
+                state["final"] = message
+        if state["final"] is None:
+            tcl.after(batch_job.POLL_MS, poll)
+
+    tcl.after(TICK_MS, tick)
+    tcl.after(batch_job.POLL_MS, poll)
+    job.start()
+    while state["final"] is None:
+        tcl.dooneevent(0)
+    return state["final"], np.array(lateness)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event latency of the Tk loop during a background batch import.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--calc", action="append", help="pipeline calculator to run; repeatable (default egfr)")
+    parser.add_argument("--chunk-size", type=int, default=batch_job.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--cancel-at", type=int, metavar="ROWS", help="cancel once this many rows are done")
+    parser.add_argument("--budget", type=float, default=50.0, metavar="MS")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        infile = os.path.join(tmp, "pending.csv")
+        write_csv(infile, args.rows)
+        job = batch_job.BatchJob(infile, os.path.join(tmp, "pending_results.csv"), args.calc or ["egfr"],
+                                 units={"creat_unit": "umol/L"}, chunk_size=args.chunk_size, workers=args.workers)
+        start = time.perf_counter()
+        final, lateness = run(job, args.cancel_at)
+        elapsed = time.perf_counter() - start
+
+    kind, data = final
+    if kind == "error":
+        raise SystemExit(f"batch job failed: {data}")
+    worst = lateness.max() * 1000.0
+    print(f"{kind}: {data:,} rows in {elapsed:.2f} s ({data / elapsed / 1e3:,.0f} krows/s)")
+    print(f"timer lateness over {len(lateness)} ticks: p50 {np.percentile(lateness, 50) * 1000:.1f} ms, "
+          f"p99 {np.percentile(lateness, 99) * 1000:.1f} ms, max {worst:.1f} ms (budget {args.budget:g} ms)")
+    return 1 if worst > args.budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# bench_hl7.py
+# Throughput of hl7_ingest in messages per second, replaying recorded MLLP traffic
+# from a file and over a loopback TCP connection (with an ACK per message).
+#
+#   python benchmarks/bench_hl7.py --replay recorded.mllp
+#   python benchmarks/bench_hl7.py --messages 20000 --record synthetic.mllp
+#
+# Without --replay a synthetic recording (mixed renal, urine, electrolyte and lipid
+# panels in mixed units) is generated first.
+import argparse
+import io
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hl7_ingest
+
+PANELS = [
+    # (code, text, unit, low, high)
+    [("14682-9", "Creatinine", "umol/L", 45, 600)],
+    [("2160-0", "Creatinine", "mg/dL", 0.5, 6.5)],
+    [("14957-5", "Microalbumin", "mg/L", 2, 400), ("14683-7", "Creatinine urine", "umol/L", 2000, 20000)],
+    [("2951-2", "Sodium", "mmol/L", 125, 155), ("2823-3", "Potassium", "mmol/L", 3, 6),
+     ("14749-6", "Glucose", "mmol/L", 3, 25), ("22664-7", "Urea", "mmol/L", 2, 35)],
+    [("2093-3", "Cholesterol", "mg/dL", 120, 320), ("2571-8", "Triglyceride", "mg/dL", 40, 700),
+     ("2085-9", "HDL", "mg/dL", 25, 90)],
+    [("2093-3", "Cholesterol", "mmol/L", 3, 8.5), ("2571-8", "Triglyceride", "mmol/L", 0.5, 8),
+     ("2085-9", "HDL", "mmol/L", 0.7, 2.3)],
+]
+
+
+def synthetic_message(rnd, n):
+    when = f"2025{rnd.randint(1, 12):02d}{rnd.randint(1, 28):02d}{rnd.randint(0, 23):02d}{rnd.randint(0, 59):02d}"
+    dob = f"{rnd.randint(1930, 2005)}{rnd.randint(1, 12):02d}{rnd.randint(1, 28):02d}"
+    segments = [
+        f"MSH|^~\\&|ANALYZER|LAB|LIS|HOSP|{when}||ORU^R01^ORU_R01|MSG{n:08d}|P|2.5.1",
+        f"PID|1||{100000 + n}^^^HOSP^MR||DOE^PAT||{dob}|{rnd.choice('MF')}",
+        f"OBR|1|ORD{n}||PANEL^Chemistry panel|||{when}",
+    ]
+    obx = 0
+    for panel in rnd.sample(PANELS, rnd.randint(1, 3)):
+        for code, text, unit, low, high in panel:
+            obx += 1
+            segments.append(f"OBX|{obx}|NM|{code}^{text}^LN||{rnd.uniform(low, high):.2f}|{unit}|||||F|||{when}")
+    return ("\r".join(segments) + "\r").encode()
+
+
+def record(path, messages, seed=0):
+    rnd = random.Random(seed)
+    with open(path, "wb") as f:
+        for n in range(messages):
+            f.write(hl7_ingest.frame(synthetic_message(rnd, n)))
+
+
+def replay_file(path):
+    with open(path, "rb") as instream:
+        return hl7_ingest.run_stream(instream, io.BytesIO())
+
+
+def replay_tcp(path):
+    """Sends the recording over loopback to run_stream, which ACKs every message."""
+    server = socket.create_server(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    acks = []
+
+    def sender():
+        with socket.create_connection(("127.0.0.1", port)) as conn:
+            drain = threading.Thread(target=lambda: acks.extend(hl7_ingest.iter_mllp(conn.makefile("rb"))))
+            drain.start()
+            with open(path, "rb") as f:
+                while True:
+                    block = f.read(hl7_ingest.READ_SIZE)
+                    if not block:
+                        break
+                    conn.sendall(block)
+            conn.shutdown(socket.SHUT_WR)
+            drain.join()
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    conn, _ = server.accept()
+    with conn, conn.makefile("rb") as instream:
+        stats = hl7_ingest.run_stream(instream, io.BytesIO(), reply=conn.sendall)
+    thread.join()
+    server.close()
+    return stats, len(acks)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput of the HL7 ingest.")
+    parser.add_argument("--replay", help="recorded MLLP file to replay")
+    parser.add_argument("--messages", type=int, default=20000, help="size of the synthetic recording")
+    parser.add_argument("--record", help="keep the synthetic recording at this path")
+    args = parser.parse_args(argv)
+
+    path = args.replay
+    tmp = None
+    if path is None:
+        path = args.record or os.path.join(tempfile.mkdtemp(), "synthetic.mllp")
+        tmp = None if args.record else path
+        record(path, args.messages)
+    try:
+        stats = replay_file(path)
+        print("file replay:")
+        stats.report(sys.stdout)
+        stats, acks = replay_tcp(path)
+        print(f"TCP replay ({acks} ACKs received):")
+        stats.report(sys.stdout)
+    finally:
+        if tmp:
+            os.remove(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# bench_jit.py
+# NumPy (formulas_batch) against the compiled backend (formulas_jit) for CKD-EPI 2021 and
+# Sampson LDL: best wall time and rows per second on the same inputs, and whether the
+# two backends agree row for row.
+#
+#   python benchmarks/bench_jit.py --rows 10000000
+#   python benchmarks/bench_jit.py --threads 1        # compiled backend on one thread
+#
+# The first compiled call (compilation) is timed apart.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formulas_batch
+import formulas_jit
+
+
+def make_inputs(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "creat": rng.uniform(40, 600, rows),
+        "age": rng.uniform(18, 95, rows),
+        "sex": rng.choice(np.array(["male", "female"]), rows),
+        "tc": rng.uniform(120, 320, rows),
+        "tg": rng.uniform(40, 700, rows),
+        "hdl": rng.uniform(25, 90, rows),
+    }
+
+
+CASES = {
+    "egfr": ("egfr_ckdepi2021_batch", lambda d: (d["creat"], "µmol/L", d["age"], d["sex"])),
+    "ldl": ("calc_ldl_sampson_batch", lambda d: (d["tc"], "mg/dL", d["tg"], "mg/dL", d["hdl"], "mg/dL")),
+}
+
+
+def best_time(func, args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the NumPy and compiled formula backends.")
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, help="threads for the compiled backend (default: all cores)")
+    args = parser.parse_args(argv)
+
+    print(f"compiled backend: {formulas_jit.BACKEND}")
+    if formulas_jit.BACKEND != "numba":
+        print("numba is not installed (or CHEMCALC_JIT=0): formulas_jit falls back to formulas_batch")
+    if args.threads:
+        formulas_jit.set_threads(args.threads)
+    data = make_inputs(args.rows)
+    print(f"{'formula':<8}{'backend':<8}{'best s':>10}{'Mrows/s':>10}{'speed-up':>10}")
+    for name, (func_name, build) in CASES.items():
+        call_args = build(data)
+        start = time.perf_counter()
+        getattr(formulas_jit, func_name)(*call_args)  # compile
+        first = time.perf_counter() - start
+        numpy_time, expected = best_time(getattr(formulas_batch, func_name), call_args, args.repeat)
+        jit_time, result = best_time(getattr(formulas_jit, func_name), call_args, args.repeat)
+        same = np.array_equal(expected, result, equal_nan=True)
+        print(f"{name:<8}{'numpy':<8}{numpy_time:>10.3f}{args.rows / numpy_time / 1e6:>10.1f}{1.0:>10.2f}")
+        print(f"{name:<8}{formulas_jit.BACKEND:<8}{jit_time:>10.3f}{args.rows / jit_time / 1e6:>10.1f}"
+              f"{numpy_time / jit_time:>10.2f}   first call {first:.2f} s, identical: {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# bench_parallel.py
+# Scaling curve of parallel.run_parallel: wall time, speed-up and efficiency for
+# 1, 2, 4, ... worker processes on the same synthetic dataset.
+#
+#   python benchmarks/bench_parallel.py --rows 2000000 --calc egfr --calc ldl
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parallel
+
+
+def make_inputs(rows, seed=0):
+    rnd = random.Random(seed)
+    return {
+        "creat_value": [rnd.uniform(40, 600) for _ in range(rows)],
+        "age": [rnd.uniform(18, 95) for _ in range(rows)],
+        "sex": [rnd.choice(("male", "female")) for _ in range(rows)],
+        "tc": [rnd.uniform(120, 320) for _ in range(rows)],
+        "tg": [rnd.uniform(40, 700) for _ in range(rows)],
+        "hdl": [rnd.uniform(25, 90) for _ in range(rows)],
+    }
+
+
+def worker_counts(limit):
+    n = 1
+    while n < limit:
+        yield n
+        n *= 2
+    yield limit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--shard-size", type=int, default=parallel.DEFAULT_SHARD_SIZE)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--calc", action="append", default=None)
+    args = parser.parse_args(argv)
+    calc_names = args.calc or ["egfr", "ldl"]
+
+    inputs = make_inputs(args.rows)
+    units = {"creat_unit": "umol/L"}
+    print(f"rows={args.rows} shard_size={args.shard_size} calculators={','.join(calc_names)}")
+    print(f"{'workers':>8} {'seconds':>9} {'rows/s':>12} {'speed-up':>9} {'efficiency':>10}")
+    baseline = None
+    for workers in worker_counts(args.max_workers):
+        start = time.perf_counter()
+        result = parallel.run_parallel(calc_names, inputs, units, args.shard_size, workers)
+        elapsed = time.perf_counter() - start
+        if not result.ok:
+            print(f"  {len(result.errors)} shard(s) failed: {result.errors[0]}")
+        baseline = baseline or elapsed
+        speedup = baseline / elapsed
+        print(f"{workers:>8} {elapsed:>9.3f} {args.rows / elapsed:>12,.0f} {speedup:>9.2f} {speedup / workers:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
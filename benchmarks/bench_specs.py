@@ -0,0 +1,136 @@
+# bench_specs.py
+# The functions compiled from specs.py against hand-written copies of the same formulas
+# (the code formulas.py and formulas_batch.py had before the specs): best time per call
+# for the scalar forms, per batch for the vector forms, and whether the results agree.
+#
+#   python benchmarks/bench_specs.py
+#   python benchmarks/bench_specs.py --rows 1000000 --calls 200000
+import argparse
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import specs
+
+# -----------------------
+# Hand-written references
+# -----------------------
+def egfr_scalar(scr_mgdl, age, female):
+    kappa = 0.7 if female else 0.9
+    alpha = -0.241 if female else -0.302
+    sex_factor = 1.012 if female else 1.0
+    x = scr_mgdl / kappa
+    return round(142 * (min(x, 1) ** alpha) * (max(x, 1) ** -1.200) * (0.9938 ** age) * sex_factor, 2)
+
+
+def egfr_vector(scr_mgdl, age, female):
+    kappa = np.where(female, 0.7, 0.9)
+    alpha = np.where(female, -0.241, -0.302)
+    sex_factor = np.where(female, 1.012, 1.0)
+    with np.errstate(all="ignore"):
+        x = scr_mgdl / kappa
+        egfr = 142 * np.power(np.minimum(x, 1), alpha) * np.power(np.maximum(x, 1), -1.200) * np.power(0.9938, age) * sex_factor
+    return egfr, scr_mgdl <= 0
+
+
+def serum_osm_scalar(na, k, glucose_mgdl, urea_mgdl):
+    return round(2.0 * (na + k) + (glucose_mgdl / 18.0) + (urea_mgdl / 6.006), 2)
+
+
+def serum_osm_vector(na, k, glucose_mgdl, urea_mgdl):
+    return 2.0 * (na + k) + (glucose_mgdl / 18.0) + (urea_mgdl / 6.006), None
+
+
+def ldl_scalar(tc_mg, tg_mg, hdl_mg):
+    if tg_mg > 800:
+        raise ValueError("Triglycerides too high for Sampson equation")
+    non_hdl = tc_mg - hdl_mg
+    return (tc_mg/0.948) - (hdl_mg/0.971) - ((tg_mg/8.56) + (tg_mg * non_hdl/2140) - ((tg_mg * tc_mg)/16100)) - 9.44
+
+
+def ldl_vector(tc_mg, tg_mg, hdl_mg):
+    non_hdl = tc_mg - hdl_mg
+    ldl_mg = (tc_mg/0.948) - (hdl_mg/0.971) - ((tg_mg/8.56) + (tg_mg * non_hdl/2140) - ((tg_mg * tc_mg)/16100)) - 9.44
+    return ldl_mg, tg_mg > 800
+
+
+def bmi_scalar(w, height_cm):
+    h_m = height_cm / 100.0
+    if h_m <= 0:
+        raise ValueError("Height must be > 0")
+    return round(w / (h_m * h_m), 1)
+
+
+def bmi_vector(w, height_cm):
+    h_m = height_cm / 100.0
+    with np.errstate(all="ignore"):
+        return w / (h_m * h_m), h_m <= 0
+
+
+def bsa_scalar(weight_kg, height_cm):
+    return 0.007184 * (weight_kg ** 0.425) * (height_cm ** 0.725)
+
+
+def bsa_vector(weight_kg, height_cm):
+    return 0.007184 * np.power(weight_kg, 0.425) * np.power(height_cm, 0.725), None
+
+
+def make_inputs(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "scr": rng.uniform(0.4, 7.0, rows), "age": rng.uniform(18, 95, rows), "female": rng.random(rows) < 0.5,
+        "na": rng.uniform(125, 155, rows), "k": rng.uniform(3, 6, rows),
+        "glucose": rng.uniform(60, 400, rows), "urea": rng.uniform(10, 120, rows),
+        "tc": rng.uniform(120, 320, rows), "tg": rng.uniform(40, 700, rows), "hdl": rng.uniform(25, 90, rows),
+        "weight": rng.uniform(40, 140, rows), "height": rng.uniform(140, 200, rows),
+    }
+
+
+CASES = {
+    "egfr": (specs.EGFR_CKDEPI2021, egfr_scalar, egfr_vector, ("scr", "age", "female")),
+    "serum_osm": (specs.SERUM_OSM, serum_osm_scalar, serum_osm_vector, ("na", "k", "glucose", "urea")),
+    "ldl": (specs.LDL_SAMPSON, ldl_scalar, ldl_vector, ("tc", "tg", "hdl")),
+    "bmi": (specs.BMI, bmi_scalar, bmi_vector, ("weight", "height")),
+    "bsa": (specs.BSA_DUBOIS, bsa_scalar, bsa_vector, ("weight", "height")),
+}
+
+
+def _masked(result):
+    raw, invalid = result
+    raw = np.array(raw, dtype=float)
+    if invalid is not None:
+        raw[invalid] = np.nan
+    return raw
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare compiled formula specs with hand-written formulas.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    data = make_inputs(args.rows)
+    print(f"{'formula':<11}{'form':<8}{'hand':>12}{'spec':>12}{'ratio':>8}  identical")
+    for name, (spec, scalar, vector, keys) in CASES.items():
+        columns = [data[key] for key in keys]
+        row = [column[0].item() for column in columns]
+        hand = min(timeit.repeat(lambda: scalar(*row), number=args.calls, repeat=args.repeat)) / args.calls
+        compiled = min(timeit.repeat(lambda: spec.scalar(*row), number=args.calls, repeat=args.repeat)) / args.calls
+        sample = [[column[i].item() for column in columns] for i in range(min(args.rows, 10000))]
+        same = all(scalar(*values) == spec.scalar(*values) for values in sample)
+        print(f"{name:<11}{'scalar':<8}{hand * 1e9:>10.0f}ns{compiled * 1e9:>10.0f}ns{compiled / hand:>8.2f}  {same}")
+
+        spec.vector  # compile outside the timing
+        hand = min(timeit.repeat(lambda: vector(*columns), number=1, repeat=args.repeat))
+        compiled = min(timeit.repeat(lambda: spec.vector(*columns), number=1, repeat=args.repeat))
+        same = np.array_equal(_masked(vector(*columns)), _masked(spec.vector(*columns)), equal_nan=True)
+        print(f"{name:<11}{'vector':<8}{hand * 1e3:>10.1f}ms{compiled * 1e3:>10.1f}ms{compiled / hand:>8.2f}  {same}")
+
+
+if __name__ == "__main__":
+    main()
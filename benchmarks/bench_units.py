@@ -0,0 +1,56 @@
+# bench_units.py
+# Per-call cost of unit handling: the string matching the formulas used to do on every
+# call versus a units.py registry lookup.
+#
+#   python benchmarks/bench_units.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formulas
+import units
+
+
+def legacy_creat_to_mgdl(value, unit):
+    # what egfr_ckdepi2021 / calc_uacr did before the registry
+    if unit.lower() in ("umol/l", "umol", "µmol/l", "µmol"):
+        return value / 88.4
+    elif unit.lower() in ("mg/l", "mg/L"):
+        return value / 10.0
+    elif unit.lower() in ("mg/dl", "mg/dl".lower()):
+        return value
+    raise ValueError("Unsupported creatinine unit")
+
+
+def legacy_lipid_to_mgdl(value, unit, analyte):
+    if unit == "mmol/L":
+        if analyte in ("TC", "LDL", "HDL"):
+            return value * 38.67
+        elif analyte == "TG":
+            return value * 88.57
+    return value
+
+
+CASES = [
+    ("creatinine µmol/L, legacy", lambda: legacy_creat_to_mgdl(80.0, "µmol/L")),
+    ("creatinine µmol/L, registry", lambda: units.to_canonical(80.0, "creatinine", "µmol/L")),
+    ("creatinine mg/dL, legacy", lambda: legacy_creat_to_mgdl(0.9, "mg/dL")),
+    ("creatinine mg/dL, registry", lambda: units.to_canonical(0.9, "creatinine", "mg/dL")),
+    ("TG mmol/L, legacy", lambda: legacy_lipid_to_mgdl(1.7, "mmol/L", "TG")),
+    ("TG mmol/L, registry", lambda: units.to_canonical(1.7, "TG", "mmol/L")),
+    ("egfr_ckdepi2021 µmol/L", lambda: formulas.egfr_ckdepi2021(80.0, "µmol/L", 50, "male")),
+    ("calc_uacr mg/L + µmol/L", lambda: formulas.calc_uacr(30.0, "mg/L", 8000.0, "µmol/L")),
+]
+
+
+def main(number=200000):
+    print(f"{'case':<32} {'ns/call':>9}")
+    for name, fn in CASES:
+        best = min(timeit.repeat(fn, number=number, repeat=5))
+        print(f"{name:<32} {best / number * 1e9:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# check_formulas.py
+# Parity check for the forms every formula is compiled to from specs.py. On random
+# inputs, with NaN, zero and negative values mixed in so the guards fire, and with missing
+# or unknown sex and omitted optional values:
+#   - each formulas_batch *_batch function against its formulas.py scalar, row by row
+#     (a row the scalar rejects must be NaN in the batch)
+#   - each spec's vector, row and trace (evaluate) forms against its scalar form
+#   - formulas_jit against formulas_batch when numba is installed
+# Results must be identical, not merely close. The exception is the vector form of the two
+# unrounded results computed with a power (CLOSE below): NumPy's pow may differ from
+# Python's in the last ulp, as formulas_batch documents for them, so those only have to
+# agree to about 1e-12.
+#
+#   python benchmarks/check_formulas.py [--rows 5000]
+#
+# Exits with status 1 if any form disagrees.
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formulas
+import formulas_batch
+import formulas_jit
+import specs
+
+# input name -> (low, high); booleans are drawn separately
+RANGES = {
+    "scr_mgdl": (0.2, 8), "creat_mgdl": (5, 300), "alb_mgdl": (0, 50), "age": (1, 95),
+    "height_cm": (50, 200), "weight_kg": (3, 150), "w": (3, 150),
+    "na": (120, 160), "k": (2.5, 7), "glucose_mgdl": (50, 600), "urea_mgdl": (5, 300),
+    "tc_mgdl": (100, 350), "tg_mgdl": (30, 1000), "hdl_mgdl": (20, 100), "ldl_mgdl": (30, 250),
+    # batch inputs in the units the cases below use
+    "creat_umoll": (20, 700), "ucreat_umoll": (500, 30000), "glucose_mmoll": (3, 35), "urea_mmoll": (1, 50),
+    "tc_mmoll": (2.5, 9), "tg_mmoll": (0.3, 11), "hdl_mmoll": (0.5, 2.6), "ldl_mmoll": (0.8, 6.5),
+    "child_age": (0.5, 17),
+}
+BOOLEANS = ("female", "male")
+# formula / spec names whose vector form is compared with a tolerance
+CLOSE = ("calc_hdl_from_sampson", "calculate_bsa")
+RTOL, ATOL = 1e-12, 1e-9
+
+
+def column(rng, name, rows, bad=0.05):
+    """Random values for input `name`; about `bad` of the rows are NaN, 0 or negative."""
+    if name in BOOLEANS:
+        return rng.random(rows) < 0.5
+    low, high = RANGES[name]
+    values = rng.uniform(low, high, rows)
+    pick = rng.random(rows)
+    values[pick < bad * 0.5] = np.nan
+    values[(pick >= bad * 0.5) & (pick < bad * 0.8)] = 0.0
+    values[(pick >= bad * 0.8) & (pick < bad)] *= -1
+    return values
+
+
+def scalar_rows(func, args, rows):
+    """
+    func applied to row i of every array argument. A row the scalar rejects (ValueError,
+    division by zero, or a complex power of a negative input) is NaN, as in the batch.
+    """
+    out = np.empty(rows)
+    for i in range(rows):
+        row = [a if not isinstance(a, np.ndarray) else a[i].item() if a.dtype != object else a[i] for a in args]
+        try:
+            value = func(*row)
+        except (ValueError, ArithmeticError):
+            value = np.nan
+        out[i] = np.nan if isinstance(value, complex) else value
+    return out
+
+
+def compare(label, expected, got, close=False):
+    """
+    Returns a problem string, or None when the arrays are identical (NaN == NaN) or, with
+    close=True, within RTOL / ATOL of each other.
+    """
+    expected = np.asarray(expected, dtype=float)
+    got = np.asarray(got, dtype=float)
+    if close:
+        same = np.isclose(got, expected, rtol=RTOL, atol=ATOL, equal_nan=True)
+    else:
+        same = (expected == got) | (np.isnan(expected) & np.isnan(got))
+    differ = np.flatnonzero(~same)
+    if not len(differ):
+        return None
+    i = differ[0]
+    return f"{label}: {len(differ)} rows differ, first row {i}: {expected[i]!r} != {got[i]!r}"
+
+# -----------------------
+# formulas_batch against formulas
+# -----------------------
+BATCH_CASES = {
+    "egfr_ckdepi2021": ("egfr_ckdepi2021", lambda d: (d["creat_umoll"], "µmol/L", d["age"], d["sex"])),
+    "egfr_ckdepi2021 (missing sex)": ("egfr_ckdepi2021", lambda d: (d["creat_umoll"], "µmol/L", d["age"], d["sex_any"])),
+    "egfr_ckdepi2021 (BSA)": ("egfr_ckdepi2021",
+                              lambda d: (d["creat_umoll"], "µmol/L", d["age"], d["sex"], True, d["weight_kg"], d["height_cm"])),
+    "cockcroft_gault": ("cockcroft_gault", lambda d: (d["age"], d["weight_kg"], d["scr_mgdl"], "mg/dL", d["sex_any"])),
+    "cockcroft_gault (BSA)": ("cockcroft_gault",
+                              lambda d: (d["age"], d["weight_kg"], d["scr_mgdl"], "mg/dL", d["sex"], True, d["height_cm"])),
+    "egfr_schwartz": ("egfr_schwartz", lambda d: (d["height_cm"], d["creat_umoll"], "µmol/L")),
+    "calc_pediatric_egfr": ("calc_pediatric_egfr", lambda d: (d["height_cm"], d["child_age"], d["sex_any"], d["scr_mgdl"], "mg/dL")),
+    "calc_uacr": ("calc_uacr", lambda d: (d["alb_mgdl"], "mg/dL", d["ucreat_umoll"], "µmol/L")),
+    "calc_serum_osm": ("calc_serum_osm", lambda d: (d["na"], d["k"], d["glucose_mmoll"], "mmol/L", d["urea_mmoll"], "mmol/L")),
+    "calc_serum_osm (omitted urea)": ("calc_serum_osm", lambda d: (d["na"], d["k"], d["glucose_mmoll"], "mmol/L",
+                                                                   d["urea_omitted"], "mmol/L")),
+    "calc_urine_osm": ("calc_urine_osm", lambda d: (d["na"], d["k"], d["urea_mmoll"], "mmol/L", d["glucose_mmoll"], "mmol/L")),
+    "calc_ldl_sampson": ("calc_ldl_sampson",
+                         lambda d: (d["tc_mmoll"], "mmol/L", d["tg_mmoll"], "mmol/L", d["hdl_mmoll"], "mmol/L")),
+    "calc_hdl_from_sampson": ("calc_hdl_from_sampson",
+                              lambda d: (d["tc_mmoll"], "mmol/L", d["tg_mmoll"], "mmol/L", d["ldl_mmoll"], "mmol/L")),
+    "calc_bmi": ("calc_bmi", lambda d: (d["weight_kg"], d["height_cm"])),
+    "calculate_bsa": ("calculate_bsa", lambda d: (d["weight_kg"], d["height_cm"])),
+}
+JIT_CASES = ("egfr_ckdepi2021", "egfr_ckdepi2021 (missing sex)", "calc_ldl_sampson")
+
+
+def make_inputs(rng, rows):
+    data = {name: column(rng, name, rows) for name in RANGES}
+    # a str column (what a CSV gives) and an object column with None and NaN (what JSON gives)
+    data["sex"] = rng.choice(np.array(["male", "female", "Female", "MALE", "", "other"]), rows, p=[.3, .3, .2, .1, .05, .05])
+    data["sex_any"] = rng.choice(np.array(["male", "female", "MALE", None, np.nan, ""], dtype=object), rows,
+                                 p=[.4, .4, .1, .04, .03, .03])
+    urea = data["urea_mmoll"].astype(object)
+    pick = rng.random(rows)
+    urea[pick < 0.05] = None
+    urea[(pick >= 0.05) & (pick < 0.1)] = ""
+    data["urea_omitted"] = urea
+    return data
+
+
+def check_batch(data, rows):
+    problems = []
+    for label, (name, make_args) in BATCH_CASES.items():
+        args = make_args(data)
+        expected = scalar_rows(getattr(formulas, name), args, rows)
+        problems.append(compare(f"formulas_batch.{name}_batch {label}", expected,
+                                getattr(formulas_batch, f"{name}_batch")(*args), name in CLOSE))
+        if label in JIT_CASES and formulas_jit.BACKEND == "numba":
+            problems.append(compare(f"formulas_jit.{name}_batch", expected, getattr(formulas_jit, f"{name}_batch")(*args)))
+    return [p for p in problems if p]
+
+# -----------------------
+# Spec forms against the scalar form
+# -----------------------
+def check_specs(rng, rows):
+    problems = []
+    for name, spec in specs.SPECS.items():
+        args = [column(rng, v.name, rows) for v in spec.inputs]
+        expected = scalar_rows(spec.scalar, args, rows)
+
+        vector = formulas_batch._finish(*spec.vector(*args))
+        row = scalar_rows(spec.row, args, rows)
+        names = [v.name for v in spec.inputs]
+        trace = scalar_rows(lambda *values, spec=spec: spec.result.evaluate(spec.evaluate(dict(zip(names, values)))),
+                            args, rows)
+        if spec.digits is not None:
+            vector = np.array([round(v, spec.digits) for v in vector.tolist()])
+            row = np.array([round(v, spec.digits) for v in row.tolist()])
+            trace = np.array([round(v, spec.digits) for v in trace.tolist()])
+        valid = ~np.isnan(expected)   # evaluate() does not apply the guards
+        problems += [compare(f"specs.{name}.vector", expected, vector, name in CLOSE),
+                     compare(f"specs.{name}.row", expected, row),
+                     compare(f"specs.{name} trace", expected[valid], trace[valid])]
+    return [p for p in problems if p]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every compiled form of the formulas gives identical results.")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    problems = check_batch(make_inputs(rng, args.rows), args.rows) + check_specs(rng, args.rows)
+    status = "FAIL" if problems else "ok"
+    jit = "with formulas_jit" if formulas_jit.BACKEND == "numba" else "formulas_jit skipped (no numba)"
+    print(f"{status:<4} {len(BATCH_CASES)} batch functions and {len(specs.SPECS)} specs on {args.rows} rows, {jit}")
+    for problem in problems:
+        print(f"       {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
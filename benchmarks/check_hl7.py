@@ -0,0 +1,78 @@
+# check_hl7.py
+# Reply check for hl7_ingest.run_stream: a recording mixing valid ORU^R01 messages with
+# frames that are not HL7 at all is run through run_stream, which must send exactly one
+# reply per frame, in order: AA for the valid messages and AR for the others, each
+# echoing the message's control ID. nak() of a message with a readable MSH must be AE.
+#
+#   python benchmarks/check_hl7.py [--messages 200]
+#
+# Exits with status 1 on the first mismatch.
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hl7_ingest
+from bench_hl7 import synthetic_message
+
+BROKEN = [
+    # (raw message, expected MSA-1, expected MSA-2)
+    (b"garbage", "AR", ""),
+    (b"", "AR", ""),
+    (b"MSH", "AR", ""),
+    (b"XXX|^~\\&|ANALYZER|LAB|LIS|HOSP|20250101||ORU^R01|BAD1|P|2.5.1", "AR", "BAD1"),
+]
+
+
+def recording(messages, seed=0):
+    """Returns (MLLP bytes, [(expected MSA-1, expected MSA-2)] per frame)."""
+    rnd = random.Random(seed)
+    frames, expected = [], []
+    for n in range(messages):
+        if n % 10 == 3:
+            raw, code, control_id = BROKEN[(n // 10) % len(BROKEN)]
+        else:
+            raw, code, control_id = synthetic_message(rnd, n), "AA", f"MSG{n:08d}"
+        frames.append(hl7_ingest.frame(raw))
+        expected.append((code, control_id))
+    return b"".join(frames), expected
+
+
+def msa(reply):
+    segments = [s for s in reply.decode().split("\r") if s]
+    fields = segments[1].split("|")
+    return fields[1], fields[2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that hl7_ingest replies once to every message.")
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    data, expected = recording(args.messages)
+    replies = []
+    with contextlib.redirect_stderr(io.StringIO()):
+        stats = hl7_ingest.run_stream(io.BytesIO(data), io.BytesIO(), reply=replies.append)
+    problems = []
+    if len(replies) != len(expected):
+        problems.append(f"{len(replies)} replies to {len(expected)} frames")
+    for n, (reply, want) in enumerate(zip(replies, expected)):
+        got = msa(b"".join(hl7_ingest.iter_mllp(io.BytesIO(reply))))
+        if got != want:
+            problems.append(f"frame {n}: MSA {got}, expected {want}")
+            break
+    if msa(hl7_ingest.nak(synthetic_message(random.Random(0), 7))) != ("AE", "MSG00000007"):
+        problems.append("nak() of a readable message is not AE")
+    status = "FAIL" if problems else "ok"
+    print(f"{status:<4} {len(expected)} frames, {len(replies)} replies, {stats.errors} unreadable")
+    for problem in problems:
+        print(f"       {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# check_imports.py
+# Import-cost check for the non-GUI entry points.
+# Each module is imported in a fresh interpreter under `python -X importtime`. The check
+# fails (exit status 1) if a module pulls in a GUI module or its cumulative import time
+# exceeds its budget.
+#
+#   python benchmarks/check_imports.py [--scale 2.0]
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GUI_MODULES = ("tkinter", "_tkinter", "ttkbootstrap", "UserInterface")
+
+# module -> budget in ms (cumulative import time, measured cold in a fresh process)
+BUDGETS_MS = {
+    "formulas": 25,
+    "specs": 25,             # compiles every scalar formula; numpy only on first vector use
+    "units": 25,
+    "interpretation": 25,
+    "engine": 40,
+    "ChemCalc": 60,          # importing the app module must not start any GUI machinery
+    "formulas_batch": 400,   # numpy
+    "pipeline": 450,
+    "parallel": 500,
+}
+
+
+def import_profile(module):
+    """Returns {imported module: cumulative microseconds} for `import module`."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr}")
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            profile[name.strip()] = int(cumulative)
+    return profile
+
+
+def check(module, budget_ms):
+    profile = import_profile(module)
+    elapsed_ms = profile.get(module, 0) / 1000.0
+    gui = sorted(name for name in profile if name.split(".")[0] in GUI_MODULES)
+    problems = []
+    if gui:
+        problems.append(f"imports GUI modules: {', '.join(gui[:5])}")
+    if elapsed_ms > budget_ms:
+        problems.append(f"{elapsed_ms:.1f} ms over budget of {budget_ms:g} ms")
+    return elapsed_ms, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check import cost of the non-GUI modules.")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget (slow CI machines)")
+    parser.add_argument("modules", nargs="*", help="modules to check (default: all with a budget)")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.modules or BUDGETS_MS:
+        budget = BUDGETS_MS.get(module, 100) * args.scale
+        elapsed_ms, problems = check(module, budget)
+        status = "FAIL" if problems else "ok"
+        print(f"{status:<4} {module:<16} {elapsed_ms:8.1f} ms  (budget {budget:g} ms)")
+        for problem in problems:
+            print(f"       {problem}")
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
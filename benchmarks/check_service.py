@@ -0,0 +1,129 @@
+# check_service.py
+# Request check for service.py: a CalcService on a free local port is sent requests whose
+# answers are fixed by the service's contract, over one keep-alive connection:
+#   - bad input to a formula (a null or numeric sex, a missing argument) is a 422
+#   - a batch gives null for every row the scalar endpoint rejects
+#   - a failure inside the service is a 500 and the connection stays usable
+#   - with metrics on, batch requests are counted (calls and errors) in metrics.REGISTRY
+#
+#   python benchmarks/check_service.py
+#
+# Exits with status 1 if any answer differs.
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formulas
+import formulas_batch
+import metrics
+import service
+from load_test import read_response
+
+EGFR = {"creat_value": 80, "creat_unit": "umol/L", "age": 50, "sex": "female"}
+OSM = {"na": 140, "k": 4, "glucose_value": 90, "urea_value": 30}
+# formula -> batch rows, each checked against the single endpoint
+BATCHES = {
+    "egfr_ckdepi2021": [EGFR, dict(EGFR, sex=None), dict(EGFR, sex=1), dict(EGFR, sex="other"), dict(EGFR, sex="MALE"),
+                        dict(EGFR, creat_value="")],
+    "calc_serum_osm": [OSM, dict(OSM, urea_value=""), dict(OSM, urea_value=None), dict(OSM, na=None)],
+}
+
+# (path, payload, expected status, expected JSON or None to skip the body)
+CASES = [
+    ("/formulas/egfr_ckdepi2021", EGFR, 200, {"value": formulas.egfr_ckdepi2021(**EGFR)}),
+    ("/formulas/egfr_ckdepi2021", dict(EGFR, sex=None), 422, None),
+    ("/formulas/egfr_ckdepi2021", dict(EGFR, sex=1), 422, None),
+    ("/formulas/egfr_ckdepi2021", {"age": 50}, 422, None),
+    ("/formulas/calc_serum_osm", dict(OSM, urea_value=""), 200, None),
+    ("/batch/egfr_ckdepi2021", {"rows": [dict(EGFR, creat_unit="furlong")]}, 422, None),
+]
+# (metrics.REGISTRY table, key, at least this many) after the requests above
+COUNTS = [
+    ("calls", "formulas_batch.egfr_ckdepi2021_batch", 2),
+    ("calls", "formulas_batch.calc_serum_osm_batch", 1),
+    ("errors", ("formulas_batch.egfr_ckdepi2021_batch", "Unsupported creatinine unit"), 1),
+]
+
+
+async def request(reader, writer, path, payload):
+    body = json.dumps(payload).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: check\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status, body = await read_response(reader)
+    return status, json.loads(body) if body else None
+
+
+def _broken(**kwargs):
+    raise RuntimeError("broken on purpose")
+
+
+async def run():
+    problems = []
+    metrics.REGISTRY.reset()
+    svc = service.CalcService(max_batches=1, metrics=True)
+    await svc.start("127.0.0.1", 0)
+    reader, writer = await asyncio.open_connection(*svc.address())
+    try:
+        await exchange(reader, writer, problems)
+    except (asyncio.IncompleteReadError, ConnectionError) as e:
+        problems.append(f"connection lost: {e!r}")
+    finally:
+        writer.close()
+        await writer.wait_closed()
+        await asyncio.sleep(0.1)   # let the server see the close before it shuts down
+        await svc.close()
+        metrics.disable()
+    return problems
+
+
+async def exchange(reader, writer, problems):
+    """The requests of the check over one connection; appends what went wrong to `problems`."""
+    for path, payload, want_status, want in CASES:
+        status, got = await request(reader, writer, path, payload)
+        if status != want_status or (want is not None and got != want):
+            problems.append(f"{path} {payload}: {status} {got}, expected {want_status} {want}")
+
+    # every batch row must be what the single endpoint gives for it (null where it is rejected)
+    for name, rows in BATCHES.items():
+        singles = []
+        for row in rows:
+            status, got = await request(reader, writer, f"/formulas/{name}", row)
+            singles.append(got["value"] if status == 200 else None)
+        status, got = await request(reader, writer, f"/batch/{name}", {"rows": rows})
+        if status != 200 or got != {"values": singles}:
+            problems.append(f"batch {name}: {status} {got}, expected 200 {{'values': {singles}}}")
+
+    for table, key, least in COUNTS:
+        count = getattr(metrics.REGISTRY, table).get(key, 0)
+        if count < least:
+            problems.append(f"metrics: {table} {key} is {count}, expected at least {least}")
+
+    formulas_batch.calc_bmi_batch, batch = _broken, formulas_batch.calc_bmi_batch
+    try:
+        with contextlib.redirect_stderr(io.StringIO()):
+            status, got = await request(reader, writer, "/batch/calc_bmi", {"rows": [{"weight_kg": 70, "height_cm": 170}]})
+    finally:
+        formulas_batch.calc_bmi_batch = batch
+    if status != 500:
+        problems.append(f"internal error: {status} {got}, expected 500")
+    status, got = await request(reader, writer, "/formulas/egfr_ckdepi2021", EGFR)
+    if status != 200:
+        problems.append(f"connection after a 500: {status} {got}, expected 200")
+
+
+def main():
+    problems = asyncio.run(run())
+    status = "FAIL" if problems else "ok"
+    print(f"{status:<4} {len(CASES) + sum(len(rows) + 1 for rows in BATCHES.values()) + 2} requests")
+    for problem in problems:
+        print(f"       {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# load_test.py
+# Load-test client for service.py: N keep-alive connections send requests back to back
+# for a fixed time, then requests/s and p50/p99 latency are reported.
+#
+#   python service.py --port 8080 &
+#   python benchmarks/load_test.py --port 8080 --connections 32 --duration 10
+#   python benchmarks/load_test.py --spawn --mode batch --rows 5000 --formula calc_ldl_sampson
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# one random, valid set of arguments per formula
+SAMPLES = {
+    "egfr_ckdepi2021": lambda r: {"creat_value": r.uniform(40, 600), "creat_unit": "umol/L",
+                                  "age": r.uniform(18, 95), "sex": r.choice(("male", "female"))},
+    "cockcroft_gault": lambda r: {"age": r.uniform(18, 95), "weight_kg": r.uniform(40, 140),
+                                  "creat_value": r.uniform(0.5, 6), "sex": r.choice(("male", "female"))},
+    "egfr_schwartz": lambda r: {"height_cm": r.uniform(50, 180), "creat_value": r.uniform(0.2, 3)},
+    "calc_pediatric_egfr": lambda r: {"height": r.uniform(50, 180), "age_var": r.uniform(0, 17),
+                                      "sex": r.choice(("male", "female")), "creat_value": r.uniform(0.2, 3)},
+    "calc_uacr": lambda r: {"alb_value": r.uniform(0.5, 50), "albumin_unit": "mg/dL", "creat_value": r.uniform(20, 300)},
+    "calc_serum_osm": lambda r: {"na": r.uniform(125, 155), "k": r.uniform(3, 6),
+                                 "glucose_value": r.uniform(3, 30), "glucose_unit": "mmol/L",
+                                 "urea_value": r.uniform(2, 40), "urea_unit": "mmol/L"},
+    "calc_urine_osm": lambda r: {"na": r.uniform(20, 200), "k": r.uniform(10, 100),
+                                 "urea_value": r.uniform(100, 500), "urea_unit": "mmol/L"},
+    "calc_ldl_sampson": lambda r: {"tc": r.uniform(120, 320), "tc_unit": "mg/dL", "tg": r.uniform(40, 700),
+                                   "tg_unit": "mg/dL", "hdl": r.uniform(25, 90), "hdl_unit": "mg/dL"},
+    "calc_hdl_from_sampson": lambda r: {"tc_val": r.uniform(120, 320), "tc_unit": "mg/dL", "tg_val": r.uniform(40, 700),
+                                        "tg_unit": "mg/dL", "ldl_val": r.uniform(50, 200), "ldl_unit": "mg/dL"},
+    "calc_bmi": lambda r: {"weight_kg": r.uniform(40, 140), "height_cm": r.uniform(140, 200)},
+    "calculate_bsa": lambda r: {"weight_kg": r.uniform(40, 140), "height_cm": r.uniform(140, 200)},
+}
+
+
+def make_bodies(mode, formula, rows, count=64, seed=0):
+    """A few pre-encoded request bodies, cycled through so encoding is not measured."""
+    rnd = random.Random(seed)
+    sample = SAMPLES[formula]
+    if mode == "single":
+        payloads = [sample(rnd) for _ in range(count)]
+    else:
+        payloads = [{"rows": [sample(rnd) for _ in range(rows)]} for _ in range(min(count, 8))]
+    return [json.dumps(p).encode() for p in payloads]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    body = await reader.readexactly(length) if length else b""
+    return status, body
+
+
+async def client(host, port, path, bodies, deadline, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            body = bodies[i % len(bodies)]
+            i += 1
+            request = (f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                       f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, _ = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, path, bodies, connections, duration):
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(host, port, path, bodies, deadline, latencies, statuses) for _ in range(connections)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_service(port, extra_args=()):
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "service.py"), "--port", str(port), *extra_args])
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("service did not start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the ChemCalc HTTP service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--spawn", action="store_true", help="start a local service on a free port for the test")
+    parser.add_argument("--mode", choices=("single", "batch"), default="single")
+    parser.add_argument("--formula", choices=sorted(SAMPLES), default="egfr_ckdepi2021")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per batch request")
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    args = parser.parse_args(argv)
+
+    proc = None
+    if args.spawn:
+        args.host, args.port = "127.0.0.1", free_port()
+        proc = spawn_service(args.port)
+    try:
+        path = f"/{'formulas' if args.mode == 'single' else 'batch'}/{args.formula}"
+        bodies = make_bodies(args.mode, args.formula, args.rows)
+        elapsed, latencies, statuses = asyncio.run(
+            run_load(args.host, args.port, path, bodies, args.connections, args.duration))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+    latencies.sort()
+    n = len(latencies)
+    print(f"{path}  connections={args.connections}  duration={elapsed:.1f}s"
+          + (f"  rows/request={args.rows}" if args.mode == "batch" else ""))
+    print(f"requests   {n}  ({', '.join(f'{s}: {c}' for s, c in sorted(statuses.items()))})")
+    print(f"req/s      {n / elapsed:.0f}")
+    if args.mode == "batch":
+        print(f"rows/s     {n * args.rows / elapsed:.0f}")
+    print(f"p50        {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"p99        {percentile(latencies, 99) * 1000:.2f} ms")
+    print(f"max        {latencies[-1] * 1000:.2f} ms" if n else "max        -")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# microbench.py
+# Microbenchmarks for every formula in formulas.py across its unit branches, scalar and
+# batch (formulas_batch), plus ChemCalc page switches and calculate handlers.
+# Results are written as JSON; --compare flags cases slower than a stored baseline.
+#
+#   python benchmarks/microbench.py -o baseline.json
+#   python benchmarks/microbench.py -o current.json --compare baseline.json --threshold 0.15
+#
+# The GUI cases need a display. Without one, Xvfb is started if it is installed
+# (apt install xvfb); otherwise the GUI cases are skipped and reported as such.
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import formulas
+import formulas_batch
+
+BATCH_ROWS = 10000
+
+# -----------------------
+# Formula cases: (formula, unit branch, arguments)
+# -----------------------
+FORMULA_CASES = [
+    ("egfr_ckdepi2021", "µmol/L", dict(creat_value=80.0, creat_unit="µmol/L", age=50, sex="female")),
+    ("egfr_ckdepi2021", "mg/dL", dict(creat_value=0.9, creat_unit="mg/dL", age=50, sex="male")),
+    ("egfr_ckdepi2021", "mg/L", dict(creat_value=9.0, creat_unit="mg/L", age=50, sex="male")),
+    ("egfr_ckdepi2021", "µmol/L+bsa", dict(creat_value=80.0, creat_unit="µmol/L", age=50, sex="female",
+                                             adjust_to_bsa=True, weight_kg=70.0, height_cm=170.0)),
+    ("cockcroft_gault", "mg/dL", dict(age=60, weight_kg=72.0, creat_value=1.1, creat_unit="mg/dL", sex="male")),
+    ("cockcroft_gault", "µmol/L", dict(age=60, weight_kg=72.0, creat_value=97.0, creat_unit="µmol/L", sex="female")),
+    ("cockcroft_gault", "mg/dL+bsa", dict(age=60, weight_kg=72.0, creat_value=1.1, creat_unit="mg/dL", sex="male",
+                                           normalize_to_bsa=True, height_cm=175.0)),
+    ("egfr_schwartz", "mg/dL", dict(height_cm=120.0, creat_value=0.5, creat_unit="mg/dL")),
+    ("egfr_schwartz", "µmol/L", dict(height_cm=120.0, creat_value=44.0, creat_unit="µmol/L")),
+    ("calc_pediatric_egfr", "mg/dL", dict(height=120.0, age_var=8, sex="male", creat_value=0.5, creat_unit="mg/dL")),
+    ("calc_pediatric_egfr", "µmol/L", dict(height=160.0, age_var=15, sex="female", creat_value=60.0, creat_unit="µmol/L")),
+    ("calc_uacr", "mg/dL+mg/dL", dict(alb_value=3.0, albumin_unit="mg/dL", creat_value=100.0, creat_unit="mg/dL")),
+    ("calc_uacr", "mg/L+µmol/L", dict(alb_value=30.0, albumin_unit="mg/L", creat_value=8000.0, creat_unit="µmol/L")),
+    ("calc_uacr", "mg/L+mg/L", dict(alb_value=30.0, albumin_unit="mg/L", creat_value=900.0, creat_unit="mg/L")),
+    ("calc_serum_osm", "mg/dL", dict(na=140.0, k=4.0, glucose_value=90.0, glucose_unit="mg/dL", urea_value=15.0, urea_unit="mg/dL")),
+    ("calc_serum_osm", "mmol/L", dict(na=140.0, k=4.0, glucose_value=5.0, glucose_unit="mmol/L", urea_value=5.0, urea_unit="mmol/L")),
+    ("calc_serum_osm", "no urea", dict(na=140.0, k=4.0, glucose_value=5.0, glucose_unit="mmol/L")),
+    ("calc_urine_osm", "mg/dL", dict(na=80.0, k=40.0, urea_value=1500.0, urea_unit="mg/dL", glucose_value=36.0, glucose_unit="mg/dL")),
+    ("calc_urine_osm", "mmol/L", dict(na=80.0, k=40.0, urea_value=250.0, urea_unit="mmol/L", glucose_value=2.0, glucose_unit="mmol/L")),
+    ("calc_ldl_sampson", "mg/dL", dict(tc=200.0, tc_unit="mg/dL", tg=130.0, tg_unit="mg/dL", hdl=50.0, hdl_unit="mg/dL")),
+    ("calc_ldl_sampson", "mmol/L", dict(tc=5.2, tc_unit="mmol/L", tg=1.5, tg_unit="mmol/L", hdl=1.3, hdl_unit="mmol/L")),
+    ("calc_hdl_from_sampson", "mg/dL", dict(tc_val=200.0, tc_unit="mg/dL", tg_val=130.0, tg_unit="mg/dL", ldl_val=120.0, ldl_unit="mg/dL")),
+    ("calc_hdl_from_sampson", "mmol/L", dict(tc_val=5.2, tc_unit="mmol/L", tg_val=1.5, tg_unit="mmol/L", ldl_val=3.0, ldl_unit="mmol/L")),
+    ("calc_bmi", "kg/cm", dict(weight_kg=70.0, height_cm=175.0)),
+    ("calculate_bsa", "kg/cm", dict(weight_kg=70.0, height_cm=175.0)),
+]
+
+# arguments that stay scalar in the batch form
+_FIXED = ("adjust_to_bsa", "normalize_to_bsa")
+
+
+def batch_arguments(kwargs, rows, seed=0):
+    """Turns one set of scalar arguments into `rows` rows, each value jittered by ±10%."""
+    rng = np.random.default_rng(seed)
+    out = {}
+    for name, value in kwargs.items():
+        if name.endswith("_unit") or name in _FIXED:
+            out[name] = value
+        elif name == "sex":
+            out[name] = np.where(rng.random(rows) < 0.5, "male", "female")
+        else:
+            out[name] = value * rng.uniform(0.9, 1.1, rows)
+    return out
+
+
+def formula_cases(rows=BATCH_ROWS):
+    """Yields (case name, group, function, rows per call)."""
+    for name, branch, kwargs in FORMULA_CASES:
+        func = getattr(formulas, name)
+        yield f"{name}[{branch}]", "scalar", (lambda f=func, k=kwargs: f(**k)), 1
+        batch = getattr(formulas_batch, f"{name}_batch")
+        columns = batch_arguments(kwargs, rows)
+        yield f"{name}_batch[{branch}]", "batch", (lambda f=batch, k=columns: f(**k)), rows
+
+# -----------------------
+# GUI cases
+# -----------------------
+# valid input for every calculator page: page -> {variable: value}
+GUI_INPUT = {
+    "eGFR": {"creatinine_var": "80", "age_var": "50", "patient_gender": "Female", "height_var": "170", "weight_var": "70"},
+    "eGFR_ped": {"creatinine_var": "44", "age_var": "8", "patient_gender": "Male", "height_var": "120"},
+    "uacr": {"albumin_var": "3", "creatinine_var": "8000"},
+    "uosm": {"sodium_var": "80", "potassium_var": "40", "urea_var": "250", "glucose_var": "2"},
+    "sosm": {"sodium_var": "140", "potassium_var": "4", "urea_var": "5", "glucose_var": "5"},
+    "ldl": {"tc_var": "5.2", "tg_var": "1.5", "hdl_var": "1.3"},
+    "hdl": {"tc_var": "5.2", "tg_var": "1.5", "ldl_var": "3.0"},
+}
+
+
+def start_virtual_display():
+    """Returns (ok, Xvfb process or None). Starts Xvfb when there is no display to use."""
+    if sys.platform in ("win32", "darwin") or os.environ.get("DISPLAY"):
+        return True, None
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        return False, None
+    display = f":{90 + os.getpid() % 100}"
+    proc = subprocess.Popen([xvfb, display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ["DISPLAY"] = display
+    time.sleep(0.5)
+    return proc.poll() is None, proc
+
+
+def gui_cases(root):
+    """Yields (case name, group, function, 1) for page switches and calculate handlers."""
+    import ChemCalc
+    app = ChemCalc.ChemCalc(root)
+    for name, (_, ui_attr, _, handler) in ChemCalc.ChemCalc.PAGES.items():
+        if name not in GUI_INPUT:
+            continue  # not a calculator (batch import: see bench_batch_job.py)
+        app.page(name)  # built once up front: the cases time steady-state switches
+        ui = getattr(app, ui_attr)
+        for var, value in GUI_INPUT[name].items():
+            getattr(ui, var).set(value)
+
+        def switch(name=name):
+            app.show_calculator(name)
+            root.update_idletasks()
+            app.back_to_mainMenu()
+            root.update_idletasks()
+        yield f"gui.switch[{name}]", "gui", switch, 1
+
+        def calculate(name=name, run=getattr(app, handler)):
+            app.show_calculator(name)
+            if run() is None:
+                raise RuntimeError(f"{name}: calculate handler rejected the benchmark input")
+            root.update_idletasks()
+        yield f"gui.calculate[{name}]", "gui", calculate, 1
+
+        # live mode: a digit typed and deleted again, each recalculated as on a slow touchscreen
+        field = next(iter(GUI_INPUT[name]))
+        def keystroke(name=name, var=getattr(ui, field), value=GUI_INPUT[name][field]):
+            app.live_var.set(True)
+            for text in (value + "1", value):
+                var.set(text)
+                app.flush_live()
+            root.update_idletasks()
+            app.live_var.set(False)
+        yield f"gui.keystroke[{name}]", "gui", keystroke, 2
+    print(f"live mode: {app.redraws_per_edit():.2f} label redraws per keystroke", file=sys.stderr)
+
+    # on-screen keypad: tap an entry (keypad shown under it), then dismiss it
+    field = app.eGFR_ui.creatinine_field
+    def numpad():
+        field.open_numpad(field.entry)
+        root.update_idletasks()
+        root.numpad_popup.close_popup()
+        root.update_idletasks()
+    app.show_calculator("eGFR")
+    yield "gui.numpad", "gui", numpad, 1
+
+# -----------------------
+# Timing and reporting
+# -----------------------
+def measure(func, repeat=5, min_time=0.2):
+    """Returns (best, median) seconds per call over `repeat` runs of an autoranged loop."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    runs = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return min(runs), statistics.median(runs), number
+
+
+def run_cases(cases, selected, repeat, results):
+    for name, group, func, rows in cases:
+        if selected and not any(s in name for s in selected):
+            continue
+        best, median, number = measure(func, repeat)
+        results[name] = {"group": group, "ns_per_op": best * 1e9, "median_ns": median * 1e9,
+                         "rows": rows, "ns_per_row": best * 1e9 / rows, "number": number, "repeat": repeat}
+        print(f"{name:<44} {best * 1e9:>14,.0f} ns/op {best * 1e9 / rows:>10,.1f} ns/row", flush=True)
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of every case against the baseline; returns the names that regressed."""
+    regressions = []
+    print(f"\n{'case':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, current in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f"{name:<44} {'-':>12} {current['ns_per_op']:>12,.0f} {'new':>8}")
+            continue
+        change = current["ns_per_op"] / old["ns_per_op"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<44} {old['ns_per_op']:>12,.0f} {current['ns_per_op']:>12,.0f} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the ChemCalc formulas and GUI.")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slow-down counted as a regression (default 0.10)")
+    parser.add_argument("--filter", action="append", help="only cases whose name contains this text; repeatable")
+    parser.add_argument("--rows", type=int, default=BATCH_ROWS, help="rows per batch call")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-gui", action="store_true", help="skip the GUI cases")
+    args = parser.parse_args(argv)
+
+    results = {}
+    run_cases(formula_cases(args.rows), args.filter, args.repeat, results)
+
+    gui = "disabled" if args.no_gui else "skipped: no display and Xvfb not found"
+    if not args.no_gui:
+        ok, xvfb = start_virtual_display()
+        try:
+            if ok:
+                import tkinter as tk
+                root = tk.Tk()
+                root.geometry("720x840")
+                try:
+                    run_cases(gui_cases(root), args.filter, args.repeat, results)
+                    gui = "ran"
+                finally:
+                    root.destroy()
+        finally:
+            if xvfb:
+                xvfb.terminate()
+    if gui != "ran":
+        print(f"GUI cases {gui}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "batch_rows": args.rows,
+            "gui": gui,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+# cache.py
+# Opt-in memoization in front of the calculation engine.
+# Inputs are normalised before lookup (values converted to canonical units, sex
+# canonicalised the way the formulas read it), so values that convert to the same
+# canonical number share an entry: 88.4 µmol/L and 1 mg/dL of creatinine do, but
+# 80 µmol/L (0.90498 mg/dL) and 0.905 mg/dL do not. Keys are not rounded, so a hit is
+# always the result the inputs themselves give. Entries are engine.Result objects, so a
+# hit skips both the formula and the interpretation. Treat returned Results as read-only: the
+# same object is handed to every caller that hits the entry.
+import threading
+from collections import OrderedDict
+
+import engine
+import formulas
+import units
+
+DEFAULT_MAXSIZE = 4096
+
+
+class LRUCache:
+    """Thread-safe bounded mapping with least-recently-used eviction and hit/miss/eviction counters."""
+    _MISSING = object()
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, self._MISSING)
+            if value is self._MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class CachedEngine:
+    """
+    Same functions as engine.py, memoised. Use an instance wherever the engine module
+    is used, e.g. ChemCalc(root, calc_engine=CachedEngine()).
+    """
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.cache = LRUCache(maxsize)
+
+    def _cached(self, key, calc, *args, **kwargs):
+        result = self.cache.get(key)
+        if result is None:
+            # computed outside the lock; two threads missing together both compute
+            result = calc(*args, **kwargs)
+            self.cache.put(key, result)
+        return result
+
+    def stats(self):
+        return self.cache.stats()
+
+    def clear(self):
+        self.cache.clear()
+
+    # ---------- kidney function ----------
+    def egfr(self, creat_value, creat_unit, age, sex, adjust_to_bsa=False, weight=None, weight_unit="kg", height=None, height_unit="cm"):
+        adjust_to_bsa = bool(adjust_to_bsa)
+        key = ("egfr",
+               units.to_canonical(formulas._to_float(creat_value), "creatinine", creat_unit),
+               formulas._to_float(age), formulas._sex(sex), adjust_to_bsa,
+               units.to_canonical(formulas._to_float(weight), "weight", weight_unit) if adjust_to_bsa else None,
+               units.to_canonical(formulas._to_float(height), "height", height_unit) if adjust_to_bsa else None)
+        return self._cached(key, engine.egfr, creat_value, creat_unit, age, sex, adjust_to_bsa, weight, weight_unit, height, height_unit)
+
+    def pediatric_egfr(self, creat_value, creat_unit, age, sex, height, height_unit="cm"):
+        key = ("pediatric_egfr",
+               units.to_canonical(formulas._to_float(creat_value), "creatinine", creat_unit),
+               formulas._to_float(age), formulas._sex(sex),
+               units.to_canonical(formulas._to_float(height), "height", height_unit))
+        return self._cached(key, engine.pediatric_egfr, creat_value, creat_unit, age, sex, height, height_unit)
+
+    def uacr(self, alb_value, albumin_unit, creat_value, creat_unit):
+        key = ("uacr",
+               units.to_canonical(formulas._to_float(alb_value), "albumin", albumin_unit),
+               units.to_canonical(formulas._to_float(creat_value), "creatinine", creat_unit))
+        return self._cached(key, engine.uacr, alb_value, albumin_unit, creat_value, creat_unit)
+
+    # ---------- osmolality ----------
+    def urine_osm(self, na, k, urea_value, urea_unit, glucose_value, glucose_unit):
+        key = ("urine_osm", formulas._to_float(na), formulas._to_float(k),
+               units.to_canonical(formulas._to_float(urea_value), "urea", urea_unit),
+               units.to_canonical(formulas._to_float(glucose_value), "glucose", glucose_unit))
+        return self._cached(key, engine.urine_osm, na, k, urea_value, urea_unit, glucose_value, glucose_unit)
+
+    def serum_osm(self, na, k, glucose_value, glucose_unit, urea_value, urea_unit):
+        key = ("serum_osm", formulas._to_float(na), formulas._to_float(k),
+               units.to_canonical(formulas._to_float(glucose_value), "glucose", glucose_unit),
+               units.to_canonical(formulas._to_float(urea_value), "urea", urea_unit))
+        return self._cached(key, engine.serum_osm, na, k, glucose_value, glucose_unit, urea_value, urea_unit)
+
+    # ---------- lipids ----------
+    def ldl(self, tc, tc_unit, tg, tg_unit, hdl, hdl_unit):
+        # the result is reported in the HDL unit, so its code is part of the key
+        key = ("ldl",
+               units.to_canonical(formulas._to_float(tc), "TC", tc_unit),
+               units.to_canonical(formulas._to_float(tg), "TG", tg_unit),
+               units.to_canonical(formulas._to_float(hdl), "HDL", hdl_unit),
+               units.resolve("HDL", hdl_unit).code)
+        return self._cached(key, engine.ldl, tc, tc_unit, tg, tg_unit, hdl, hdl_unit)
+
+    def hdl(self, tc, tc_unit, tg, tg_unit, ldl, ldl_unit):
+        key = ("hdl",
+               units.to_canonical(formulas._to_float(tc), "TC", tc_unit),
+               units.to_canonical(formulas._to_float(tg), "TG", tg_unit),
+               units.to_canonical(formulas._to_float(ldl), "LDL", ldl_unit),
+               units.resolve("LDL", ldl_unit).code)
+        return self._cached(key, engine.hdl, tc, tc_unit, tg, tg_unit, ldl, ldl_unit)
@@ -0,0 +1,153 @@
+# engine.py
+# Tk-free calculation engine.
+# Each function converts its inputs once (through units.py), runs the formula from
+# formulas.py on the canonical values, interprets the result and returns a Result.
+# The GUI only renders Results; servers and batch jobs can use the same functions.
+# Invalid input raises ValueError, as in formulas.py.
+# Equation traces are rendered from the formula specs in specs.py, so a trace always shows
+# the constants the formula actually used; they are only built when first read.
+import formulas
+import interpretation
+import specs
+import units
+
+
+class Result:
+    """
+    value/unit: the calculated result and its unit
+    category/severity/message: interpretation (severity is the bootstyle colour)
+    intermediates: inputs converted to canonical units, keyed by name (e.g. "scr_mgdl")
+    equation: human-readable trace of the calculation (a string, or a function returning
+              it, called the first time the trace is read)
+    warnings: messages the user should see in addition to the result
+    """
+    __slots__ = ("label", "value", "unit", "digits", "category", "severity", "message",
+                 "intermediates", "_equation", "warnings")
+
+    def __init__(self, label, value, unit, digits, category, severity, message, intermediates, equation, warnings=()):
+        self.label = label
+        self.value = value
+        self.unit = unit
+        self.digits = digits
+        self.category = category
+        self.severity = severity
+        self.message = message
+        self.intermediates = intermediates
+        self._equation = equation
+        self.warnings = list(warnings)
+
+    @property
+    def equation(self):
+        if callable(self._equation):
+            self._equation = self._equation()
+        return self._equation
+
+    def text(self):
+        return f"{self.label}: {self.value:.{self.digits}f} {self.unit}"
+
+    def interpretation_text(self):
+        return f"{self.category}\n{self.message}" if self.message else self.category
+
+    def __repr__(self):
+        return f"Result({self.label}={self.value!r} {self.unit}, category={self.category!r})"
+
+
+def _result(label, value, unit, digits, interpreted, intermediates, equation, warnings=()):
+    category, severity, message = interpreted
+    return Result(label, value, unit, digits, category, severity, message, intermediates, equation, warnings)
+
+
+def _trace(spec, inputs, value, digits, unit):
+    """Deferred spec.trace for a Result: `inputs` are the spec's inputs, in canonical units."""
+    return lambda: spec.trace(inputs, f"{value:.{digits}f} {unit}")
+
+# -----------------------
+# Kidney function
+# -----------------------
+def egfr(creat_value, creat_unit, age, sex, adjust_to_bsa=False, weight=None, weight_unit="kg", height=None, height_unit="cm"):
+    scr_mgdl = units.to_canonical(formulas._to_float(creat_value), "creatinine", creat_unit)
+    age = formulas._to_float(age)
+    inter = {"scr_mgdl": scr_mgdl, "age": age}
+    if adjust_to_bsa:
+        inter["height_cm"] = units.to_canonical(formulas._to_float(height), "height", height_unit)
+        inter["weight_kg"] = units.to_canonical(formulas._to_float(weight), "weight", weight_unit)
+    value = formulas.egfr_ckdepi2021(scr_mgdl, "mg/dL", age=age, sex=sex.lower(), adjust_to_bsa=adjust_to_bsa,
+                                     weight_kg=inter.get("weight_kg"), height_cm=inter.get("height_cm"))
+    # adjust_to_bsa de-normalises to an absolute GFR
+    unit = "mL/min" if adjust_to_bsa else "mL/min/1.73 m²"
+    spec = specs.EGFR_CKDEPI2021_BSA if adjust_to_bsa else specs.EGFR_CKDEPI2021
+    equation = _trace(spec, dict(inter, female=sex.lower() == "female"), value, 1, unit)
+    return _result("eGFR", value, unit, 1, interpretation.interpret_egfr(value), inter, equation)
+
+
+def pediatric_egfr(creat_value, creat_unit, age, sex, height, height_unit="cm"):
+    scr_mgdl = units.to_canonical(formulas._to_float(creat_value), "creatinine", creat_unit)
+    height_cm = units.to_canonical(formulas._to_float(height), "height", height_unit)
+    age = formulas._to_float(age)
+    value = formulas.calc_pediatric_egfr(height=height_cm, age_var=age, sex=sex.lower(), creat_value=scr_mgdl, creat_unit="mg/dL")
+    inter = {"scr_mgdl": scr_mgdl, "height_cm": height_cm, "age": age}
+    equation = _trace(specs.PEDIATRIC_EGFR, dict(inter, male=sex.lower() == "male"), value, 1, "mL/min/1.73m²")
+    return _result("eGFR", value, "mL/min/1.73m²", 1, interpretation.interpret_pediatric_egfr(value, age), inter, equation)
+
+
+def uacr(alb_value, albumin_unit, creat_value, creat_unit):
+    alb_mgdl = units.to_canonical(formulas._to_float(alb_value), "albumin", albumin_unit)
+    creat_mgdl = units.to_canonical(formulas._to_float(creat_value), "creatinine", creat_unit)
+    value = formulas.calc_uacr(alb_mgdl, "mg/dL", creat_mgdl, "mg/dL")
+    inter = {"alb_mgdl": alb_mgdl, "creat_mgdl": creat_mgdl}
+    equation = _trace(specs.UACR, inter, value, 2, "mg/g")
+    return _result("UACR", value, "mg/g", 2, interpretation.interpret_uacr(value), inter, equation)
+
+# -----------------------
+# Osmolality
+# -----------------------
+def urine_osm(na, k, urea_value, urea_unit, glucose_value, glucose_unit):
+    na = formulas._to_float(na)
+    k = formulas._to_float(k)
+    urea_mgdl = units.to_canonical(formulas._to_float(urea_value), "urea", urea_unit)
+    glucose_mgdl = units.to_canonical(formulas._to_float(glucose_value), "glucose", glucose_unit)
+    value = formulas.calc_urine_osm(na=na, k=k, urea_value=urea_mgdl, urea_unit="mg/dL", glucose_value=glucose_mgdl, glucose_unit="mg/dL")
+    inter = {"na": na, "k": k, "urea_mgdl": urea_mgdl, "glucose_mgdl": glucose_mgdl}
+    equation = _trace(specs.URINE_OSM, inter, value, 1, "mOsm/kg")
+    return _result("Uosm", value, "mOsm/kg", 1, interpretation.interpret_urine_osm(value), inter, equation)
+
+
+def serum_osm(na, k, glucose_value, glucose_unit, urea_value, urea_unit):
+    na = formulas._to_float(na)
+    k = formulas._to_float(k)
+    glucose_mgdl = units.to_canonical(formulas._to_float(glucose_value), "glucose", glucose_unit)
+    urea_mgdl = units.to_canonical(formulas._to_float(urea_value), "urea", urea_unit)
+    value = formulas.calc_serum_osm(na=na, k=k, glucose_value=glucose_mgdl, glucose_unit="mg/dL", urea_value=urea_mgdl, urea_unit="mg/dL")
+    inter = {"na": na, "k": k, "glucose_mgdl": glucose_mgdl, "urea_mgdl": urea_mgdl}
+    equation = _trace(specs.SERUM_OSM, inter, value, 2, "mOsm/kg")
+    return _result("Serum Osm", value, "mOsm/kg", 2, interpretation.interpret_serum_osm(value), inter, equation)
+
+# -----------------------
+# Lipids
+# -----------------------
+def ldl(tc, tc_unit, tg, tg_unit, hdl, hdl_unit):
+    tc_mg = units.to_canonical(formulas._to_float(tc), "TC", tc_unit)
+    tg_mg = units.to_canonical(formulas._to_float(tg), "TG", tg_unit)
+    hdl_mg = units.to_canonical(formulas._to_float(hdl), "HDL", hdl_unit)
+    non_hdl_mg = tc_mg - hdl_mg
+    ldl_mg = formulas.calc_ldl_sampson(tc_mg, "mg/dL", tg_mg, "mg/dL", hdl_mg, "mg/dL")
+    # reported in the HDL unit, interpreted in mg/dL (the unit of the cut-offs)
+    value = units.from_canonical(ldl_mg, "LDL", hdl_unit)
+    inter = {"tc_mgdl": tc_mg, "tg_mgdl": tg_mg, "hdl_mgdl": hdl_mg, "non_hdl_mgdl": non_hdl_mg, "ldl_mgdl": ldl_mg}
+    equation = _trace(specs.LDL_SAMPSON, inter, value, 2, hdl_unit)
+    return _result("LDL", value, hdl_unit, 2, interpretation.interpret_ldl(ldl_mg), inter, equation)
+
+
+def hdl(tc, tc_unit, tg, tg_unit, ldl, ldl_unit):
+    tc_mg = units.to_canonical(formulas._to_float(tc), "TC", tc_unit)
+    tg_mg = units.to_canonical(formulas._to_float(tg), "TG", tg_unit)
+    ldl_mg = units.to_canonical(formulas._to_float(ldl), "LDL", ldl_unit)
+    hdl_mg = formulas.calc_hdl_from_sampson(tc_mg, "mg/dL", tg_mg, "mg/dL", ldl_mg, "mg/dL")
+    # reported in the LDL unit, interpreted in mg/dL (the unit of the cut-offs)
+    value = units.from_canonical(hdl_mg, "HDL", ldl_unit)
+    warnings = []
+    if value < 0:
+        warnings.append("Estimated HDL negative — value likely invalid. Direct measurement recommended.")
+    inter = {"tc_mgdl": tc_mg, "tg_mgdl": tg_mg, "ldl_mgdl": ldl_mg, "hdl_mgdl": hdl_mg}
+    equation = _trace(specs.HDL_FROM_SAMPSON, inter, value, 1, ldl_unit)
+    return _result("HDL", value, ldl_unit, 1, interpretation.interpret_hdl(hdl_mg), inter, equation, warnings)
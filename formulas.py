@@ -1,5 +1,6 @@
 # formulas.py
-import math
+import specs
+import units
 
 # -----------------------
 # Conversion constants
@@ -41,20 +42,10 @@ def cm_from_m(m):
     return m * 100.0
 
 def lipid_to_mgdl(value, unit, analyte):
-    if unit == "mmol/L":
-        if analyte in ("TC", "LDL", "HDL"):
-            return value * 38.67
-        elif analyte == "TG":
-            return value * 88.57
-    return value
+    return units.to_canonical(value, analyte, unit)
 
 def lipid_from_mgdl(value, unit, analyte):
-    if unit == "mmol/L":
-        if analyte in ("TC", "LDL", "HDL"):
-            return value / 38.67
-        elif analyte == "TG":
-            return value / 88.57
-    return value
+    return units.from_canonical(value, analyte, unit)
 
 # Utility: normalize numeric input
 def _to_float(value):
@@ -65,37 +56,31 @@ def _to_float(value):
     except Exception:
         raise ValueError("Invalid numeric input")
 
+# Utility: "male" or "female" in any case; anything else (None, "", "other") is rejected
+def _sex(value):
+    sex = value.lower() if isinstance(value, str) else None
+    if sex not in ("male", "female"):
+        raise ValueError("Sex must be male or female")
+    return sex
+
 # -----------------------
 # 1) CKD-EPI (2021, race-free) — creatinine must be in mg/dL
 #    Returns eGFR in mL/min/1.73m2 (normalized). If adjust_to_bsa=True returns absolute mL/min.
 # -----------------------
 def egfr_ckdepi2021(creat_value, creat_unit="umol/L", age=40, sex="male", adjust_to_bsa=False, weight_kg=None, height_cm=None):
     # convert creat to mg/dL
-    if creat_unit.lower() in ("umol/l", "umol", "µmol/l", "µmol"):
-        scr_mgdl = creat_umoll_to_mgdl(_to_float(creat_value))
-    elif creat_unit.lower() in ("mg/dl", "mg/dl".lower()):
-        scr_mgdl = _to_float(creat_value)
-    else:
-        raise ValueError("Unsupported creatinine unit")
+    scr_mgdl = units.to_canonical(_to_float(creat_value), "creatinine", creat_unit)
 
     age = float(age)
-    sex = sex.lower()
-
-    # CKD-EPI 2021 constants (race-free)
-    kappa = 0.7 if sex == "female" else 0.9
-    alpha = -0.241 if sex == "female" else -0.302
-    sex_factor = 1.012 if sex == "female" else 1.0
-    # formula:
-    x = scr_mgdl / kappa
-    egfr = 142 * (min(x, 1) ** alpha) * (max(x, 1) ** -1.200) * (0.9938 ** age) * sex_factor
+    female = _sex(sex) == "female"
+
+    # CKD-EPI 2021 constants (race-free) and formula: specs.EGFR_CKDEPI2021
     if adjust_to_bsa:
         if weight_kg is None or height_cm is None:
             raise ValueError("weight and height required for BSA adjustment")
         # Mosteller BSA
-        bsa = math.sqrt((height_cm * weight_kg) / 3600.0)
-        egfr_absolute = egfr * (bsa / 1.73)
-        return round(egfr_absolute, 2)
-    return round(egfr, 2)
+        return specs.EGFR_CKDEPI2021_BSA.scalar(scr_mgdl, age, female, height_cm, weight_kg)
+    return specs.EGFR_CKDEPI2021.scalar(scr_mgdl, age, female)
 
 # -----------------------
 # 2) Cockcroft-Gault (alternative) — returns CrCl in mL/min optionally normalized to 1.73m2
@@ -103,66 +88,31 @@ def egfr_ckdepi2021(creat_value, creat_unit="umol/L", age=40, sex="male", adjust
 def cockcroft_gault(age, weight_kg, creat_value, creat_unit="mg/dL", sex="male", normalize_to_bsa=False, height_cm=None):
     age = float(age)
     weight_kg = float(weight_kg)
-    sex = sex.lower()
+    female = _sex(sex) == "female"
 
-    if creat_unit.lower() in ("umol/l", "umol", "µmol/l", "µmol"):
-        scr_mgdl = creat_umoll_to_mgdl(_to_float(creat_value))
-    else:
-        scr_mgdl = _to_float(creat_value)
+    scr_mgdl = units.to_canonical(_to_float(creat_value), "creatinine", creat_unit)
 
-    crcl = ((140 - age) * weight_kg) / (72.0 * scr_mgdl)
-    if sex == "female":
-        crcl *= 0.85
     if normalize_to_bsa:
         if height_cm is None:
             raise ValueError("height required for BSA normalization")
-        bsa = math.sqrt((height_cm * weight_kg) / 3600.0)
-        crcl_norm = crcl * (1.73 / bsa)
-        return round(crcl_norm, 2)
-    return round(crcl, 2)
+        return specs.COCKCROFT_GAULT_BSA.scalar(age, weight_kg, scr_mgdl, female, height_cm)
+    return specs.COCKCROFT_GAULT.scalar(age, weight_kg, scr_mgdl, female)
 
 # -----------------------
 # 3) Pediatric eGFR (Schwartz) — expects height in cm, creatinine in mg/dL
 # -----------------------
 def egfr_schwartz(height_cm, creat_value, creat_unit="mg/dL"):
     height_cm = float(height_cm)
-    if creat_unit.lower() in ("umol/l", "umol", "µmol/l", "µmol"):
-        scr_mgdl = creat_umoll_to_mgdl(_to_float(creat_value))
-    else:
-        scr_mgdl = _to_float(creat_value)
-
-    if scr_mgdl <= 0 or height_cm <= 0:
-        raise ValueError("Height and creatinine must be positive numbers.")
-
-    k = 0.413  # bedside Schwartz (k=0.413) commonly used
-    egfr = (k * height_cm) / scr_mgdl
-    return round(egfr, 2)
+    scr_mgdl = units.to_canonical(_to_float(creat_value), "creatinine", creat_unit)
+    # bedside Schwartz (k=0.413) commonly used
+    return specs.EGFR_SCHWARTZ.scalar(height_cm, scr_mgdl)
 
 
 def calc_pediatric_egfr(height, age_var, sex, creat_value, creat_unit="mg/dL"):
         height_cm = _to_float(height)
-        if creat_unit.lower() in ("umol/l", "umol", "µmol/l", "µmol"):
-            scr_mgdl = creat_umoll_to_mgdl(_to_float(creat_value))
-        else:
-            scr_mgdl = _to_float(creat_value)
-        #flags
-        if scr_mgdl <= 0 or height_cm <= 0:
-            raise ValueError("Height and creatinine must be positive numbers.")
-       
-        # Determine constant k based on age and gender
-        if age_var < 1:
-            k = 0.45
-        elif 1 <= age_var < 13:
-            k = 0.55
-        elif age_var >= 13 and sex.lower() == "male":
-            k = 0.70
-        elif age_var >= 13 and sex.lower() == "female":
-            k = 0.55
-        else:
-            k = 0.55  # fallback
-
-        egfr = (k * height_cm) / scr_mgdl
-        return round(egfr, 2)
+        scr_mgdl = units.to_canonical(_to_float(creat_value), "creatinine", creat_unit)
+        # constant k from age and sex: specs.PEDIATRIC_EGFR
+        return specs.PEDIATRIC_EGFR.scalar(height_cm, age_var, _sex(sex) == "male", scr_mgdl)
      
 # -----------------------
 # 4) UACR (mg/g) — accepts albumin in mg/L or mg/dL; creatinine in mg/dL
@@ -173,22 +123,13 @@ def calc_uacr(alb_value, albumin_unit, creat_value, creat_unit="mg/dL"):
     Returns UACR in mg/g
     """
     # Albumin → mg/dL
-    if albumin_unit.lower() in ("mg/l", "mg/L"):
-        albumin_mg_dl = mgl_to_mgdl(_to_float(alb_value))
-    else:
-        albumin_mg_dl = _to_float(alb_value)
+    albumin_mg_dl = units.to_canonical(_to_float(alb_value), "albumin", albumin_unit)
 
     # Creatinine → mg/dL
-    if creat_unit.lower() in ("umol/l", "umol", "µmol/l", "µmol"):
-        creatinine_mg_dl = creat_umoll_to_mgdl(_to_float(creat_value))
-    elif creat_unit.lower() in ("mg/l", "mg/L"):
-        creatinine_mg_dl = mgl_to_mgdl(_to_float(creat_value))
-    else:
-        creatinine_mg_dl = _to_float(creat_value)
+    creatinine_mg_dl = units.to_canonical(_to_float(creat_value), "creatinine", creat_unit)
 
     # UACR mg/g
-    uacr = (albumin_mg_dl / creatinine_mg_dl) * 1000
-    return round(uacr, 2)
+    return specs.UACR.scalar(albumin_mg_dl, creatinine_mg_dl)
 
 # -----------------------
 # 5) Serum Osmolality (mOsm/kg) — urea in mg/dL or mmol/L, glucose in mg/dL or mmol/L
@@ -198,22 +139,15 @@ def calc_uacr(alb_value, albumin_unit, creat_value, creat_unit="mg/dL"):
 def calc_serum_osm(na, k, glucose_value, glucose_unit="mg/dL", urea_value=None, urea_unit="mg/dL"):
     na = float(na)
     k = float(k)
-    if glucose_unit.lower() in ("mmol/l", "mmol"):
-        glucose_mgdl = glucose_mmol_to_mgdl(_to_float(glucose_value))
-    else:
-        glucose_mgdl = _to_float(glucose_value)
+    glucose_mgdl = units.to_canonical(_to_float(glucose_value), "glucose", glucose_unit)
 
     if urea_value is None or urea_value == "":
         # If urea omitted, assume 0
         urea_mgdl = 0.0
     else:
-        if urea_unit.lower() in ("mmol/l", "mmol"):
-            urea_mgdl = urea_mmol_to_mgdl(_to_float(urea_value))
-        else:
-            urea_mgdl = _to_float(urea_value)
+        urea_mgdl = units.to_canonical(_to_float(urea_value), "urea", urea_unit)
 
-    osm = 2.0 * (na + k) + (glucose_mgdl / 18.0) + (urea_mgdl / 6.006)
-    return round(osm, 2)
+    return specs.SERUM_OSM.scalar(na, k, glucose_mgdl, urea_mgdl)
 
 # -----------------------
 # 6) Urine Osmolality estimate (mOsm/kg) — sodium,k in mmol/L, urea mg/dL, glucose mg/dL
@@ -222,18 +156,11 @@ def calc_serum_osm(na, k, glucose_value, glucose_unit="mg/dL", urea_value=None,
 def calc_urine_osm(na, k, urea_value, urea_unit="mg/dL", glucose_value=0.0, glucose_unit="mg/dL"):
     na = float(na)
     k = float(k)
-    if glucose_unit.lower() in ("mmol/l", "mmol"):
-        glucose_mgdl = glucose_mmol_to_mgdl(_to_float(glucose_value))
-    else:
-        glucose_mgdl = _to_float(glucose_value)
+    glucose_mgdl = units.to_canonical(_to_float(glucose_value), "glucose", glucose_unit)
 
-    if urea_unit.lower() in ("mmol/l", "mmol"):
-        urea_mgdl = urea_mmol_to_mgdl(_to_float(urea_value))
-    else:
-        urea_mgdl = _to_float(urea_value)
+    urea_mgdl = units.to_canonical(_to_float(urea_value), "urea", urea_unit)
 
-    osm = 2.0 * (na + k) + (urea_mgdl / 6.006) + (glucose_mgdl / 18.0)
-    return round(osm, 1)
+    return specs.URINE_OSM.scalar(na, k, urea_mgdl, glucose_mgdl)
 
 # -----------------------
 # 7) Sampson LDL formula 
@@ -245,15 +172,8 @@ def calc_ldl_sampson(tc, tc_unit, tg, tg_unit, hdl, hdl_unit):
     tg_mg = lipid_to_mgdl(_to_float(tg), tg_unit, "TG")
     hdl_mg = lipid_to_mgdl(_to_float(hdl), hdl_unit, "HDL")
 
-    if tg_mg > 800:
-        raise ValueError("Triglycerides too high for Sampson equation")
-
-    #ldl_mg = (tc_mg / (1 + 0.16 * tg_mg / 100) - hdl_mg - (tg_mg / 8.9) + (tg_mg * tc_mg / 2140) - (tg_mg ** 2 / 16100) )
-    non_hdl = tc_mg - hdl_mg
-    ldl_mg = (tc_mg/0.948) - (hdl_mg/0.971) - ((tg_mg/8.56) + (tg_mg * non_hdl/2140) - ((tg_mg * tc_mg)/16100)) - 9.44
-#    ldl_mg = tc_mg - hdl_mg - (tg_mg / 6.85) + ((tg_mg * non_hdl) / 2600)
-
-
+    # raises ValueError when TG > 800 mg/dL
+    ldl_mg = specs.LDL_SAMPSON.scalar(tc_mg, tg_mg, hdl_mg)
     return lipid_from_mgdl(ldl_mg, hdl_unit, "LDL")
 
 # -----------------------
@@ -266,31 +186,18 @@ def calc_hdl_from_sampson(tc_val, tc_unit, tg_val, tg_unit, ldl_val, ldl_unit):
     tg_mg = lipid_to_mgdl(_to_float(tg_val), tg_unit, "TG")
     ldl_mg = lipid_to_mgdl(_to_float(ldl_val), ldl_unit, "LDL")
 
-    if tg_mg > 800:
-        raise ValueError("Triglycerides too high for Sampson equation")
-
-   # hdl_mg = (tc_mg - ldl_mg - (tg_mg / 8.9) + (tg_mg * tc_mg / 2140) - (tg_mg ** 2 / 16100))
-
-    numerator = (ldl_mg - (tc_mg / 0.948) + (tg_mg / 8.56) + (tg_mg * tc_mg / 2140) - (tg_mg ** 2 / 16100) + 9.44)
-    denominator = (tg_mg / 2140) - (1 / 0.971)
-    if abs(denominator) < 1e-6:
-        raise ValueError("Unstable Sampson HDL calculation (denominator ≈ 0)")
-    hdl_mg = numerator / denominator
-
+    # raises ValueError when TG > 800 mg/dL or the denominator is ~0
+    hdl_mg = specs.HDL_FROM_SAMPSON.scalar(tc_mg, tg_mg, ldl_mg)
     return lipid_from_mgdl(hdl_mg, ldl_unit, "HDL")
 
 # -----------------------
 # 9) BMI helper
 # -----------------------
 def calc_bmi(weight_kg, height_cm):
-    w = _to_float(weight_kg)
-    h_m = _to_float(height_cm) / 100.0
-    if h_m <= 0:
-        raise ValueError("Height must be > 0")
-    return round(w / (h_m * h_m), 1)
+    return specs.BMI.scalar(_to_float(weight_kg), _to_float(height_cm))
 
 def calculate_bsa(weight_kg, height_cm):
     """
     Du Bois formula
     """
-    return 0.007184 * (weight_kg ** 0.425) * (height_cm ** 0.725)
+    return specs.BSA_DUBOIS.scalar(weight_kg, height_cm)
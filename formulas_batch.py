@@ -0,0 +1,257 @@
+# formulas_batch.py
+# Array counterparts of the calculators in formulas.py.
+#
+# Every *_batch function accepts NumPy arrays (or anything np.asarray understands)
+# for the per-row values and plain strings for the units, which are resolved once
+# per column. Rows the scalar version would reject (empty / non-numeric input,
+# non-positive height, TG > 800, ...) come back as NaN instead of raising, so one
+# bad result does not abort a whole batch. An unsupported unit still raises
+# ValueError, exactly like the scalar functions.
+import numpy as np
+
+import formulas
+import specs
+import units
+
+# -----------------------
+# Input helpers
+# -----------------------
+def _column(values):
+    """Converts a column to a float64 array; invalid entries become NaN."""
+    try:
+        return np.asarray(values, dtype=float)
+    except (TypeError, ValueError):
+        pass
+    out = []
+    for v in np.asarray(values, dtype=object).ravel():
+        try:
+            out.append(formulas._to_float(v))
+        except ValueError:
+            out.append(np.nan)
+    return np.array(out, dtype=float).reshape(np.shape(values))
+
+
+def _optional_column(values):
+    """_column for an optional argument: omitted entries (None, "") read as 0.0, as in the scalar formula."""
+    if values is None or (isinstance(values, str) and values == ""):
+        return np.float64(0.0)
+    column = np.asarray(values)
+    if column.dtype.kind in "biuf":
+        return column.astype(float)
+    column = column.astype(object)
+    omitted = np.frompyfunc(lambda v: v is None or (isinstance(v, str) and v == ""), 1, 1)(column).astype(bool)
+    return _column(np.where(omitted, 0.0, column))
+
+
+def _sex_is(sex, value):
+    if isinstance(sex, str):
+        return np.bool_(sex.lower() == value)
+    return np.char.lower(np.asarray(sex, dtype=str)) == value
+
+
+def _sex_flags(sex):
+    """
+    (female, unknown) masks. Rows that are neither "male" nor "female" in any case (None,
+    NaN, "", other text) are unknown: the scalar formulas reject them.
+    """
+    if isinstance(sex, str):
+        lower = sex.lower()
+        return np.bool_(lower == "female"), np.bool_(lower not in ("male", "female"))
+    lower = np.char.lower(np.asarray(sex, dtype=str))
+    female = lower == "female"
+    return female, ~female & (lower != "male")
+
+
+def _reject(values, invalid):
+    """Sets the rows where `invalid` is true to NaN; returns `values`."""
+    values[np.broadcast_to(invalid, values.shape)] = np.nan
+    return values
+
+
+def _finish(raw, invalid=None):
+    raw = np.array(raw, dtype=float)
+    if invalid is not None:
+        raw[invalid] = np.nan
+    raw[~np.isfinite(raw)] = np.nan
+    return raw
+
+
+def _round_like_scalar(raw, ndigits, scalar_row):
+    """
+    np.round and the vectorised pow can disagree with Python's round()/pow by one
+    ulp, which only matters when a value sits on a rounding half-way point. Those
+    few rows are recomputed with the scalar formula so every row matches exactly.
+    """
+    out = np.round(raw, ndigits)
+    scaled = raw * 10.0 ** ndigits
+    with np.errstate(invalid="ignore"):
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_half):
+        out.flat[i] = scalar_row(i)
+    return out
+
+
+# -----------------------
+# 1) CKD-EPI 2021
+# -----------------------
+def egfr_ckdepi2021_batch(creat_value, creat_unit="umol/L", age=40, sex="male", adjust_to_bsa=False, weight_kg=None, height_cm=None):
+    creat = _column(creat_value)
+    age = _column(age)
+    female, unknown_sex = _sex_flags(sex)
+    if adjust_to_bsa:
+        if weight_kg is None or height_cm is None:
+            raise ValueError("weight and height required for BSA adjustment")
+        weight_kg = _column(weight_kg)
+        height_cm = _column(height_cm)
+        creat, age, female, weight_kg, height_cm = np.broadcast_arrays(creat, age, female, weight_kg, height_cm)
+    else:
+        creat, age, female = np.broadcast_arrays(creat, age, female)
+
+    scr_mgdl = units.to_canonical(creat, "creatinine", creat_unit)
+    if adjust_to_bsa:
+        egfr = _finish(*specs.EGFR_CKDEPI2021_BSA.vector(scr_mgdl, age, female, height_cm, weight_kg))
+    else:
+        egfr = _finish(*specs.EGFR_CKDEPI2021.vector(scr_mgdl, age, female))
+
+    def scalar_row(i):
+        return formulas.egfr_ckdepi2021(
+            float(creat.flat[i]), creat_unit, age.flat[i], "female" if female.flat[i] else "male",
+            adjust_to_bsa,
+            float(weight_kg.flat[i]) if adjust_to_bsa else None,
+            float(height_cm.flat[i]) if adjust_to_bsa else None,
+        )
+    return _reject(_round_like_scalar(egfr, 2, scalar_row), unknown_sex)
+
+# -----------------------
+# 2) Cockcroft-Gault
+# -----------------------
+def cockcroft_gault_batch(age, weight_kg, creat_value, creat_unit="mg/dL", sex="male", normalize_to_bsa=False, height_cm=None):
+    age = _column(age)
+    weight_kg = _column(weight_kg)
+    creat = _column(creat_value)
+    female, unknown_sex = _sex_flags(sex)
+    if normalize_to_bsa:
+        if height_cm is None:
+            raise ValueError("height required for BSA normalization")
+        height_cm = _column(height_cm)
+        age, weight_kg, creat, female, height_cm = np.broadcast_arrays(age, weight_kg, creat, female, height_cm)
+    else:
+        age, weight_kg, creat, female = np.broadcast_arrays(age, weight_kg, creat, female)
+
+    scr_mgdl = units.to_canonical(creat, "creatinine", creat_unit)
+    if normalize_to_bsa:
+        crcl = _finish(*specs.COCKCROFT_GAULT_BSA.vector(age, weight_kg, scr_mgdl, female, height_cm))
+    else:
+        crcl = _finish(*specs.COCKCROFT_GAULT.vector(age, weight_kg, scr_mgdl, female))
+
+    def scalar_row(i):
+        return formulas.cockcroft_gault(
+            age.flat[i], weight_kg.flat[i], float(creat.flat[i]), creat_unit,
+            "female" if female.flat[i] else "male", normalize_to_bsa,
+            float(height_cm.flat[i]) if normalize_to_bsa else None,
+        )
+    return _reject(_round_like_scalar(crcl, 2, scalar_row), unknown_sex)
+
+# -----------------------
+# 3) Pediatric eGFR (Schwartz)
+# -----------------------
+def egfr_schwartz_batch(height_cm, creat_value, creat_unit="mg/dL"):
+    height_cm, creat = np.broadcast_arrays(_column(height_cm), _column(creat_value))
+    scr_mgdl = units.to_canonical(creat, "creatinine", creat_unit)
+    egfr = _finish(*specs.EGFR_SCHWARTZ.vector(height_cm, scr_mgdl))
+    return _round_like_scalar(egfr, 2, lambda i: formulas.egfr_schwartz(height_cm.flat[i], float(creat.flat[i]), creat_unit))
+
+
+def calc_pediatric_egfr_batch(height, age_var, sex, creat_value, creat_unit="mg/dL"):
+    female, unknown_sex = _sex_flags(sex)
+    male = ~female & ~unknown_sex
+    height_cm, age, male, creat = np.broadcast_arrays(_column(height), _column(age_var), male, _column(creat_value))
+    scr_mgdl = units.to_canonical(creat, "creatinine", creat_unit)
+    egfr = _finish(*specs.PEDIATRIC_EGFR.vector(height_cm, age, male, scr_mgdl))
+
+    def scalar_row(i):
+        return formulas.calc_pediatric_egfr(
+            float(height_cm.flat[i]), float(age.flat[i]), "male" if male.flat[i] else "female",
+            float(creat.flat[i]), creat_unit,
+        )
+    return _reject(_round_like_scalar(egfr, 2, scalar_row), unknown_sex)
+
+# -----------------------
+# 4) UACR (mg/g)
+# -----------------------
+def calc_uacr_batch(alb_value, albumin_unit, creat_value, creat_unit="mg/dL"):
+    alb, creat = np.broadcast_arrays(_column(alb_value), _column(creat_value))
+    albumin_mg_dl = units.to_canonical(alb, "albumin", albumin_unit)
+    creatinine_mg_dl = units.to_canonical(creat, "creatinine", creat_unit)
+    uacr = _finish(*specs.UACR.vector(albumin_mg_dl, creatinine_mg_dl))
+    return _round_like_scalar(uacr, 2, lambda i: formulas.calc_uacr(float(alb.flat[i]), albumin_unit, float(creat.flat[i]), creat_unit))
+
+# -----------------------
+# 5) Serum Osmolality
+# -----------------------
+def calc_serum_osm_batch(na, k, glucose_value, glucose_unit="mg/dL", urea_value=None, urea_unit="mg/dL"):
+    na, k, glucose, urea = np.broadcast_arrays(_column(na), _column(k), _column(glucose_value), _optional_column(urea_value))
+    glucose_mgdl = units.to_canonical(glucose, "glucose", glucose_unit)
+    urea_mgdl = units.to_canonical(urea, "urea", urea_unit)
+    osm = _finish(*specs.SERUM_OSM.vector(na, k, glucose_mgdl, urea_mgdl))
+
+    def scalar_row(i):
+        return formulas.calc_serum_osm(na.flat[i], k.flat[i], float(glucose.flat[i]), glucose_unit, float(urea.flat[i]), urea_unit)
+    return _round_like_scalar(osm, 2, scalar_row)
+
+# -----------------------
+# 6) Urine Osmolality
+# -----------------------
+def calc_urine_osm_batch(na, k, urea_value, urea_unit="mg/dL", glucose_value=0.0, glucose_unit="mg/dL"):
+    na, k, urea, glucose = np.broadcast_arrays(_column(na), _column(k), _column(urea_value), _column(glucose_value))
+    glucose_mgdl = units.to_canonical(glucose, "glucose", glucose_unit)
+    urea_mgdl = units.to_canonical(urea, "urea", urea_unit)
+    osm = _finish(*specs.URINE_OSM.vector(na, k, urea_mgdl, glucose_mgdl))
+
+    def scalar_row(i):
+        return formulas.calc_urine_osm(na.flat[i], k.flat[i], float(urea.flat[i]), urea_unit, float(glucose.flat[i]), glucose_unit)
+    return _round_like_scalar(osm, 1, scalar_row)
+
+# -----------------------
+# 7) Sampson LDL
+# -----------------------
+def calc_ldl_sampson_batch(tc, tc_unit, tg, tg_unit, hdl, hdl_unit):
+    tc_mg, tg_mg, hdl_mg = np.broadcast_arrays(
+        units.to_canonical(_column(tc), "TC", tc_unit),
+        units.to_canonical(_column(tg), "TG", tg_unit),
+        units.to_canonical(_column(hdl), "HDL", hdl_unit),
+    )
+    ldl_mg, too_high = specs.LDL_SAMPSON.vector(tc_mg, tg_mg, hdl_mg)
+    return _finish(units.from_canonical(ldl_mg, "LDL", hdl_unit), too_high)
+
+# -----------------------
+# 8) Reverse Sampson HDL
+# -----------------------
+def calc_hdl_from_sampson_batch(tc_val, tc_unit, tg_val, tg_unit, ldl_val, ldl_unit):
+    """
+    Not rounded; TG² is an exact square here while the scalar uses pow(), so the
+    two may differ in the last ulp.
+    """
+    tc_mg, tg_mg, ldl_mg = np.broadcast_arrays(
+        units.to_canonical(_column(tc_val), "TC", tc_unit),
+        units.to_canonical(_column(tg_val), "TG", tg_unit),
+        units.to_canonical(_column(ldl_val), "LDL", ldl_unit),
+    )
+    hdl_mg, invalid = specs.HDL_FROM_SAMPSON.vector(tc_mg, tg_mg, ldl_mg)
+    return _finish(units.from_canonical(hdl_mg, "HDL", ldl_unit), invalid)
+
+# -----------------------
+# 9) BMI / BSA
+# -----------------------
+def calc_bmi_batch(weight_kg, height_cm):
+    w, h = np.broadcast_arrays(_column(weight_kg), _column(height_cm))
+    bmi = _finish(*specs.BMI.vector(w, h))
+    return _round_like_scalar(bmi, 1, lambda i: formulas.calc_bmi(float(w.flat[i]), float(h.flat[i])))
+
+
+def calculate_bsa_batch(weight_kg, height_cm):
+    """
+    Du Bois formula. Not rounded, so it may differ from calculate_bsa in the last ulp.
+    """
+    w, h = np.broadcast_arrays(_column(weight_kg), _column(height_cm))
+    return _finish(*specs.BSA_DUBOIS.vector(w, h))
@@ -0,0 +1,142 @@
+# formulas_jit.py
+# Optional compiled backend for the two heaviest batch formulas (needs numba).
+#
+# formulas_batch evaluates CKD-EPI 2021 and Sampson LDL as a chain of NumPy operations,
+# each of which allocates a temporary the size of the batch. Here each formula is one
+# fused loop compiled by Numba: every row is computed start to finish in registers and
+# written once to the output, and the loop is split over threads (prange). The per-row
+# arithmetic is the spec's row form (specs.Spec.row), compiled by Numba, so it is the
+# same formula the scalar and NumPy versions are generated from.
+#
+# The functions have the signatures and results of their formulas_batch counterparts
+# (NaN for rejected rows, ValueError for an unsupported unit, half-way rounding cases
+# recomputed with the scalar formula). Without numba, or with CHEMCALC_JIT=0 in the
+# environment, they are the formulas_batch functions themselves.
+#
+#   import formulas_jit
+#   formulas_jit.BACKEND                       # "numba" or "numpy"
+#   formulas_jit.egfr_ckdepi2021_batch(scr, "µmol/L", age, sex)
+import math
+import os
+
+import numpy as np
+
+import formulas
+import formulas_batch
+import specs
+import units
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+ENABLED = numba is not None and os.environ.get("CHEMCALC_JIT", "1") != "0"
+BACKEND = "numba" if ENABLED else "numpy"
+
+# -----------------------
+# Kernels
+# -----------------------
+if ENABLED:
+    _egfr_row = numba.njit(specs.EGFR_CKDEPI2021.row)
+    _ldl_row = numba.njit(specs.LDL_SAMPSON.row)
+
+    @numba.njit(parallel=True)
+    def _egfr_kernel(creat, multiplier, divisor, age, female, out, recheck):
+        for i in numba.prange(out.shape[0]):
+            egfr = _egfr_row(creat[i] * multiplier / divisor, age[i], female[i])
+            if not math.isfinite(egfr):
+                out[i] = np.nan
+                continue
+            scaled = egfr * 100.0
+            # a value on a rounding half-way point is redone by the scalar formula
+            recheck[i] = abs(scaled - math.floor(scaled) - 0.5) < 1e-6
+            out[i] = np.round(egfr, 2)
+
+    @numba.njit(parallel=True)
+    def _sex_kernel(codes, word, out):
+        # codes: (rows, width) UCS-4 code points of a NumPy str column, NUL-padded
+        width = codes.shape[1]
+        for i in numba.prange(codes.shape[0]):
+            match = width >= word.shape[0]
+            j = 0
+            while match and j < word.shape[0]:
+                c = codes[i, j]
+                if 65 <= c <= 90:  # ASCII lower(); the words compared against are ASCII
+                    c += 32
+                match = c == word[j]
+                j += 1
+            if match and width > word.shape[0]:
+                match = codes[i, word.shape[0]] == 0
+            out[i] = match
+
+    @numba.njit(parallel=True)
+    def _ldl_kernel(tc, tc_mul, tc_div, tg, tg_mul, tg_div, hdl, hdl_mul, hdl_div, ldl_mul, ldl_div, out):
+        for i in numba.prange(out.shape[0]):
+            ldl_mg = _ldl_row(tc[i] * tc_mul / tc_div, tg[i] * tg_mul / tg_div, hdl[i] * hdl_mul / hdl_div)
+            ldl = ldl_mg * ldl_div / ldl_mul
+            out[i] = ldl if math.isfinite(ldl) else np.nan
+
+# -----------------------
+# Entry points
+# -----------------------
+def _columns(*columns):
+    """
+    Broadcasts the columns to one shape and returns them 1-D, plus that shape. Broadcast
+    1-D columns are stride-0 views, so a scalar age or sex costs no per-row memory.
+    """
+    columns = np.broadcast_arrays(*columns)
+    flat = []
+    for column in columns:
+        column.flags.writeable = False
+        flat.append(column if column.ndim == 1 else column.ravel())
+    return columns[0].shape, flat
+
+
+if ENABLED:
+    def _sex_is(sex, value):
+        """formulas_batch._sex_is without np.char.lower's per-row Python strings for str columns."""
+        column = None if isinstance(sex, str) else np.asarray(sex)
+        if column is None or column.dtype.kind != "U" or column.ndim != 1 or column.itemsize == 0:
+            return formulas_batch._sex_is(sex, value)
+        codes = np.ascontiguousarray(column).view(np.uint32).reshape(len(column), column.itemsize // 4)
+        out = np.empty(len(column), dtype=np.bool_)
+        _sex_kernel(codes, np.frombuffer(value.encode("utf-32-le"), dtype=np.uint32), out)
+        return out
+
+    def egfr_ckdepi2021_batch(creat_value, creat_unit="umol/L", age=40, sex="male", adjust_to_bsa=False, weight_kg=None, height_cm=None):
+        if adjust_to_bsa:
+            return formulas_batch.egfr_ckdepi2021_batch(creat_value, creat_unit, age, sex, adjust_to_bsa, weight_kg, height_cm)
+        unit = units.resolve("creatinine", creat_unit)
+        female = _sex_is(sex, "female")
+        unknown_sex = ~(female | _sex_is(sex, "male"))   # rejected by the scalar formula
+        shape, (creat, age, female, unknown_sex) = _columns(formulas_batch._column(creat_value),
+                                                            formulas_batch._column(age), female, unknown_sex)
+        out = np.empty(creat.size)
+        recheck = np.zeros(creat.size, dtype=np.bool_)
+        _egfr_kernel(creat, unit.multiplier, unit.divisor, age, female, out, recheck)
+        for i in np.flatnonzero(recheck):
+            out[i] = formulas.egfr_ckdepi2021(float(creat[i]), creat_unit, age[i], "female" if female[i] else "male")
+        out[unknown_sex] = np.nan
+        return out.reshape(shape)
+
+    def calc_ldl_sampson_batch(tc, tc_unit, tg, tg_unit, hdl, hdl_unit):
+        tc_u = units.resolve("TC", tc_unit)
+        tg_u = units.resolve("TG", tg_unit)
+        hdl_u = units.resolve("HDL", hdl_unit)
+        ldl_u = units.resolve("LDL", hdl_unit)
+        shape, (tc, tg, hdl) = _columns(formulas_batch._column(tc), formulas_batch._column(tg),
+                                        formulas_batch._column(hdl))
+        out = np.empty(tc.size)
+        _ldl_kernel(tc, tc_u.multiplier, tc_u.divisor, tg, tg_u.multiplier, tg_u.divisor,
+                    hdl, hdl_u.multiplier, hdl_u.divisor, ldl_u.multiplier, ldl_u.divisor, out)
+        return out.reshape(shape)
+else:
+    egfr_ckdepi2021_batch = formulas_batch.egfr_ckdepi2021_batch
+    calc_ldl_sampson_batch = formulas_batch.calc_ldl_sampson_batch
+
+
+def set_threads(count):
+    """Number of threads the kernels run on (default: one per core); nothing without numba."""
+    if ENABLED:
+        numba.set_num_threads(count)
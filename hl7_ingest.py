@@ -0,0 +1,410 @@
+# hl7_ingest.py
+# Streaming HL7 v2 ORU^R01 ingest.
+# MLLP-framed messages are read incrementally from a file or a TCP connection (only
+# the message being assembled is buffered). The OBX results of each message are
+# mapped by code onto the formulas, and every result that can be derived is appended
+# to the message as a new OBX segment. The message is then written out MLLP-framed.
+#
+#   python hl7_ingest.py recorded.mllp -o derived.mllp
+#   python hl7_ingest.py --listen 2575 -o derived.mllp       # answers every message with an ACK
+#
+# OBX codes are LOINC by default (OBX_CODES); labs with local codes can extend the table.
+# The unit is taken from OBX-6 and resolved through units.py. A result is not derived,
+# and the reason is counted, when an input is missing, non-numeric ("<5"), in an
+# unsupported unit, or when the patient's sex or age is unknown.
+import argparse
+import socket
+import sys
+import time
+from datetime import datetime
+
+import formulas
+import units
+
+START_BLOCK = b"\x0b"
+END_BLOCK = b"\x1c\x0d"
+READ_SIZE = 64 * 1024
+
+# -----------------------
+# Code tables
+# -----------------------
+# OBX-3 code -> (observation name, units.py analyte, unit when OBX-6 is empty)
+# Urea mass codes only: BUN (urea nitrogen, 3094-0) is not urea and is deliberately not mapped.
+OBX_CODES = {
+    "2160-0": ("creatinine", "creatinine", "mg/dL"),         # Creatinine [Mass/volume] in Serum or Plasma
+    "14682-9": ("creatinine", "creatinine", "µmol/L"),       # Creatinine [Moles/volume] in Serum or Plasma
+    "2161-8": ("urine_creatinine", "creatinine", "mg/dL"),   # Creatinine [Mass/volume] in Urine
+    "14683-7": ("urine_creatinine", "creatinine", "µmol/L"), # Creatinine [Moles/volume] in Urine
+    "14957-5": ("urine_albumin", "albumin", "mg/L"),         # Microalbumin [Mass/volume] in Urine
+    "1754-1": ("urine_albumin", "albumin", "mg/dL"),         # Albumin [Mass/volume] in Urine
+    "2951-2": ("sodium", "sodium", "mmol/L"),                # Sodium [Moles/volume] in Serum or Plasma
+    "2823-3": ("potassium", "potassium", "mmol/L"),          # Potassium [Moles/volume] in Serum or Plasma
+    "2345-7": ("glucose", "glucose", "mg/dL"),               # Glucose [Mass/volume] in Serum or Plasma
+    "14749-6": ("glucose", "glucose", "mmol/L"),             # Glucose [Moles/volume] in Serum or Plasma
+    "3091-6": ("urea", "urea", "mg/dL"),                     # Urea [Mass/volume] in Serum or Plasma
+    "22664-7": ("urea", "urea", "mmol/L"),                   # Urea [Moles/volume] in Serum or Plasma
+    "2093-3": ("tc", "TC", "mg/dL"),                         # Cholesterol [Mass/volume] in Serum or Plasma
+    "2571-8": ("tg", "TG", "mg/dL"),                         # Triglyceride [Mass/volume] in Serum or Plasma
+    "2085-9": ("hdl", "HDL", "mg/dL"),                       # HDL Cholesterol [Mass/volume] in Serum or Plasma
+    "8302-2": ("height", "height", "cm"),                    # Body height
+    "29463-7": ("weight", "weight", "kg"),                   # Body weight
+}
+
+_SEX = {"F": "female", "M": "male"}
+# OBX-11 statuses whose value must not be used
+_UNUSABLE_STATUS = {"X", "D", "W"}
+
+
+class Derivation:
+    """
+    One derived result.
+    code/text/unit: OBX-3 identifier and OBX-6 unit of the new segment
+    inputs: observation names that must be present; compute(obs, patient) -> value
+    where obs maps name -> (value, unit code)
+    """
+    def __init__(self, name, code, text, unit, inputs, compute, digits=2, patient=()):
+        self.name = name
+        self.code = code
+        self.text = text
+        self.unit = unit
+        self.inputs = inputs
+        self.compute = compute
+        self.digits = digits
+        self.patient = patient
+
+
+def _egfr(obs, patient):
+    value, unit = obs["creatinine"]
+    return formulas.egfr_ckdepi2021(value, unit, age=patient["age"], sex=patient["sex"])
+
+
+def _uacr(obs, patient):
+    alb, alb_unit = obs["urine_albumin"]
+    creat, creat_unit = obs["urine_creatinine"]
+    return formulas.calc_uacr(alb, alb_unit, creat, creat_unit)
+
+
+def _serum_osm(obs, patient):
+    glucose, glucose_unit = obs["glucose"]
+    urea, urea_unit = obs["urea"]
+    return formulas.calc_serum_osm(obs["sodium"][0], obs["potassium"][0], glucose, glucose_unit, urea, urea_unit)
+
+
+def _ldl(obs, patient):
+    # reported in mg/dL whatever the input units
+    tc, tc_unit = obs["tc"]
+    tg, tg_unit = obs["tg"]
+    hdl, hdl_unit = obs["hdl"]
+    ldl = formulas.calc_ldl_sampson(tc, tc_unit, tg, tg_unit, hdl, hdl_unit)
+    return units.to_canonical(ldl, "LDL", hdl_unit)
+
+
+def _bmi(obs, patient):
+    return formulas.calc_bmi(obs["weight"][0], obs["height"][0])
+
+
+DERIVATIONS = [
+    Derivation("egfr", "98979-8", "eGFR CKD-EPI 2021", "mL/min/{1.73_m2}", ("creatinine",), _egfr,
+               patient=("age", "sex")),
+    Derivation("uacr", "9318-7", "Albumin/Creatinine [Mass Ratio] in Urine", "mg/g",
+               ("urine_albumin", "urine_creatinine"), _uacr),
+    Derivation("serum_osm", "18182-6", "Osmolality of Serum or Plasma by calculation", "mOsm/kg",
+               ("sodium", "potassium", "glucose", "urea"), _serum_osm),
+    Derivation("ldl", "13457-7", "Cholesterol in LDL [Mass/volume] by calculation (Sampson)", "mg/dL",
+               ("tc", "tg", "hdl"), _ldl),
+    Derivation("bmi", "39156-5", "Body mass index", "kg/m2", ("height", "weight"), _bmi, digits=1),
+]
+
+# -----------------------
+# MLLP framing
+# -----------------------
+def iter_mllp(stream, read_size=READ_SIZE):
+    """
+    Yields the messages of an MLLP byte stream (without the framing bytes). Reads with
+    read1 when available, so a socket yields each message as soon as it is complete.
+    Bytes outside a frame are discarded.
+    """
+    read = getattr(stream, "read1", stream.read)
+    buffer = bytearray()
+    while True:
+        data = read(read_size)
+        if not data:
+            return
+        buffer += data
+        while True:
+            start = buffer.find(START_BLOCK)
+            if start < 0:
+                buffer.clear()
+                break
+            end = buffer.find(END_BLOCK, start + 1)
+            if end < 0:
+                del buffer[:start]
+                break
+            yield bytes(buffer[start + 1:end])
+            del buffer[:end + 2]
+
+
+def frame(message):
+    return START_BLOCK + message + END_BLOCK
+
+# -----------------------
+# Parsing
+# -----------------------
+class Message:
+    """The parts of an ORU^R01 the calculators need; `segments` keeps the original text."""
+    def __init__(self, segments, fs, cs, control_id, sending, patient, observations, codes):
+        self.segments = segments
+        self.fs = fs
+        self.cs = cs
+        self.control_id = control_id
+        self.sending = sending
+        self.patient = patient
+        self.observations = observations
+        self.codes = codes
+
+
+def _hl7_datetime(value):
+    """YYYYMMDD[HHMM[SS]] with optional fraction and time zone; None if empty or invalid."""
+    digits = value.split("+")[0].split("-")[0].split(".")[0]
+    if len(digits) < 8 or not digits.isdigit():
+        return None
+    try:
+        return datetime(int(digits[0:4]), int(digits[4:6]), int(digits[6:8]),
+                        int(digits[8:10] or 0), int(digits[10:12] or 0), int(digits[12:14] or 0))
+    except ValueError:
+        return None
+
+
+def _field(fields, n):
+    return fields[n] if n < len(fields) else ""
+
+
+def _segments(data):
+    text = data.decode("utf-8", "surrogateescape")
+    return [s for s in text.replace("\n", "\r").split("\r") if s]
+
+
+def _msh(segments):
+    """Returns (field separator, component separator, MSH fields) of a message's segments."""
+    if not segments or not segments[0].startswith("MSH") or len(segments[0]) < 5:
+        raise ValueError("message does not start with MSH")
+    msh = segments[0]
+    # MSH-1 is the separator itself, so MSH-n is msh_fields[n - 1]
+    return msh[3], msh[4], msh.split(msh[3])
+
+
+def parse(data, obx_codes=None, skipped=None):
+    """
+    Parses one message (bytes, no framing). Unusable OBX results are counted in
+    `skipped` (dict reason -> count) when given.
+    """
+    obx_codes = OBX_CODES if obx_codes is None else obx_codes
+    segments = _segments(data)
+    fs, cs, msh_fields = _msh(segments)
+    message_time = _hl7_datetime(_field(msh_fields, 6))
+    control_id = _field(msh_fields, 9)
+    sending = (_field(msh_fields, 2), _field(msh_fields, 3))
+
+    dob = sex = observed = None
+    observations = {}
+    codes = set()
+    for segment in segments[1:]:
+        kind = segment[:3]
+        if kind == "OBX":
+            fields = segment.split(fs)
+            code = _field(fields, 3).split(cs)[0]
+            codes.add(code)
+            mapped = obx_codes.get(code)
+            if mapped is None:
+                continue
+            name, analyte, default_unit = mapped
+            if _field(fields, 11) in _UNUSABLE_STATUS:
+                _count(skipped, f"{name}: result status {_field(fields, 11)}")
+                continue
+            unit_text = _field(fields, 6).split(cs)[0] or default_unit
+            try:
+                value = formulas._to_float(_field(fields, 5))
+                unit = units.resolve(analyte, unit_text).code
+            except ValueError as e:
+                _count(skipped, f"{name}: {str(e).split(':')[0]}")
+                continue
+            observations[name] = (value, unit)
+        elif kind == "PID":
+            fields = segment.split(fs)
+            dob = _hl7_datetime(_field(fields, 7))
+            sex = _SEX.get(_field(fields, 8).upper())
+        elif kind == "OBR" and observed is None:
+            observed = _hl7_datetime(_field(segment.split(fs), 7))
+
+    when = observed or message_time
+    age = (when - dob).days / 365.25 if dob and when and when >= dob else None
+    return Message(segments, fs, cs, control_id, sending, {"sex": sex, "age": age}, observations, codes)
+
+
+def _count(counter, key):
+    if counter is not None:
+        counter[key] = counter.get(key, 0) + 1
+
+# -----------------------
+# Derivation and output
+# -----------------------
+def derive(message, derivations=None, skipped=None):
+    """Returns [(Derivation, value)] for every result the message has the inputs for."""
+    out = []
+    for d in DERIVATIONS if derivations is None else derivations:
+        if d.code in message.codes:
+            continue  # the sender already reported it
+        if not all(name in message.observations for name in d.inputs):
+            continue  # not ordered: not a skip
+        missing = [p for p in d.patient if message.patient.get(p) is None]
+        if missing:
+            _count(skipped, f"{d.name}: patient {missing[0]} unknown")
+            continue
+        try:
+            out.append((d, d.compute(message.observations, message.patient)))
+        except ValueError as e:
+            _count(skipped, f"{d.name}: {str(e).split(':')[0]}")
+    return out
+
+
+def obx_segments(message, results, now=None):
+    """New OBX segments for `results`, numbered after the message's last OBX."""
+    fs, cs = message.fs, message.cs
+    set_id = sum(1 for s in message.segments if s.startswith("OBX"))
+    stamp = (now or datetime.now()).strftime("%Y%m%d%H%M%S")
+    segments = []
+    for d, value in results:
+        set_id += 1
+        segments.append(fs.join((
+            "OBX", str(set_id), "NM", cs.join((d.code, d.text, "LN")), "",
+            f"{value:.{d.digits}f}", d.unit, "", "", "", "", "F", "", "", stamp,
+            "", "", "CALC^Calculated^ChemCalc",
+        )))
+    return segments
+
+
+def ack(message, code="AA"):
+    fs, cs = message.fs, message.cs
+    now = datetime.now().strftime("%Y%m%d%H%M%S")
+    encoding = message.segments[0].split(fs)[1]
+    msh = fs.join(("MSH", encoding, "ChemCalc", "", message.sending[0], message.sending[1], now, "",
+                   cs.join(("ACK", "R01", "ACK")), f"ACK{message.control_id}", "P", "2.5.1"))
+    return f"{msh}\r{fs.join(('MSA', code, message.control_id))}\r".encode()
+
+
+def nak(data):
+    """
+    The reply to a message that could not be processed: AE (application error) when its
+    MSH is readable, otherwise AR (rejected) with whatever control ID the raw first
+    segment has in MSH-10's place.
+    """
+    segments = _segments(data)
+    try:
+        fs, cs, msh_fields = _msh(segments)
+        code = "AE"
+    except ValueError:
+        fs, cs = "|", "^"
+        msh_fields = segments[0].split(fs) if segments else []
+        segments = ["MSH|^~\\&"]
+        code = "AR"
+    header = Message(segments[:1], fs, cs, _field(msh_fields, 9), (_field(msh_fields, 2), _field(msh_fields, 3)),
+                     {}, {}, set())
+    return ack(header, code)
+
+
+class Stats:
+    def __init__(self):
+        self.messages = 0
+        self.derived = {}
+        self.skipped = {}
+        self.errors = 0
+        self.seconds = 0.0
+
+    def report(self, out=sys.stderr):
+        rate = self.messages / self.seconds if self.seconds else 0.0
+        print(f"{self.messages} messages in {self.seconds:.2f} s ({rate:,.0f} msg/s), {self.errors} unreadable", file=out)
+        for name, count in sorted(self.derived.items()):
+            print(f"  derived {name}: {count}", file=out)
+        for reason, count in sorted(self.skipped.items()):
+            print(f"  not derived ({reason}): {count}", file=out)
+
+
+def process(data, stats=None, obx_codes=None, derivations=None):
+    """Returns (Message, output message bytes with the derived OBX segments appended)."""
+    skipped = stats.skipped if stats else None
+    message = parse(data, obx_codes, skipped)
+    results = derive(message, derivations, skipped)
+    if stats:
+        stats.messages += 1
+        for d, _ in results:
+            _count(stats.derived, d.name)
+    segments = message.segments + obx_segments(message, results)
+    return message, ("\r".join(segments) + "\r").encode("utf-8", "surrogateescape")
+
+
+def run_stream(instream, outstream=None, stats=None, reply=None):
+    """
+    Processes every message of an MLLP stream; derived messages are written framed to
+    `outstream`. reply, if given, is called with the framed ACK (or NAK) of each message,
+    exactly once per message, unreadable ones included (see nak()).
+    """
+    stats = stats or Stats()
+    start = time.perf_counter()
+    for data in iter_mllp(instream):
+        try:
+            message, out = process(data, stats)
+        except (ValueError, IndexError) as e:
+            stats.errors += 1
+            print(f"unreadable message: {e}", file=sys.stderr)
+            if reply is not None:
+                reply(frame(nak(data)))
+            continue
+        if outstream is not None:
+            outstream.write(frame(out))
+        if reply is not None:
+            reply(frame(ack(message)))
+    stats.seconds += time.perf_counter() - start
+    return stats
+
+
+def listen(port, outstream=None, host="127.0.0.1", stats=None):
+    """Accepts MLLP connections one after the other until interrupted."""
+    stats = stats or Stats()
+    with socket.create_server((host, port)) as server:
+        print(f"listening for MLLP on {host}:{port}", file=sys.stderr)
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("rb") as instream:
+                run_stream(instream, outstream, stats, conn.sendall)
+                if outstream is not None:
+                    outstream.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Derive calculated results from HL7 v2 ORU^R01 messages.")
+    parser.add_argument("input", nargs="?", help="MLLP file, '-' for stdin")
+    parser.add_argument("-o", "--output", help="write the messages with derived OBX segments here")
+    parser.add_argument("--listen", type=int, metavar="PORT", help="accept MLLP connections on localhost:PORT")
+    args = parser.parse_args(argv)
+    if (args.input is None) == (args.listen is None):
+        parser.error("give an input file or --listen PORT")
+
+    outstream = open(args.output, "wb") if args.output else None
+    stats = Stats()
+    try:
+        if args.listen is not None:
+            listen(args.listen, outstream, stats=stats)
+        else:
+            instream = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+            with instream:
+                run_stream(instream, outstream, stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if outstream:
+            outstream.close()
+    stats.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# interpretation.py
+# Interpretation bands for the calculator results.
+# Each calculator has a table of ascending cut-offs. A single value is classified with
+# bisect, a whole column with np.searchsorted, so both give the same answer. Tables can
+# be replaced from a JSON file (load_bands, or the CHEMCALC_BANDS environment variable)
+# for labs that use different cut-offs.
+#
+# Table format (also the format of the JSON file, keyed by table name):
+#   {"unit": "mg/dL",
+#    "bands": [{"below": 100, "category": ..., "severity": ..., "message": ...},   # value < 100
+#              {"up_to": 300, ...},                                               # value <= 300
+#              {...}]}                                                            # everything above
+# Bands are listed from the lowest to the highest; the last one has no bound.
+# severity is the bootstyle colour used by the GUI.
+import math
+import os
+from bisect import bisect_right
+
+DEFAULT_BANDS = {
+    "egfr": {"unit": "mL/min/1.73 m²", "bands": [
+        {"below": 15, "category": "G5 (Kidney Failure)", "severity": "danger", "message": "End-stage renal disease. Dialysis likely needed."},
+        {"below": 30, "category": "G4 (Severe)", "severity": "danger", "message": "Severe kidney damage. Nephrology care required."},
+        {"below": 45, "category": "G3b (Moderate–Severe)", "severity": "warning", "message": "Moderate to severe kidney damage."},
+        {"below": 60, "category": "G3a (Mild–Moderate)", "severity": "warning", "message": "Mild to moderate reduction in GFR."},
+        {"below": 90, "category": "G2 (Mildly decreased)", "severity": "info", "message": "Slightly reduced kidney function."},
+        {"category": "G1 (Normal)", "severity": "success", "message": "Normal kidney function."},
+    ]},
+    "pediatric_egfr": {"unit": "mL/min/1.73 m²", "bands": [
+        {"below": 15, "category": "Kidney Failure", "severity": "danger", "message": "End-stage kidney disease (Stage 5); dialysis likely indicated."},
+        {"below": 30, "category": "Severe Decrease", "severity": "danger", "message": "Advanced CKD (Stage 4); close monitoring required."},
+        {"below": 45, "category": "Moderate–Severe Decrease", "severity": "warning", "message": "CKD Stage 3b; nephrology assessment recommended."},
+        {"below": 60, "category": "Mild–Moderate Decrease", "severity": "warning", "message": "Possible CKD Stage 3a; evaluate underlying causes."},
+        {"below": 90, "category": "Mildly Decreased", "severity": "info", "message": "Slightly reduced kidney function; monitor if persistent."},
+        {"category": "Normal", "severity": "success", "message": "Kidney function is normal for age."},
+    ]},
+    # used instead of pediatric_egfr below INFANT_AGE years
+    "pediatric_egfr_infant": {"unit": "mL/min/1.73 m²", "bands": [
+        {"below": 15, "category": "Kidney Failure", "severity": "danger", "message": "End-stage kidney disease (Stage 5); dialysis likely indicated."},
+        {"below": 30, "category": "Severe Decrease", "severity": "danger", "message": "Advanced CKD (Stage 4); close monitoring required."},
+        {"below": 45, "category": "Moderate–Severe Decrease", "severity": "warning", "message": "CKD Stage 3b; nephrology assessment recommended."},
+        {"below": 60, "category": "Mild–Moderate Decrease", "severity": "warning", "message": "Possible CKD Stage 3a; evaluate underlying causes."},
+        {"below": 90, "category": "Likely Normal (Infant Range)", "severity": "info", "message": "Slightly lower GFR may be normal under age 2."},
+        {"category": "Normal", "severity": "success", "message": "Kidney function is normal for age."},
+    ]},
+    "uacr": {"unit": "mg/g", "bands": [
+        {"below": 30, "category": "Normal", "severity": "success", "message": "Normal albumin excretion."},
+        {"up_to": 300, "category": "Microalbuminuria", "severity": "warning", "message": "Early sign of kidney damage (moderately increased)."},
+        {"category": "Macroalbuminuria", "severity": "danger", "message": "Severe kidney damage (overt nephropathy)."},
+    ]},
+    "urine_osm": {"unit": "mOsm/kg", "bands": [
+        {"below": 100, "category": "Very Dilute Urine", "severity": "info", "message": "Possible diabetes insipidus or water intoxication."},
+        {"up_to": 600, "category": "Normal Range", "severity": "success", "message": "Typical urine concentration (normal hydration)."},
+        {"up_to": 800, "category": "Concentrated Urine", "severity": "warning", "message": "Suggests dehydration or increased ADH activity."},
+        {"category": "Highly Concentrated / Glycosuria", "severity": "danger", "message": "Strongly concentrated urine or solute load (e.g. high glucose)."},
+    ]},
+    "serum_osm": {"unit": "mOsm/kg", "bands": [
+        {"below": 275, "category": "Low Osmolarity (Hypoosmolar)", "severity": "info", "message": ""},
+        {"up_to": 295, "category": "Normal Osmolarity", "severity": "success", "message": ""},
+        {"category": "High Osmolarity (Hyperosmolar)", "severity": "danger", "message": ""},
+    ]},
+    "ldl": {"unit": "mg/dL", "bands": [
+        {"below": 100, "category": "Optimal", "severity": "success", "message": "Low risk of ASCVD."},
+        {"below": 130, "category": "Near Optimal", "severity": "info", "message": "Acceptable for most individuals."},
+        {"below": 160, "category": "Borderline High", "severity": "warning", "message": "Lifestyle modification recommended."},
+        {"below": 190, "category": "High", "severity": "danger", "message": "Consider medication if persistent."},
+        {"category": "Very High", "severity": "danger", "message": "Aggressive lipid-lowering therapy advised."},
+    ]},
+    "hdl": {"unit": "mg/dL", "bands": [
+        {"below": 40, "category": "Low HDL (High Risk)", "severity": "danger", "message": "Low protective cholesterol — higher heart disease risk."},
+        {"below": 60, "category": "Borderline HDL", "severity": "warning", "message": "Average protection."},
+        {"category": "Optimal HDL (Protective)", "severity": "success", "message": "Good HDL level."},
+    ]},
+}
+
+INFANT_AGE = 2
+
+
+class BandTable:
+    """Sorted cut-offs of one calculator; see the module comment for the table format."""
+    def __init__(self, name, table):
+        bands = table["bands"]
+        if not bands or any(k in bands[-1] for k in ("below", "up_to")):
+            raise ValueError(f"{name}: the last band must have no bound")
+        thresholds = []
+        for band in bands[:-1]:
+            if "below" in band:
+                thresholds.append(float(band["below"]))
+            elif "up_to" in band:
+                # value == bound belongs to this band: move the cut just above it
+                thresholds.append(math.nextafter(float(band["up_to"]), math.inf))
+            else:
+                raise ValueError(f"{name}: band '{band.get('category')}' needs 'below' or 'up_to'")
+        if thresholds != sorted(thresholds):
+            raise ValueError(f"{name}: bands must be listed in ascending order")
+        self.name = name
+        self.unit = table.get("unit")
+        self.thresholds = thresholds
+        self.bands = [(b["category"], b.get("severity", "secondary"), b.get("message", "")) for b in bands]
+        self.categories = [b[0] for b in self.bands]
+
+    def index(self, value):
+        return bisect_right(self.thresholds, value)
+
+    def classify(self, value):
+        """(category, severity, message) for one value."""
+        return self.bands[self.index(value)]
+
+    def indices(self, values):
+        """Band index per element; -1 where the value is NaN."""
+        import numpy as np
+        values = np.asarray(values, dtype=float)
+        idx = np.searchsorted(self.thresholds, values, side="right")
+        idx[np.isnan(values)] = -1
+        return idx
+
+    def categories_of(self, values):
+        """Category string per element ("" for NaN) as an object array."""
+        import numpy as np
+        idx = self.indices(values)
+        labels = np.array(self.categories + [""], dtype=object)
+        return labels[idx]
+
+
+BANDS = {name: BandTable(name, table) for name, table in DEFAULT_BANDS.items()}
+
+
+def load_bands(source):
+    """
+    Replaces tables from a JSON file path or a dict of {name: table}. Tables not
+    mentioned keep their current cut-offs. Returns the names that were replaced.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        import json
+        with open(source, encoding="utf-8") as f:
+            source = json.load(f)
+    tables = {name: BandTable(name, table) for name, table in source.items()}
+    BANDS.update(tables)
+    return sorted(tables)
+
+
+def reset_bands():
+    BANDS.clear()
+    BANDS.update({name: BandTable(name, table) for name, table in DEFAULT_BANDS.items()})
+
+
+if os.environ.get("CHEMCALC_BANDS"):
+    load_bands(os.environ["CHEMCALC_BANDS"])
+
+# -----------------------
+# Per-calculator helpers: (category, bootstyle colour, message)
+# -----------------------
+def interpret_egfr(egfr):
+    return BANDS["egfr"].classify(egfr)
+
+
+def interpret_pediatric_egfr(egfr, age):
+    # age-sensitive
+    return BANDS["pediatric_egfr_infant" if age < INFANT_AGE else "pediatric_egfr"].classify(egfr)
+
+
+def interpret_uacr(acr):
+    return BANDS["uacr"].classify(acr)
+
+
+def interpret_urine_osm(uosm):
+    return BANDS["urine_osm"].classify(uosm)
+
+
+def interpret_serum_osm(osm):
+    return BANDS["serum_osm"].classify(osm)
+
+
+def interpret_ldl(ldl_mgdl):
+    return BANDS["ldl"].classify(ldl_mgdl)
+
+
+def interpret_hdl(hdl_mgdl):
+    return BANDS["hdl"].classify(hdl_mgdl)
+
+# -----------------------
+# Column helpers: category per element, "" where the value is NaN
+# -----------------------
+def categories(name, values):
+    return BANDS[name].categories_of(values)
+
+
+def pediatric_egfr_categories(egfr, age):
+    import numpy as np
+    age = np.asarray(age, dtype=float)
+    out = np.where(age < INFANT_AGE, categories("pediatric_egfr_infant", egfr), categories("pediatric_egfr", egfr))
+    out[np.isnan(age)] = ""
+    return out
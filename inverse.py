@@ -0,0 +1,219 @@
+# inverse.py
+# Inverse evaluation: the input value at which a formula gives a target result, e.g. the
+# creatinine that puts a patient into G3a, or the HDL that brings LDL below 100 mg/dL.
+#
+#   inverse.solve("egfr_ckdepi2021", 45, "creat_value", age=67, sex="female", creat_unit="µmol/L")
+#   inverse.solve("calc_uacr", 30, "alb_value", lo=0, hi=5000, albumin_unit="mg/L", creat_value=ucr)
+#   table = inverse.ThresholdTable()
+#   table.distance_to_next_stage(scr, "µmol/L", age, sex)      # whole cohort in one pass
+#
+# Formulas with a closed-form inverse (CKD-EPI 2021 in creatinine, Sampson LDL in HDL)
+# are inverted exactly, on the unrounded formula. Any other formula/argument pair is
+# solved by vectorised bisection over formulas_batch between `lo` and `hi`: all rows
+# step together, one batch call per step. The formula must be monotonic in the varied
+# argument over the bracket; rows whose bracket does not contain the target give NaN.
+# Bisection works on the result as reported (rounded), so it finds where the reported
+# value reaches the target.
+import numpy as np
+
+import formulas_batch
+import interpretation
+import specs
+import units
+
+# -----------------------
+# Closed forms
+# -----------------------
+def _exponent(expr, func):
+    """The exponent expression of `func(...) ** exponent` in a spec expression, or None."""
+    if not isinstance(expr, specs.BinOp):
+        return None
+    if expr.op == "**" and isinstance(expr.left, specs.Call) and expr.left.func == func:
+        return expr.right
+    return _exponent(expr.left, func) or _exponent(expr.right, func)
+
+
+def _egfr_constants(age, female):
+    """
+    kappa, the exponents of min(scr/kappa, 1) and max(scr/kappa, 1), and eGFR at
+    scr == kappa (where the two branches of the power law meet), read from the spec.
+    """
+    spec = specs.EGFR_CKDEPI2021
+    per_sex = []
+    for flag in (False, True):
+        values = spec.evaluate({"scr_mgdl": 1.0, "age": 0.0, "female": flag})
+        per_sex.append((values["kappa"], _exponent(spec.result, "min").evaluate(values),
+                        _exponent(spec.result, "max").evaluate(values)))
+    kappa, below, above = (np.where(female, f, m) for m, f in zip(*per_sex))
+    knee, _ = spec.vector(kappa, age, female)
+    return kappa, below, above, knee
+
+
+def creatinine_for_egfr(target, age, sex, creat_unit="mg/dL"):
+    """Creatinine (in creat_unit) at which CKD-EPI 2021 (not adjusted to BSA) equals `target`."""
+    target = formulas_batch._column(target)
+    age = formulas_batch._column(age)
+    kappa, below, above, knee = _egfr_constants(age, formulas_batch._sex_is(sex, "female"))
+    with np.errstate(all="ignore"):
+        ratio = target / knee
+        # eGFR falls as creatinine rises: above the knee scr/kappa < 1 (min() branch), below it > 1
+        x = np.where(ratio >= 1, np.power(ratio, 1 / below), np.power(ratio, 1 / above))
+        scr_mgdl = np.where(target > 0, x * kappa, np.nan)
+    return formulas_batch._finish(units.from_canonical(scr_mgdl, "creatinine", creat_unit))
+
+
+def hdl_for_ldl(target, tc, tc_unit, tg, tg_unit, unit="mg/dL"):
+    """
+    HDL (in `unit`, which is also the unit of `target`) at which Sampson LDL equals
+    `target`. Sampson is linear in HDL, so this is its exact inverse: unlike
+    formulas.calc_hdl_from_sampson it round-trips with formulas.calc_ldl_sampson.
+    """
+    tc_mg = units.to_canonical(formulas_batch._column(tc), "TC", tc_unit)
+    tg_mg = units.to_canonical(formulas_batch._column(tg), "TG", tg_unit)
+    ldl_mg = units.to_canonical(formulas_batch._column(target), "LDL", unit)
+    # ldl = constant + slope * hdl, the line through the spec's LDL at HDL 0 and 100 mg/dL
+    constant, invalid = specs.LDL_SAMPSON.vector(tc_mg, tg_mg, 0.0)
+    slope = (specs.LDL_SAMPSON.vector(tc_mg, tg_mg, 100.0)[0] - constant) / 100.0
+    with np.errstate(all="ignore"):
+        hdl_mg = (ldl_mg - constant) / slope
+        unstable = np.abs(slope) < 1e-6
+    invalid = unstable if invalid is None else (invalid | unstable)
+    return formulas_batch._finish(units.from_canonical(hdl_mg, "HDL", unit), invalid)
+
+
+def _egfr_creat(target, kwargs):
+    if kwargs.get("adjust_to_bsa"):
+        return None
+    return creatinine_for_egfr(target, kwargs.get("age", 40), kwargs.get("sex", "male"), kwargs.get("creat_unit", "umol/L"))
+
+
+def _sampson_hdl(target, kwargs):
+    return hdl_for_ldl(target, kwargs["tc"], kwargs["tc_unit"], kwargs["tg"], kwargs["tg_unit"], kwargs["hdl_unit"])
+
+
+# (formula, varied argument) -> inverse(target, other arguments); None from it means "use bisection"
+CLOSED_FORMS = {
+    ("egfr_ckdepi2021", "creat_value"): _egfr_creat,
+    ("calc_ldl_sampson", "hdl"): _sampson_hdl,
+}
+
+# -----------------------
+# Bisection
+# -----------------------
+def bisect(func, target, lo, hi, rtol=1e-9, max_iter=100):
+    """
+    Vectorised bisection: x in [lo, hi] with func(x) == target, row by row. func maps an
+    array of x to an array of results. The end of the final bracket on the `hi` side is
+    returned, so func(x) has reached the target even when func steps (rounded results).
+    Rows whose bracket has no sign change, or where func gives NaN, come back as NaN.
+    """
+    target = np.asarray(target, dtype=float)
+    lo, hi, target = (np.array(a, dtype=float) for a in np.broadcast_arrays(lo, hi, target))
+    with np.errstate(invalid="ignore"):
+        f_lo = func(lo) - target
+        f_hi = func(hi) - target
+        valid = (np.sign(f_lo) != np.sign(f_hi)) | (f_lo == 0)
+        for _ in range(max_iter):
+            mid = 0.5 * (lo + hi)
+            f_mid = func(mid) - target
+            valid &= ~np.isnan(f_mid)
+            # the root is above mid when mid is on the same side as lo
+            up = (np.sign(f_mid) == np.sign(f_lo)) & (f_lo != 0)
+            lo = np.where(up, mid, lo)
+            f_lo = np.where(up, f_mid, f_lo)
+            hi = np.where(up, hi, mid)
+            if np.all((np.abs(hi - lo) <= rtol * np.abs(mid)) | ~valid):
+                break
+    x = np.where(f_lo == 0, lo, hi)
+    x[~valid] = np.nan
+    return x
+
+
+def solve(name, target, vary, lo=None, hi=None, rtol=1e-9, max_iter=100, **kwargs):
+    """
+    Value of argument `vary` of formulas.<name> at which the formula gives `target`
+    (same units as the formula's result and arguments). Other arguments are passed as
+    keywords, as scalars or per-row arrays. lo/hi bracket the search; they are only
+    optional when a closed form exists.
+    """
+    closed = CLOSED_FORMS.get((name, vary))
+    if closed is not None:
+        result = closed(target, kwargs)
+        if result is not None:
+            return result
+    if lo is None or hi is None:
+        raise ValueError(f"{name}: no closed form for '{vary}', lo and hi are required")
+    batch = getattr(formulas_batch, f"{name}_batch")
+    return bisect(lambda x: batch(**{vary: x}, **kwargs), target, lo, hi, rtol, max_iter)
+
+# -----------------------
+# Per-age/sex threshold tables
+# -----------------------
+class ThresholdTable:
+    """
+    Creatinine at each eGFR cut-off of an interpretation table, per whole year of age and
+    sex, so a cohort is staged and its distance to the next stage found with a lookup
+    and a comparison per row. Ages are taken in whole years (floored); outside `ages` the
+    result is NaN. The cut-offs are read from interpretation.BANDS when the table is built.
+    eGFR is reported to `ndigits` decimals, so each threshold sits where the reported
+    value drops below the cut-off (raw eGFR = cut-off - half a reporting step).
+    """
+    def __init__(self, table="egfr", ages=range(18, 121), ndigits=2):
+        bands = interpretation.BANDS[table]
+        self.categories = list(bands.categories)
+        self.cutoffs = np.array(bands.thresholds)                 # ascending eGFR
+        self.ages = np.arange(ages[0], ages[-1] + 1)
+        age = self.ages[:, None]
+        raw = self.cutoffs[None, :] - 0.5 * 10.0 ** -ndigits
+        # creatinine in mg/dL, shape (sex: male/female, age, cut-off), descending along the cut-offs
+        self.creat = np.stack([creatinine_for_egfr(raw, age, sex) for sex in ("male", "female")])
+
+    def _rows(self, age, sex, *columns):
+        """
+        Per-row creatinine thresholds (mg/dL), shape (rows, cut-offs), followed by the
+        given columns broadcast to the same rows.
+        """
+        age = np.floor(formulas_batch._column(age))
+        female = formulas_batch._sex_is(sex, "female")
+        age, female, *columns = (np.atleast_1d(c) for c in np.broadcast_arrays(age, female, *columns))
+        position = age - self.ages[0]
+        inside = (position >= 0) & (position < len(self.ages))
+        rows = self.creat[female.astype(np.intp), np.where(inside, position, 0).astype(np.intp)]
+        rows[~inside] = np.nan
+        return (rows, *columns)
+
+    def threshold(self, category, age, sex, creat_unit="mg/dL"):
+        """Creatinine above which eGFR is in `category` or worse; NaN for the top category."""
+        k = self.categories.index(category)
+        rows, = self._rows(age, sex)
+        if k == len(self.cutoffs):
+            return np.full(len(rows), np.nan)
+        return units.from_canonical(rows[:, k], "creatinine", creat_unit)
+
+    def _stage(self, rows, scr_mgdl):
+        # reported eGFR >= cut-off exactly when creatinine < the cut-off's creatinine
+        idx = (rows > scr_mgdl[:, None]).sum(axis=1)
+        idx[np.isnan(scr_mgdl) | ~(scr_mgdl > 0) | np.isnan(rows[:, 0])] = -1
+        return idx
+
+    def stage(self, creat_value, creat_unit, age, sex):
+        """Band index per row (as interpretation.BandTable.indices), -1 where unknown."""
+        scr = units.to_canonical(formulas_batch._column(creat_value), "creatinine", creat_unit)
+        rows, scr = self._rows(age, sex, scr)
+        return self._stage(rows, scr)
+
+    def distance_to_next_stage(self, creat_value, creat_unit, age, sex):
+        """
+        For each row: (category of the next worse stage, creatinine at which it starts,
+        that creatinine minus the current one), in creat_unit. "" and NaN for rows already
+        in the worst stage or with unknown inputs.
+        """
+        scr = formulas_batch._column(creat_value)
+        rows, scr = self._rows(age, sex, scr)
+        idx = self._stage(rows, units.to_canonical(scr, "creatinine", creat_unit))
+        has_next = idx > 0
+        threshold = np.full(len(idx), np.nan)
+        threshold[has_next] = rows[has_next, idx[has_next] - 1]
+        threshold = units.from_canonical(threshold, "creatinine", creat_unit)
+        labels = np.array(self.categories + [""], dtype=object)
+        return labels[np.where(has_next, idx - 1, -1)], threshold, threshold - scr
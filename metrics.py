@@ -0,0 +1,217 @@
+# metrics.py
+# Optional instrumentation of the calculators, exported in the Prometheus text format.
+# Nothing is measured until enable() is called: it replaces the formula and engine
+# functions (and on request the formulas_batch ones) with timed wrappers (disable() puts
+# the originals back), so when it is off
+# the calculators run exactly as before.
+#
+#   import metrics
+#   metrics.enable()
+#   ...
+#   metrics.write_textfile("/var/lib/node_exporter/chemcalc.prom")   # or
+#   metrics.start_http_server(9464)                                  # GET /metrics
+#
+# Recorded per function: calls, a latency histogram, errors by reason (the ValueError
+# message without the offending value, e.g. "Unsupported creatinine unit") and, for
+# engine functions, how often each interpretation category came out. A batch function is
+# one call per vectorised call, however many rows it computes.
+import functools
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# histogram bucket upper bounds in seconds: formulas take microseconds, GUI handlers milliseconds
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 0.1, 1.0)
+
+FORMULA_FUNCTIONS = (
+    "egfr_ckdepi2021", "cockcroft_gault", "egfr_schwartz", "calc_pediatric_egfr", "calc_uacr",
+    "calc_serum_osm", "calc_urine_osm", "calc_ldl_sampson", "calc_hdl_from_sampson",
+    "calc_bmi", "calculate_bsa", "_to_float",
+)
+# formulas_batch counterparts of the formulas, for batch callers such as service.py
+BATCH_FUNCTIONS = tuple(f"{name}_batch" for name in FORMULA_FUNCTIONS if name != "_to_float")
+ENGINE_FUNCTIONS = ("egfr", "pediatric_egfr", "uacr", "urine_osm", "serum_osm", "ldl", "hdl")
+
+
+class Metrics:
+    """Counters and histograms keyed by function name; safe to update from several threads."""
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.histograms = {}  # function -> [count per bucket (last = +Inf), sum]
+            self.errors = {}      # (function, reason) -> count
+            self.categories = {}  # (calculator, category) -> count
+
+    def observe(self, function, seconds, error=None):
+        with self._lock:
+            self.calls[function] = self.calls.get(function, 0) + 1
+            hist = self.histograms.get(function)
+            if hist is None:
+                hist = self.histograms[function] = [[0] * (len(self.buckets) + 1), 0.0]
+            hist[0][bisect_left(self.buckets, seconds)] += 1
+            hist[1] += seconds
+            if error is not None:
+                key = (function, error)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def count_category(self, calculator, category):
+        with self._lock:
+            key = (calculator, category)
+            self.categories[key] = self.categories.get(key, 0) + 1
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            lines = [
+                "# HELP chemcalc_calls_total Calls per function.",
+                "# TYPE chemcalc_calls_total counter",
+            ]
+            for function, count in sorted(self.calls.items()):
+                lines.append(f'chemcalc_calls_total{{function="{_escape(function)}"}} {count}')
+
+            lines += [
+                "# HELP chemcalc_call_duration_seconds Time spent per call.",
+                "# TYPE chemcalc_call_duration_seconds histogram",
+            ]
+            for function, (counts, total) in sorted(self.histograms.items()):
+                label = f'function="{_escape(function)}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + (None,), counts):
+                    cumulative += count
+                    le = "+Inf" if bound is None else repr(bound)
+                    lines.append(f'chemcalc_call_duration_seconds_bucket{{{label},le="{le}"}} {cumulative}')
+                lines.append(f"chemcalc_call_duration_seconds_sum{{{label}}} {total!r}")
+                lines.append(f"chemcalc_call_duration_seconds_count{{{label}}} {cumulative}")
+
+            lines += [
+                "# HELP chemcalc_errors_total Calls that raised, by reason.",
+                "# TYPE chemcalc_errors_total counter",
+            ]
+            for (function, reason), count in sorted(self.errors.items()):
+                lines.append(f'chemcalc_errors_total{{function="{_escape(function)}",reason="{_escape(reason)}"}} {count}')
+
+            lines += [
+                "# HELP chemcalc_interpretations_total Results per interpretation category.",
+                "# TYPE chemcalc_interpretations_total counter",
+            ]
+            for (calculator, category), count in sorted(self.categories.items()):
+                lines.append(f'chemcalc_interpretations_total{{calculator="{_escape(calculator)}",category="{_escape(category)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def error_reason(error):
+    """Low-cardinality label for an exception: ValueError messages lose the value after ':'."""
+    if isinstance(error, ValueError) and str(error):
+        return str(error).split(":", 1)[0].strip()
+    return type(error).__name__
+
+
+REGISTRY = Metrics()
+
+# -----------------------
+# Instrumentation
+# -----------------------
+def instrument(name, func, registry=REGISTRY, categories=False):
+    """Wraps `func` to record calls under `name`; with categories, Result.category is counted too."""
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            registry.observe(name, perf_counter() - start, error_reason(e))
+            raise
+        registry.observe(name, perf_counter() - start)
+        if categories and result is not None:
+            registry.count_category(name, result.category)
+        return result
+    return wrapper
+
+
+_patched = []  # (owner, attribute, original)
+
+
+def _patch(owner, attribute, name, categories=False):
+    original = getattr(owner, attribute)
+    setattr(owner, attribute, instrument(name, original, categories=categories))
+    _patched.append((owner, attribute, original))
+
+
+def enable(engine_functions=True, batch_functions=False):
+    """Instruments the formulas (and the engine, and formulas_batch); calling it again does nothing."""
+    if _patched:
+        return
+    import formulas
+    for name in FORMULA_FUNCTIONS:
+        _patch(formulas, name, f"formulas.{name}")
+    if batch_functions:
+        import formulas_batch
+        for name in BATCH_FUNCTIONS:
+            _patch(formulas_batch, name, f"formulas_batch.{name}")
+    if engine_functions:
+        import engine
+        for name in ENGINE_FUNCTIONS:
+            _patch(engine, name, f"engine.{name}", categories=True)
+
+
+def instrument_methods(cls, names):
+    """Instruments methods of a class, e.g. the ChemCalc calculate_* handlers. Call before instances wire them up."""
+    for name in names:
+        _patch(cls, name, f"{cls.__name__}.{name}")
+
+
+def disable():
+    """Restores the original functions. Recorded values are kept until REGISTRY.reset()."""
+    while _patched:
+        owner, attribute, original = _patched.pop()
+        setattr(owner, attribute, original)
+
+
+def enabled():
+    return bool(_patched)
+
+# -----------------------
+# Export
+# -----------------------
+def write_textfile(path, registry=REGISTRY):
+    """Writes the metrics to `path` atomically (for the node_exporter textfile collector)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+def start_http_server(port=9464, host="127.0.0.1", registry=REGISTRY):
+    """Serves GET /metrics from a daemon thread; returns the server (call .shutdown() to stop)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="chemcalc-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,101 @@
+# pandas_accessor.py
+# `df.chemcalc` accessor: the batch formulas over DataFrame columns (needs pandas).
+#
+#   import pandas_accessor  # registers the accessor
+#   df[["egfr", "egfr_category"]] = df.chemcalc.egfr(creat="scr", unit_col="scr_unit", age="age", sex="sex")
+#   df.chemcalc.uacr(albumin="ualb", creat="ucr", albumin_unit="mg/L", creat_unit_col="ucr_unit")
+#   df.chemcalc.ldl_sampson(tc="tc", tg="tg", hdl="hdl", unit_col="lipid_unit")
+#
+# Every method returns a DataFrame on the same index with the result column and its
+# interpretation category. Arguments are column names (or Series/arrays). A unit is
+# either fixed (unit=...) or read per row from a column (unit_col=...): rows are grouped
+# by unit and each group is one vectorised formulas_batch call, so there is never a
+# Python call per row. Rows the scalar formula would reject give NaN and "".
+import numpy as np
+import pandas as pd
+
+import formulas_batch
+import interpretation
+import units
+
+
+@pd.api.extensions.register_dataframe_accessor("chemcalc")
+class ChemCalcAccessor:
+    def __init__(self, df):
+        self._df = df
+
+    # ---------- helpers ----------
+    def _values(self, column):
+        series = self._df[column] if isinstance(column, str) else pd.Series(column, index=self._df.index)
+        if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+            return series.to_numpy(dtype=float, na_value=np.nan)
+        return formulas_batch._column(series.to_numpy(dtype=object))
+
+    def _text(self, column):
+        series = self._df[column] if isinstance(column, str) else pd.Series(column, index=self._df.index)
+        return series.to_numpy(dtype=object), series.isna().to_numpy()
+
+    def _unit_groups(self, unit_specs):
+        """
+        unit_specs: {unit argument: (fixed unit, unit column or None)}.
+        Yields ({unit argument: unit}, row positions) for every distinct combination.
+        """
+        fixed = {arg: unit for arg, (unit, column) in unit_specs.items() if column is None}
+        per_row = {arg: column for arg, (unit, column) in unit_specs.items() if column is not None}
+        n = len(self._df)
+        if not per_row:
+            yield fixed, np.arange(n)
+            return
+        frame = pd.DataFrame({arg: self._df[column].to_numpy() for arg, column in per_row.items()})
+        for key, rows in frame.groupby(list(per_row), sort=False, dropna=True).indices.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield dict(fixed, **dict(zip(per_row, key))), rows
+        # rows with a missing unit stay NaN
+
+    def _result(self, name, values, table_values, table):
+        labels = np.full(len(values), "", dtype=object)
+        valid = ~np.isnan(table_values)
+        labels[valid] = interpretation.categories(table, table_values[valid])
+        return pd.DataFrame({name: values, f"{name}_category": labels}, index=self._df.index)
+
+    # ---------- calculators ----------
+    def egfr(self, creat, age, sex, unit="µmol/L", unit_col=None, out="egfr"):
+        """CKD-EPI 2021 eGFR (mL/min/1.73 m²)."""
+        creat = self._values(creat)
+        age = self._values(age)
+        sex, sex_missing = self._text(sex)
+        values = np.full(len(self._df), np.nan)
+        for unit_args, rows in self._unit_groups({"creat_unit": (unit, unit_col)}):
+            values[rows] = formulas_batch.egfr_ckdepi2021_batch(
+                creat[rows], unit_args["creat_unit"], age[rows], np.where(sex_missing[rows], "", sex[rows]).astype(str))
+        values[sex_missing] = np.nan  # the scalar formula rejects a missing sex
+        return self._result(out, values, values, "egfr")
+
+    def uacr(self, albumin, creat, albumin_unit="mg/L", creat_unit="mg/dL",
+             albumin_unit_col=None, creat_unit_col=None, out="uacr"):
+        """Urine albumin/creatinine ratio (mg/g)."""
+        albumin = self._values(albumin)
+        creat = self._values(creat)
+        values = np.full(len(self._df), np.nan)
+        specs = {"albumin_unit": (albumin_unit, albumin_unit_col), "creat_unit": (creat_unit, creat_unit_col)}
+        for unit_args, rows in self._unit_groups(specs):
+            values[rows] = formulas_batch.calc_uacr_batch(albumin[rows], unit_args["albumin_unit"],
+                                                          creat[rows], unit_args["creat_unit"])
+        return self._result(out, values, values, "uacr")
+
+    def ldl_sampson(self, tc, tg, hdl, unit="mg/dL", unit_col=None, out="ldl"):
+        """
+        Sampson LDL, reported in the unit of the lipid inputs (unit or unit_col applies
+        to TC, TG and HDL) and interpreted on its mg/dL value.
+        """
+        tc = self._values(tc)
+        tg = self._values(tg)
+        hdl = self._values(hdl)
+        values = np.full(len(self._df), np.nan)
+        mgdl = np.full(len(self._df), np.nan)
+        for unit_args, rows in self._unit_groups({"unit": (unit, unit_col)}):
+            lipid_unit = unit_args["unit"]
+            values[rows] = formulas_batch.calc_ldl_sampson_batch(tc[rows], lipid_unit, tg[rows], lipid_unit,
+                                                                 hdl[rows], lipid_unit)
+            mgdl[rows] = units.to_canonical(values[rows], "LDL", lipid_unit)
+        return self._result(out, values, mgdl, "ldl")
@@ -0,0 +1,277 @@
+# panel.py
+# Multi-formula panels over shared intermediates.
+#
+# The formulas are modelled as a graph of named quantities: raw inputs (creat_value,
+# creat_unit, age, ...), intermediates (scr_mgdl, bsa_mosteller, non_hdl_mgdl, the
+# unrounded CKD-EPI value, ...) and outputs (egfr, crcl, bmi, ...). A panel computes each
+# intermediate once, for a single patient or a whole column, and evaluates only the
+# outputs whose inputs are all present; the others are reported in `skipped` with the
+# raw inputs they are missing.
+#
+#   result = panel.evaluate({"creat_value": 92, "creat_unit": "µmol/L", "age": 61, "sex": "female",
+#                            "height": 164, "weight": 70})
+#   result.values["egfr"], result.categories["egfr"], result.skipped["uacr"]
+#
+# Outputs are computed with the formula specs of specs.py, as formulas_batch does, and
+# give the same values, rounded like the scalar functions. Missing or invalid values inside a column give NaN
+# for that row only; an unsupported unit raises ValueError.
+import numpy as np
+
+import formulas
+import interpretation
+import specs
+import units
+from formulas_batch import _column, _finish, _round_like_scalar, _sex_flags, _sex_is
+
+# raw inputs that are strings, not numbers (units: one per column)
+TEXT_INPUTS = {"sex", "creat_unit", "height_unit", "weight_unit", "albumin_unit", "urine_creat_unit",
+               "glucose_unit", "urea_unit", "tc_unit", "tg_unit", "hdl_unit"}
+DEFAULT_INPUTS = {"height_unit": "cm", "weight_unit": "kg"}
+
+
+class Quantity:
+    """
+    A named quantity computed from other quantities. `optional` maps inputs that may be
+    absent to the value used instead (e.g. urea for serum osmolality).
+    """
+    def __init__(self, name, inputs, func, optional=None):
+        self.name = name
+        self.inputs = inputs
+        self.func = func
+        self.optional = optional or {}
+
+
+class Output(Quantity):
+    """
+    A panel result. digits/scalar: rounding like the scalar formula (scalar(values, i)
+    recomputes row i); interpret(values, result) gives the categories.
+    """
+    def __init__(self, name, inputs, func, digits=None, scalar=None, interpret=None, optional=None):
+        super().__init__(name, inputs, func, optional)
+        self.digits = digits
+        self.scalar = scalar
+        self.interpret = interpret
+
+
+def _canonical(analyte):
+    return lambda value, unit: units.to_canonical(value, analyte, unit)
+
+
+def _spec(spec):
+    """The vector form of a formula spec, with its rejected rows set to NaN."""
+    return lambda *columns: _finish(*spec.vector(*columns))
+
+
+def _spec_by_sex(spec):
+    """_spec for a formula that reads the sex; its last column is sex_known, rows without it are NaN."""
+    vector = _spec(spec)
+    return lambda *columns: np.where(columns[-1], vector(*columns[:-1]), np.nan)
+
+
+def _sex_name(values, i, flag="female"):
+    return flag if values[flag].flat[i] else ("male" if flag == "female" else "female")
+
+
+def _categories(table):
+    return lambda values, result: interpretation.categories(table, result)
+
+
+# Listed in dependency order: every quantity only uses raw inputs or quantities above it.
+QUANTITIES = (
+    Quantity("scr_mgdl", ("creat_value", "creat_unit"), _canonical("creatinine")),
+    Quantity("height_cm", ("height", "height_unit"), _canonical("height")),
+    Quantity("weight_kg", ("weight", "weight_unit"), _canonical("weight")),
+    Quantity("alb_mgdl", ("alb_value", "albumin_unit"), _canonical("albumin")),
+    Quantity("urine_creat_mgdl", ("urine_creat_value", "urine_creat_unit"), _canonical("creatinine")),
+    Quantity("glucose_mgdl", ("glucose_value", "glucose_unit"), _canonical("glucose")),
+    Quantity("urea_mgdl", ("urea_value", "urea_unit"), _canonical("urea")),
+    Quantity("tc_mgdl", ("tc", "tc_unit"), _canonical("TC")),
+    Quantity("tg_mgdl", ("tg", "tg_unit"), _canonical("TG")),
+    Quantity("hdl_mgdl", ("hdl", "hdl_unit"), _canonical("HDL")),
+    Quantity("female", ("sex",), lambda sex: _sex_is(sex, "female")),
+    Quantity("male", ("sex",), lambda sex: _sex_is(sex, "male")),
+    Quantity("sex_known", ("sex",), lambda sex: ~_sex_flags(sex)[1]),
+    Quantity("bsa_mosteller", ("height_cm", "weight_kg"), lambda h, w: np.sqrt((h * w) / 3600.0)),
+    Quantity("non_hdl_mgdl", ("tc_mgdl", "hdl_mgdl"), lambda tc, hdl: tc - hdl),
+    Quantity("ckd_epi", ("scr_mgdl", "age", "female", "sex_known"), _spec_by_sex(specs.EGFR_CKDEPI2021)),
+    Quantity("crcl_raw", ("age", "weight_kg", "scr_mgdl", "female", "sex_known"), _spec_by_sex(specs.COCKCROFT_GAULT)),
+    Quantity("ldl_mgdl", ("tc_mgdl", "tg_mgdl", "hdl_mgdl"), _spec(specs.LDL_SAMPSON)),
+)
+
+OUTPUTS = (
+    Output("egfr", ("ckd_epi",), lambda egfr: egfr, 2,
+           lambda v, i: formulas.egfr_ckdepi2021(float(v["scr_mgdl"].flat[i]), "mg/dL", v["age"].flat[i], _sex_name(v, i)),
+           _categories("egfr")),
+    # de-normalised to the patient's BSA: absolute mL/min, not staged
+    Output("egfr_absolute", ("ckd_epi", "bsa_mosteller"), lambda egfr, bsa: egfr * (bsa / 1.73), 2,
+           lambda v, i: formulas.egfr_ckdepi2021(float(v["scr_mgdl"].flat[i]), "mg/dL", v["age"].flat[i], _sex_name(v, i),
+                                                 True, float(v["weight_kg"].flat[i]), float(v["height_cm"].flat[i]))),
+    Output("crcl", ("crcl_raw",), _finish, 2,
+           lambda v, i: formulas.cockcroft_gault(v["age"].flat[i], v["weight_kg"].flat[i], float(v["scr_mgdl"].flat[i]),
+                                                 "mg/dL", _sex_name(v, i))),
+    Output("crcl_bsa", ("crcl_raw", "bsa_mosteller"), lambda crcl, bsa: _finish(crcl * (1.73 / bsa)), 2,
+           lambda v, i: formulas.cockcroft_gault(v["age"].flat[i], v["weight_kg"].flat[i], float(v["scr_mgdl"].flat[i]),
+                                                 "mg/dL", _sex_name(v, i), True, float(v["height_cm"].flat[i]))),
+    Output("egfr_ped", ("height_cm", "age", "male", "scr_mgdl", "sex_known"), _spec_by_sex(specs.PEDIATRIC_EGFR), 2,
+           lambda v, i: formulas.calc_pediatric_egfr(float(v["height_cm"].flat[i]), float(v["age"].flat[i]),
+                                                     _sex_name(v, i, "male"), float(v["scr_mgdl"].flat[i]), "mg/dL"),
+           lambda v, result: interpretation.pediatric_egfr_categories(result, v["age"])),
+    Output("egfr_schwartz", ("height_cm", "scr_mgdl"), _spec(specs.EGFR_SCHWARTZ), 2,
+           lambda v, i: formulas.egfr_schwartz(v["height_cm"].flat[i], float(v["scr_mgdl"].flat[i]), "mg/dL")),
+    Output("bmi", ("weight_kg", "height_cm"), _spec(specs.BMI), 1,
+           lambda v, i: formulas.calc_bmi(float(v["weight_kg"].flat[i]), float(v["height_cm"].flat[i]))),
+    Output("bsa", ("weight_kg", "height_cm"), _spec(specs.BSA_DUBOIS)),
+    Output("uacr", ("alb_mgdl", "urine_creat_mgdl"), _spec(specs.UACR), 2,
+           lambda v, i: formulas.calc_uacr(float(v["alb_mgdl"].flat[i]), "mg/dL", float(v["urine_creat_mgdl"].flat[i]), "mg/dL"),
+           _categories("uacr")),
+    Output("serum_osm", ("na", "k", "glucose_mgdl", "urea_mgdl"), _spec(specs.SERUM_OSM), 2,
+           lambda v, i: formulas.calc_serum_osm(v["na"].flat[i], v["k"].flat[i], float(v["glucose_mgdl"].flat[i]), "mg/dL",
+                                                float(v["urea_mgdl"].flat[i]), "mg/dL"),
+           _categories("serum_osm"), optional={"urea_mgdl": 0.0}),
+    Output("urine_osm", ("na", "k", "urea_mgdl", "glucose_mgdl"), _spec(specs.URINE_OSM), 1,
+           lambda v, i: formulas.calc_urine_osm(v["na"].flat[i], v["k"].flat[i], float(v["urea_mgdl"].flat[i]), "mg/dL",
+                                                float(v["glucose_mgdl"].flat[i]), "mg/dL"),
+           _categories("urine_osm"), optional={"glucose_mgdl": 0.0}),
+    # reported in the HDL unit, interpreted in mg/dL (the unit of the cut-offs)
+    Output("ldl", ("ldl_mgdl", "hdl_unit"), lambda ldl, unit: units.from_canonical(ldl, "LDL", unit),
+           interpret=lambda v, result: interpretation.categories("ldl", v["ldl_mgdl"])),
+)
+
+GRAPH = {q.name: q for q in QUANTITIES + OUTPUTS}
+
+
+def _leaves(name):
+    """Raw inputs a quantity depends on."""
+    node = GRAPH.get(name)
+    if node is None:
+        return {name}
+    return set().union(*(_leaves(dep) for dep in node.inputs))
+
+# -----------------------
+# Evaluation
+# -----------------------
+class PanelResult:
+    """
+    values/categories: output name -> result / category (arrays for columns, floats and
+    strings for a single patient). intermediates: every quantity that was computed.
+    skipped: output name -> raw inputs it was missing.
+    """
+    __slots__ = ("values", "categories", "intermediates", "skipped")
+
+    def __init__(self, values, categories, intermediates, skipped):
+        self.values = values
+        self.categories = categories
+        self.intermediates = intermediates
+        self.skipped = skipped
+
+    def __repr__(self):
+        return f"PanelResult(values={self.values!r}, skipped={sorted(self.skipped)})"
+
+
+class Panel:
+    """
+    A set of outputs (default: all) evaluated together. The evaluation order for a given
+    set of present inputs is worked out once and cached, so evaluating many patients
+    one by one only pays for the arithmetic.
+    """
+    def __init__(self, outputs=None):
+        names = outputs or [o.name for o in OUTPUTS]
+        for name in names:
+            if not isinstance(GRAPH.get(name), Output):
+                raise ValueError(f"Unknown panel output: {name!r}")
+        self.outputs = list(names)
+        self._plans = {}
+
+    def _missing(self, name, present, memo):
+        """Raw inputs missing for `name` (empty if it can be computed)."""
+        if name in memo:
+            return memo[name]
+        node = GRAPH.get(name)
+        if node is None:
+            missing = set() if name in present else {name}
+        else:
+            missing = set()
+            for dep in node.inputs:
+                dep_missing = self._missing(dep, present, memo)
+                # an optional input is only left out when none of it was given (a value without its unit is an error)
+                if dep not in node.optional or dep_missing != _leaves(dep) - set(DEFAULT_INPUTS):
+                    missing |= dep_missing
+        memo[name] = missing
+        return missing
+
+    def plan(self, present):
+        """(quantities to compute in order, {skipped output: missing inputs}) for the given input names."""
+        present = frozenset(present)
+        cached = self._plans.get(present)
+        if cached is not None:
+            return cached
+        memo = {}
+        skipped = {}
+        needed = set()
+
+        def require(name):
+            node = GRAPH.get(name)
+            if node is None or name in needed:
+                return
+            for dep in node.inputs:
+                if not self._missing(dep, present, memo):
+                    require(dep)
+            needed.add(name)
+
+        for name in self.outputs:
+            missing = self._missing(name, present, memo)
+            if missing:
+                skipped[name] = sorted(missing)
+            else:
+                require(name)
+        order = [q for q in QUANTITIES + OUTPUTS if q.name in needed]
+        self._plans[present] = cached = (order, skipped)
+        return cached
+
+    def evaluate(self, inputs):
+        """
+        inputs: raw input name -> value (scalar or column); units as strings. None or ""
+        counts as absent. Returns a PanelResult.
+        """
+        present = {name: value for name, value in inputs.items() if value is not None and not (isinstance(value, str) and value == "")}
+        for name, value in DEFAULT_INPUTS.items():
+            present.setdefault(name, value)
+        columns = {name: value if name == "sex" else _column(value)
+                   for name, value in present.items() if name not in TEXT_INPUTS or name == "sex"}
+        single = all(np.ndim(value) == 0 for value in columns.values())
+        # every column (and a sex given once for all rows) as a view of the common shape
+        shape = np.broadcast_shapes((1,), *(np.shape(value) for value in columns.values()))
+        values = {name: value for name, value in present.items() if name in TEXT_INPUTS}
+        for name, value in columns.items():
+            values[name] = np.broadcast_to(np.asarray(value, dtype=str if name == "sex" else float), shape)
+
+        order, skipped = self.plan(present)
+        results = {}
+        categories = {}
+        with np.errstate(all="ignore"):
+            for node in order:
+                args = [values[dep] if dep in values else node.optional[dep] for dep in node.inputs]
+                value = node.func(*args)
+                if isinstance(node, Output):
+                    value = np.array(value, dtype=float)
+                    if node.digits is not None:
+                        value = _round_like_scalar(value, node.digits, lambda i, node=node: node.scalar(values, i))
+                    if node.name in self.outputs:
+                        results[node.name] = value
+                        if node.interpret:
+                            categories[node.name] = node.interpret(values, value)
+                values[node.name] = value
+        intermediates = {q.name: values[q.name] for q in order if not isinstance(q, Output)}
+        if single:
+            results = {name: float(v[0]) for name, v in results.items()}
+            categories = {name: str(v[0]) for name, v in categories.items()}
+            intermediates = {name: v.item(0) if isinstance(v, np.ndarray) else v for name, v in intermediates.items()}
+        return PanelResult(results, categories, intermediates, skipped)
+
+
+DEFAULT_PANEL = Panel()
+
+
+def evaluate(inputs, outputs=None):
+    """Evaluates all outputs (or the named ones) whose inputs are present; see Panel.evaluate."""
+    return (DEFAULT_PANEL if outputs is None else Panel(outputs)).evaluate(inputs)
@@ -0,0 +1,127 @@
+# parallel.py
+# Multi-core batch recalculation.
+# The input is split into shards and each shard runs pipeline.compute_chunk on a
+# ProcessPoolExecutor worker. Results come back in input order whatever order the
+# shards finish in. A shard that fails is retried once in the parent process; if it
+# still fails its rows are left blank and the error is reported, the other shards
+# are kept.
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pipeline
+
+DEFAULT_SHARD_SIZE = 50000
+
+
+def _run_shard(calc_names, inputs, units):
+    calculators = [pipeline.CALCULATORS[name] for name in calc_names]
+    return pipeline.compute_chunk(calculators, inputs, units)
+
+
+class ShardError:
+    def __init__(self, index, start, stop, error):
+        self.index = index
+        self.start = start
+        self.stop = stop
+        self.error = error
+
+    def __repr__(self):
+        return f"ShardError(shard={self.index}, rows={self.start}:{self.stop}, error={self.error!r})"
+
+
+class BatchResult:
+    """columns: output columns (see pipeline.compute_chunk); errors: list of ShardError"""
+    def __init__(self, columns, errors):
+        self.columns = columns
+        self.errors = errors
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def _row_count(inputs):
+    return len(next(iter(inputs.values()))) if inputs else 0
+
+
+def split_shards(inputs, shard_size=DEFAULT_SHARD_SIZE):
+    """Yields (start, stop, shard_inputs) slices of a dict of equally long columns."""
+    n = _row_count(inputs)
+    for start in range(0, n, shard_size):
+        stop = min(start + shard_size, n)
+        yield start, stop, {name: column[start:stop] for name, column in inputs.items()}
+
+
+def _blank_shard(calc_names, rows):
+    width = sum(len(pipeline.CALCULATORS[name].output_columns()) for name in calc_names)
+    return [[""] * rows for _ in range(width)]
+
+
+def _recover(calc_names, inputs, units, index, start, stop, errors):
+    # retry in-process; a crashed worker or pickling problem often does not repeat here
+    try:
+        return _run_shard(calc_names, inputs, units)
+    except Exception as e:
+        errors.append(ShardError(index, start, stop, e))
+        return _blank_shard(calc_names, stop - start)
+
+
+def run_parallel(calc_names, inputs, units=None, shard_size=DEFAULT_SHARD_SIZE, max_workers=None, progress=None):
+    """
+    Runs the named calculators over `inputs` (dict of argument name -> list of values).
+    progress, if given, is called as progress(shard_index, shards_done, shard_total)
+    each time a shard finishes. Returns a BatchResult.
+    """
+    shards = list(split_shards(inputs, shard_size))
+    results = [None] * len(shards)
+    errors = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_run_shard, calc_names, shard, units): i for i, (_, _, shard) in enumerate(shards)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            start, stop, shard = shards[i]
+            try:
+                results[i] = future.result()
+            except Exception:
+                results[i] = _recover(calc_names, shard, units, i, start, stop, errors)
+            if progress:
+                progress(i, done, len(shards))
+
+    width = sum(len(pipeline.CALCULATORS[name].output_columns()) for name in calc_names)
+    columns = [[] for _ in range(width)]
+    for shard_columns in results:
+        for column, values in zip(columns, shard_columns):
+            column.extend(values)
+    errors.sort(key=lambda e: e.index)
+    return BatchResult(columns, errors)
+
+
+def imap_chunks(calc_names, chunks, units=None, max_workers=None, errors=None):
+    """
+    Streaming variant used by the CSV pipeline: `chunks` is an iterable of input dicts,
+    results are yielded one chunk at a time in input order. At most 2 * max_workers
+    chunks are in flight, so memory stays bounded. Failed chunks are appended to
+    `errors` (if given) and yielded blank.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    errors = [] if errors is None else errors
+    pending = deque()
+    row = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for index, chunk in enumerate(chunks):
+            rows = _row_count(chunk)
+            pending.append((index, row, row + rows, chunk, pool.submit(_run_shard, calc_names, chunk, units)))
+            row += rows
+            if len(pending) >= 2 * max_workers:
+                yield _collect(calc_names, units, pending.popleft(), errors)
+        while pending:
+            yield _collect(calc_names, units, pending.popleft(), errors)
+
+
+def _collect(calc_names, units, item, errors):
+    index, start, stop, chunk, future = item
+    try:
+        return future.result()
+    except Exception:
+        return _recover(calc_names, chunk, units, index, start, stop, errors)
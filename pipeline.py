@@ -0,0 +1,226 @@
+# pipeline.py
+# Headless batch pipeline for CSV lab extracts.
+# The extract is streamed in fixed-size chunks through the formulas_batch kernels, so
+# memory use depends on the chunk size only, never on the size of the file.
+#
+#   python pipeline.py extract.csv -o results.csv --calc egfr --calc uacr \
+#       --map creat_value=SCR --map age=AGE_YRS --unit creat_unit=mg/dL
+import argparse
+import csv
+import math
+import os
+import sys
+from collections import deque
+
+import formulas_batch
+import interpretation
+from units import to_canonical
+
+DEFAULT_CHUNK_SIZE = 10000
+
+# -----------------------
+# Calculator registry
+# -----------------------
+class Calculator:
+    """
+    One batch formula as seen by the pipeline.
+    columns: per-row arguments of `func`, read from the CSV (default column name = argument name)
+    units: unit arguments of `func` with their default value, fixed for the whole run
+    interpret: optional function (values, kwargs) -> category per row, where kwargs are
+               the arguments `func` was called with
+    """
+    def __init__(self, name, func, columns, units=None, interpret=None):
+        self.name = name
+        self.func = func
+        self.columns = columns
+        self.units = units or {}
+        self.interpret = interpret
+
+    def output_columns(self):
+        if self.interpret:
+            return [self.name, f"{self.name}_category"]
+        return [self.name]
+
+
+def _bands(table, analyte=None, unit_arg=None):
+    """Classifies with interpretation table `table`; analyte/unit_arg convert the result to the table's unit first."""
+    def interpret(values, kwargs):
+        if analyte:
+            values = to_canonical(values, analyte, kwargs[unit_arg])
+        return interpretation.categories(table, values)
+    return interpret
+
+
+def _pediatric_bands(values, kwargs):
+    return interpretation.pediatric_egfr_categories(values, formulas_batch._column(kwargs["age_var"]))
+
+
+CALCULATORS = {
+    "egfr": Calculator("egfr", formulas_batch.egfr_ckdepi2021_batch, ("creat_value", "age", "sex"),
+                       {"creat_unit": "umol/L"}, _bands("egfr")),
+    "crcl": Calculator("crcl", formulas_batch.cockcroft_gault_batch, ("age", "weight_kg", "creat_value", "sex"),
+                       {"creat_unit": "mg/dL"}),
+    "egfr_ped": Calculator("egfr_ped", formulas_batch.calc_pediatric_egfr_batch, ("height", "age_var", "sex", "creat_value"),
+                           {"creat_unit": "mg/dL"}, _pediatric_bands),
+    "uacr": Calculator("uacr", formulas_batch.calc_uacr_batch, ("alb_value", "creat_value"),
+                       {"albumin_unit": "mg/dL", "creat_unit": "mg/dL"}, _bands("uacr")),
+    "sosm": Calculator("sosm", formulas_batch.calc_serum_osm_batch, ("na", "k", "glucose_value", "urea_value"),
+                       {"glucose_unit": "mg/dL", "urea_unit": "mg/dL"}, _bands("serum_osm")),
+    "uosm": Calculator("uosm", formulas_batch.calc_urine_osm_batch, ("na", "k", "urea_value", "glucose_value"),
+                       {"urea_unit": "mg/dL", "glucose_unit": "mg/dL"}, _bands("urine_osm")),
+    # LDL is reported in the HDL unit and HDL in the LDL unit; the cut-offs are in mg/dL
+    "ldl": Calculator("ldl", formulas_batch.calc_ldl_sampson_batch, ("tc", "tg", "hdl"),
+                      {"tc_unit": "mg/dL", "tg_unit": "mg/dL", "hdl_unit": "mg/dL"}, _bands("ldl", "LDL", "hdl_unit")),
+    "hdl": Calculator("hdl", formulas_batch.calc_hdl_from_sampson_batch, ("tc_val", "tg_val", "ldl_val"),
+                      {"tc_unit": "mg/dL", "tg_unit": "mg/dL", "ldl_unit": "mg/dL"}, _bands("hdl", "HDL", "ldl_unit")),
+    "bmi": Calculator("bmi", formulas_batch.calc_bmi_batch, ("weight_kg", "height_cm")),
+    "bsa": Calculator("bsa", formulas_batch.calculate_bsa_batch, ("weight_kg", "height_cm")),
+}
+
+# -----------------------
+# Chunk processing
+# -----------------------
+def _format(value):
+    return "" if math.isnan(value) else repr(value)
+
+
+def compute_chunk(calculators, inputs, units=None):
+    """
+    Runs every calculator over one chunk.
+    inputs: dict of argument name -> list of raw (string) values, one per row
+    Returns a list of output columns in the order given by Calculator.output_columns.
+    """
+    units = units or {}
+    out = []
+    for calc in calculators:
+        kwargs = {c: inputs[c] for c in calc.columns}
+        for name, default in calc.units.items():
+            kwargs[name] = units.get(name, default)
+        values = calc.func(**kwargs)
+        out.append([_format(v) for v in values.tolist()])
+        if calc.interpret:
+            out.append(calc.interpret(values, kwargs).tolist())
+    return out
+
+
+def iter_chunks(reader, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def resolve_columns(header, calculators, column_map=None):
+    """Maps every argument the calculators need onto a CSV column index."""
+    column_map = column_map or {}
+    positions = {name: i for i, name in enumerate(header)}
+    needed = {}
+    for calc in calculators:
+        for arg in calc.columns:
+            column = column_map.get(arg, arg)
+            if column not in positions:
+                raise ValueError(f"Column '{column}' required by {calc.name} not found in input")
+            needed[arg] = positions[column]
+    return needed
+
+
+def _chunk_inputs(chunk, needed):
+    return {arg: [row[i] if i < len(row) else "" for row in chunk] for arg, i in needed.items()}
+
+
+def run_pipeline(infile, outfile, calc_names, column_map=None, units=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, errors=None,
+                 progress=None, cancel=None):
+    """
+    Streams `infile` (an open CSV text file) to `outfile`, appending the result and
+    category columns of every calculator in `calc_names`. Returns the number of rows.
+    With workers > 1 the chunks are computed on a process pool (see parallel.py) and
+    chunks that fail are written blank and appended to `errors`.
+    progress, if given, is called as progress(rows_done, results) after each chunk is
+    written (results: that chunk's output columns). cancel, if given, is called after
+    each chunk; when it returns true the run stops there and the rows written so far
+    are kept.
+    """
+    calculators = [CALCULATORS[name] for name in calc_names]
+    reader = csv.reader(infile)
+    writer = csv.writer(outfile, lineterminator="\n")
+    header = next(reader)
+    needed = resolve_columns(header, calculators, column_map)
+    writer.writerow(header + [c for calc in calculators for c in calc.output_columns()])
+
+    chunks = iter_chunks(reader, chunk_size)
+    if workers > 1:
+        import parallel
+        in_flight = deque()
+
+        def shard_inputs():
+            for chunk in chunks:
+                in_flight.append(chunk)
+                yield _chunk_inputs(chunk, needed)
+        computed = ((in_flight.popleft(), results)
+                    for results in parallel.imap_chunks(calc_names, shard_inputs(), units, workers, errors))
+    else:
+        computed = ((chunk, compute_chunk(calculators, _chunk_inputs(chunk, needed), units)) for chunk in chunks)
+
+    rows = 0
+    for chunk, results in computed:
+        for i, row in enumerate(chunk):
+            writer.writerow(row + [column[i] for column in results])
+        rows += len(chunk)
+        if progress:
+            progress(rows, results)
+        if cancel and cancel():
+            break
+    return rows
+
+
+def _pairs(values, option):
+    out = {}
+    for item in values or []:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"{option} expects NAME=VALUE, got '{item}'")
+        out[key] = value
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run ChemCalc formulas over a CSV lab extract.")
+    parser.add_argument("input", help="input CSV file, '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output CSV file (default stdout)")
+    parser.add_argument("--calc", action="append", choices=sorted(CALCULATORS), required=True,
+                        help="calculator to run; repeat for several")
+    parser.add_argument("--map", action="append", metavar="ARG=COLUMN",
+                        help="read formula argument ARG from CSV column COLUMN")
+    parser.add_argument("--unit", action="append", metavar="UNIT_ARG=UNIT",
+                        help="unit of a column, e.g. creat_unit=mg/dL")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default 1)")
+    parser.add_argument("--bands", metavar="JSON", help="interpretation cut-offs to use instead of the defaults")
+    args = parser.parse_args(argv)
+    if args.bands:
+        interpretation.load_bands(args.bands)
+        # spawned --workers processes pick the tables up when they import interpretation
+        os.environ["CHEMCALC_BANDS"] = os.path.abspath(args.bands)
+
+    infile = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    outfile = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    errors = []
+    try:
+        rows = run_pipeline(infile, outfile, args.calc, _pairs(args.map, "--map"), _pairs(args.unit, "--unit"),
+                            args.chunk_size, args.workers, errors)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    for error in errors:
+        print(f"chunk {error.index} (rows {error.start}-{error.stop - 1}) failed: {error.error}", file=sys.stderr)
+    print(f"{rows} rows processed", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# result_store.py
+# Append-only store of computed results, memory-mapped for zero-copy reads.
+#
+#   with ResultStore("results.ccs", "a") as store:           # one writer at a time
+#       store.append_result("MRN0042", "egfr", engine.egfr(...))
+#
+#   store = ResultStore("results.ccs")                         # any number of readers
+#   store.rows()["value"]                                      # whole column, no copy
+#   store.history("MRN0042")                                   # one patient, no scan
+#
+# Files
+#   <path>      64-byte header (magic, committed row count, capacity) followed by rows
+#               of ROW_DTYPE. Grows by doubling; a row counts only once the header count
+#               includes it, so readers never see a half-written row.
+#   <path>.idx  open-addressing hash table patient id -> last row of that patient. Each
+#               row links to the patient's previous row (`prev`), so a history is read by
+#               following the chain from the index instead of scanning the file. The table
+#               is rebuilt into a new file (os.replace) when it gets half full.
+#
+# Inputs are stored in canonical units, in the order of INPUTS[formula] (NaN where an
+# input does not apply, e.g. height/weight for an eGFR not adjusted to BSA). `value` is
+# in canonical units too: LDL and HDL in mg/dL whatever unit they were reported in.
+import os
+import zlib
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer discipline is not enforced
+    fcntl = None
+
+MAGIC = b"CCSTORE1"
+INDEX_MAGIC = b"CCINDEX1"
+HEADER_SIZE = 64
+INITIAL_CAPACITY = 1024
+INITIAL_SLOTS = 1024
+
+# formula id (the position in this tuple) -> canonical inputs, as in engine Result.intermediates
+FORMULAS = ("egfr", "pediatric_egfr", "uacr", "urine_osm", "serum_osm", "ldl", "hdl")
+INPUTS = {
+    "egfr": ("scr_mgdl", "age", "height_cm", "weight_kg"),
+    "pediatric_egfr": ("scr_mgdl", "height_cm", "age"),
+    "uacr": ("alb_mgdl", "creat_mgdl"),
+    "urine_osm": ("na", "k", "urea_mgdl", "glucose_mgdl"),
+    "serum_osm": ("na", "k", "glucose_mgdl", "urea_mgdl"),
+    "ldl": ("tc_mgdl", "tg_mgdl", "hdl_mgdl"),
+    "hdl": ("tc_mgdl", "tg_mgdl", "ldl_mgdl"),
+}
+# results reported in the user's unit: the intermediate holding the canonical value
+CANONICAL_VALUE = {"ldl": "ldl_mgdl", "hdl": "hdl_mgdl"}
+MAX_INPUTS = max(len(names) for names in INPUTS.values())
+
+ROW_DTYPE = np.dtype([
+    ("patient", "S32"),
+    ("time", "M8[ms]"),
+    ("prev", "<i8"),              # previous row of the same patient, -1 for the first
+    ("formula", "u1"),
+    ("inputs", "<f8", (MAX_INPUTS,)),
+    ("value", "<f8"),
+    ("category", "S64"),          # UTF-8
+], align=True)
+
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("count", "<u8"), ("capacity", "<u8"), ("itemsize", "<u8")])
+_SLOT_DTYPE = np.dtype([("patient", "S32"), ("last", "<i8")])
+_INDEX_HEADER_DTYPE = np.dtype([("magic", "S8"), ("slots", "<u8"), ("used", "<u8")])
+
+
+def _key(patient_id):
+    key = patient_id.encode("utf-8") if isinstance(patient_id, str) else bytes(patient_id)
+    if not key or len(key) > 32:
+        raise ValueError(f"patient id must be 1 to 32 bytes: {patient_id!r}")
+    return key
+
+
+class ResultStore:
+    """
+    mode "r": read-only view, refreshed on every read so rows appended by a writer in
+    another process are seen. mode "a": appender (creates the files if needed).
+    """
+    def __init__(self, path, mode="r"):
+        if mode not in ("r", "a"):
+            raise ValueError("mode must be 'r' or 'a'")
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.writable = mode == "a"
+        self._rows = self._header = None
+        self._slots = self._index_header = None
+        self._index_id = None
+        self._lock_fd = None
+        if self.writable:
+            self._lock_fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl:
+                try:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    os.close(self._lock_fd)
+                    raise RuntimeError(f"{path} is already open for writing")
+            if os.fstat(self._lock_fd).st_size == 0:
+                self._create()
+        self._map()
+
+    # ---------- files ----------
+    def _create(self):
+        os.ftruncate(self._lock_fd, HEADER_SIZE + INITIAL_CAPACITY * ROW_DTYPE.itemsize)
+        header = np.memmap(self.path, _HEADER_DTYPE, "r+", shape=())
+        header["magic"], header["count"] = MAGIC, 0
+        header["capacity"], header["itemsize"] = INITIAL_CAPACITY, ROW_DTYPE.itemsize
+        header.flush()
+        self._write_index(np.zeros(INITIAL_SLOTS, _SLOT_DTYPE), 0)
+
+    def _map(self):
+        mode = "r+" if self.writable else "r"
+        self._header = np.memmap(self.path, _HEADER_DTYPE, mode, shape=())
+        if self._header["magic"] != MAGIC or self._header["itemsize"] != ROW_DTYPE.itemsize:
+            raise ValueError(f"{self.path} is not a result store of this version")
+        self._rows = np.memmap(self.path, ROW_DTYPE, mode, offset=HEADER_SIZE, shape=(int(self._header["capacity"]),))
+        self._map_index()
+
+    def _map_index(self):
+        mode = "r+" if self.writable else "r"
+        stat = os.stat(self.index_path)  # before mapping: a replacement in between is caught next refresh
+        self._index_header = np.memmap(self.index_path, _INDEX_HEADER_DTYPE, mode, shape=())
+        self._slots = np.memmap(self.index_path, _SLOT_DTYPE, mode, offset=HEADER_SIZE,
+                                shape=(int(self._index_header["slots"]),))
+        self._index_id = stat.st_ino
+
+    def _write_index(self, slots, used):
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            header = np.zeros((), _INDEX_HEADER_DTYPE)
+            header["magic"], header["slots"], header["used"] = INDEX_MAGIC, len(slots), used
+            f.write(header.tobytes().ljust(HEADER_SIZE, b"\0"))
+            f.write(slots.tobytes())
+        os.replace(tmp, self.index_path)
+
+    def refresh(self):
+        """Picks up rows and index changes made by the writer (readers call this on every read)."""
+        if int(self._header["capacity"]) != len(self._rows):
+            self._rows = np.memmap(self.path, ROW_DTYPE, "r", offset=HEADER_SIZE, shape=(int(self._header["capacity"]),))
+        if os.stat(self.index_path).st_ino != self._index_id:
+            self._map_index()
+
+    def __len__(self):
+        return int(self._header["count"])
+
+    # ---------- index ----------
+    def _find_slot(self, slots, key):
+        mask = len(slots) - 1
+        i = zlib.crc32(key) & mask
+        while True:
+            stored = slots[i]["patient"]
+            if stored == key or not stored:
+                return i
+            i = (i + 1) & mask
+
+    def _grow_index(self):
+        old = np.array(self._slots)
+        slots = np.zeros(len(old) * 2, _SLOT_DTYPE)
+        for entry in old[old["patient"] != b""]:
+            slots[self._find_slot(slots, entry["patient"])] = entry
+        used = int(self._index_header["used"])
+        self._write_index(slots, used)
+        self._map_index()
+
+    def offsets(self, patient_id):
+        """Row numbers of the patient's results, oldest first."""
+        if not self.writable:
+            self.refresh()
+        key = _key(patient_id)
+        count = len(self)
+        i = self._find_slot(self._slots, key)
+        row = int(self._slots[i]["last"]) if self._slots[i]["patient"] == key else -1
+        out = []
+        while row >= 0:
+            if row >= len(self._rows):
+                self.refresh()  # the writer grew the file after our refresh
+            if row < count:  # a row past the count is still being written
+                out.append(row)
+            row = int(self._rows[row]["prev"])
+        return np.array(out[::-1], dtype=np.int64)
+
+    # ---------- reading ----------
+    def rows(self):
+        """All committed rows: a read-only view of the mapping, no copy."""
+        if not self.writable:
+            self.refresh()
+        view = self._rows[:len(self)]
+        view.flags.writeable = False
+        return view
+
+    def history(self, patient_id):
+        """The patient's rows, oldest first (a copy of just those rows)."""
+        return self._rows[self.offsets(patient_id)]
+
+    @staticmethod
+    def inputs(row):
+        """The inputs of one row as a dict keyed by the names in INPUTS."""
+        names = INPUTS[FORMULAS[row["formula"]]]
+        return {name: float(v) for name, v in zip(names, row["inputs"])}
+
+    # ---------- writing ----------
+    def append(self, patient_id, formula, inputs, value, category, when=None):
+        """
+        Appends one result and returns its row number.
+        inputs: dict keyed by INPUTS[formula] (missing names are stored as NaN)
+        """
+        if not self.writable:
+            raise RuntimeError("store opened read-only")
+        key = _key(patient_id)
+        code = FORMULAS.index(formula)
+        category = (category or "").encode("utf-8")
+        if len(category) > 64:
+            raise ValueError(f"category longer than 64 bytes: {category!r}")
+
+        count = len(self)
+        if count == len(self._rows):
+            self._grow_rows()
+        if 2 * (int(self._index_header["used"]) + 1) > len(self._slots):
+            self._grow_index()
+        slot = self._find_slot(self._slots, key)
+        is_new = self._slots[slot]["patient"] != key
+
+        values = np.full(MAX_INPUTS, np.nan)
+        for i, name in enumerate(INPUTS[formula]):
+            if inputs.get(name) is not None:
+                values[i] = inputs[name]
+        prev = -1 if is_new else self._slots[slot]["last"]
+        self._rows[count] = (key, np.datetime64(when or datetime.now(), "ms"), prev, code, values, value, category)
+
+        # index first, count last: a reader that sees the count sees the whole row
+        self._slots[slot] = (key, count)
+        if is_new:
+            self._index_header["used"] += 1
+        self._header["count"] = count + 1
+        return count
+
+    def append_result(self, patient_id, formula, result, when=None):
+        """Appends an engine.Result produced by engine.<formula>."""
+        value = result.intermediates.get(CANONICAL_VALUE.get(formula), result.value)
+        return self.append(patient_id, formula, result.intermediates, value, result.category, when)
+
+    def _grow_rows(self):
+        capacity = 2 * len(self._rows)
+        self._rows.flush()
+        os.ftruncate(self._lock_fd, HEADER_SIZE + capacity * ROW_DTYPE.itemsize)
+        self._rows = np.memmap(self.path, ROW_DTYPE, "r+", offset=HEADER_SIZE, shape=(capacity,))
+        self._header["capacity"] = capacity
+
+    def flush(self):
+        """Forces the mapped pages to disk."""
+        if self.writable:
+            self._rows.flush()
+            self._slots.flush()
+            self._index_header.flush()
+            self._header.flush()
+
+    def close(self):
+        self.flush()
+        self._rows = self._header = self._slots = self._index_header = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)  # releases the flock
+            self._lock_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,355 @@
+# service.py
+# HTTP/JSON service over the formulas, for LIS middleware and other programs that
+# cannot drive the desktop window. Pure asyncio, no web framework.
+#
+#   python service.py --port 8080
+#
+#   GET  /formulas          every formula with its arguments
+#   GET  /health            liveness and load
+#   GET  /metrics           Prometheus metrics, when started with --metrics (see metrics.py)
+#   POST /formulas/<name>   one calculation; body = keyword arguments of formulas.<name>
+#                           {"creat_value": 80, "creat_unit": "umol/L", "age": 50, "sex": "female"}
+#                           -> {"value": 77.37}
+#   POST /batch/<name>      many rows through formulas_batch.<name>_batch
+#                           {"defaults": {"creat_unit": "umol/L"}, "rows": [{"creat_value": 80, ...}, ...]}
+#                           -> {"values": [...]} in row order, null for rows the scalar version rejects
+#
+# Connections are kept alive (HTTP/1.1). Back-pressure: past --max-connections a new
+# connection is not read until another closes, at most --max-batches batches compute
+# at once (on a thread pool, the event loop keeps answering single requests) and when
+# --max-queued batches are already waiting the service answers 503 with Retry-After.
+import argparse
+import asyncio
+import inspect
+import json
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import numpy as np
+
+import formulas
+import formulas_batch
+
+DEFAULT_MAX_CONNECTIONS = 256
+DEFAULT_MAX_QUEUED = 64
+DEFAULT_MAX_BODY = 32 * 1024 * 1024
+DEFAULT_IDLE_TIMEOUT = 30.0
+MAX_HEADER = 16 * 1024
+
+# -----------------------
+# Formula registry
+# -----------------------
+# arguments that hold one value for a whole column: unit codes and BSA switches
+_FIXED_FLAGS = ("adjust_to_bsa", "normalize_to_bsa")
+
+
+class Formula:
+    """
+    One formula as exposed by the service.
+    func/batch: the scalar function from formulas.py and its formulas_batch counterpart
+    columns: arguments that vary per row; fixed: units and flags, constant per batch group
+    """
+    def __init__(self, name):
+        self.name = name
+        params = inspect.signature(getattr(formulas, name)).parameters
+        self.defaults = {p.name: p.default for p in params.values() if p.default is not inspect.Parameter.empty}
+        self.arguments = list(params)
+        self.fixed = [a for a in self.arguments if a.endswith("_unit") or a in _FIXED_FLAGS]
+        self.columns = [a for a in self.arguments if a not in self.fixed]
+
+    @property
+    def func(self):
+        # looked up per call, so metrics.enable() instruments a running service
+        return getattr(formulas, self.name)
+
+    @property
+    def batch(self):
+        return getattr(formulas_batch, f"{self.name}_batch")
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "arguments": self.arguments,
+            "per_row": self.columns,
+            "per_batch": self.fixed,
+            "defaults": self.defaults,
+        }
+
+
+FORMULAS = {name: Formula(name) for name in (
+    "egfr_ckdepi2021", "cockcroft_gault", "egfr_schwartz", "calc_pediatric_egfr", "calc_uacr",
+    "calc_serum_osm", "calc_urine_osm", "calc_ldl_sampson", "calc_hdl_from_sampson",
+    "calc_bmi", "calculate_bsa",
+)}
+
+# what a formula raises for input it rejects (AttributeError: a string method called on a non-string)
+_INPUT_ERRORS = (ValueError, TypeError, AttributeError, ZeroDivisionError, OverflowError)
+
+
+def _number(value):
+    return value if math.isfinite(value) else None
+
+
+def run_single(formula, kwargs):
+    if not isinstance(kwargs, dict):
+        raise ValueError("request body must be a JSON object of arguments")
+    return {"value": _number(float(formula.func(**kwargs)))}
+
+
+def run_batch(formula, body):
+    """
+    Decodes a batch request and computes it. Rows are grouped by their fixed arguments
+    (units, flags), so a batch may mix units; each group is one vectorised call.
+    """
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or not isinstance(payload.get("rows"), list):
+        raise ValueError('batch body must be {"rows": [...]}')
+    rows = payload["rows"]
+    given = payload.get("defaults", {})
+    if any(not isinstance(row, dict) for row in rows):
+        raise ValueError("every row must be a JSON object of arguments")
+    defaults = dict(formula.defaults, **given)
+
+    groups = {}
+    for i, row in enumerate(rows):
+        key = tuple(row.get(a, defaults.get(a)) for a in formula.fixed)
+        groups.setdefault(key, []).append(i)
+
+    values = np.full(len(rows), np.nan)
+    for key, index in groups.items():
+        kwargs = dict(zip(formula.fixed, key))
+        for arg in formula.columns:
+            # an argument nobody sent is left to the batch function's own default
+            if arg in given or any(arg in rows[i] for i in index):
+                default = defaults.get(arg)
+                kwargs[arg] = [rows[i].get(arg, default) for i in index]
+        values[index] = formula.batch(**kwargs)
+    return {"values": [None if v != v else v for v in values.tolist()]}
+
+# -----------------------
+# HTTP
+# -----------------------
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, path, headers, body, keep_alive):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.keep_alive = keep_alive
+
+
+async def read_request(reader, max_body):
+    """Reads one request; returns None when the client closed the connection between requests."""
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HTTPError(400, "incomplete request")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "request header too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    if "transfer-encoding" in headers:
+        raise HTTPError(411, "send the body with Content-Length")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "invalid Content-Length")
+    if length > max_body:
+        raise HTTPError(413, f"body larger than {max_body} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.1":
+        keep_alive = connection != "close"
+    else:
+        keep_alive = connection == "keep-alive"
+    return Request(method, target.split("?", 1)[0], headers, body, keep_alive)
+
+
+def encode_response(status, payload, keep_alive=True, headers=()):
+    if isinstance(payload, str):
+        # plain text: the Prometheus exposition format of /metrics
+        body, content_type = payload.encode(), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, separators=(",", ":")).encode(), "application/json"
+    head = [
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        "Connection: keep-alive" if keep_alive else "Connection: close",
+    ]
+    head.extend(f"{name}: {value}" for name, value in headers)
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+class CalcService:
+    """
+    max_connections: connections served at once; further connections wait unread
+    max_batches: batches computed at once (thread pool size)
+    max_queued: batches allowed to wait for a slot before answering 503
+    """
+    def __init__(self, max_connections=DEFAULT_MAX_CONNECTIONS, max_batches=None, max_queued=DEFAULT_MAX_QUEUED,
+                 max_body=DEFAULT_MAX_BODY, idle_timeout=DEFAULT_IDLE_TIMEOUT, metrics=False):
+        self.max_batches = max_batches or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.max_body = max_body
+        self.idle_timeout = idle_timeout
+        self._connections = asyncio.Semaphore(max_connections)
+        self._batch_slots = asyncio.Semaphore(self.max_batches)
+        self._pool = ThreadPoolExecutor(self.max_batches, thread_name_prefix="chemcalc-batch")
+        self.waiting = 0
+        self.running = 0
+        self.requests = 0
+        self.rejected = 0
+        self.server = None
+        self.metrics = None
+        if metrics:
+            import metrics as metrics_module
+            metrics_module.enable(engine_functions=False, batch_functions=True)
+            self.metrics = metrics_module
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self.server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER)
+        return self.server
+
+    def address(self):
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        self._pool.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        async with self._connections:
+            try:
+                while True:
+                    try:
+                        request = await asyncio.wait_for(read_request(reader, self.max_body), self.idle_timeout)
+                    except HTTPError as e:
+                        # the rest of the stream cannot be trusted: answer and close
+                        writer.write(encode_response(e.status, {"error": str(e)}, keep_alive=False))
+                        await writer.drain()
+                        break
+                    if request is None:
+                        break
+                    self.requests += 1
+                    try:
+                        status, payload, headers = await self.dispatch(request)
+                    except Exception as e:
+                        # a bug, not bad input: still answer, and keep the connection usable
+                        print(f"internal error on {request.method} {request.path}: {e!r}", file=sys.stderr)
+                        status, payload, headers = 500, {"error": "internal error"}, ()
+                    writer.write(encode_response(status, payload, request.keep_alive, headers))
+                    await writer.drain()
+                    if not request.keep_alive:
+                        break
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+    async def dispatch(self, request):
+        """Returns (status, JSON payload, extra headers)."""
+        path = request.path.rstrip("/")
+        if path == "/formulas" and request.method == "GET":
+            return 200, {"formulas": [f.describe() for f in FORMULAS.values()]}, ()
+        if path == "/health" and request.method == "GET":
+            return 200, {"status": "ok", "batches_running": self.running, "batches_waiting": self.waiting}, ()
+        if path == "/metrics" and request.method == "GET" and self.metrics:
+            return 200, self.metrics.REGISTRY.render(), ()
+
+        kind, _, name = path.lstrip("/").partition("/")
+        if kind not in ("formulas", "batch") or not name:
+            return 404, {"error": f"no route for {request.path}"}, ()
+        if request.method != "POST":
+            return 405, {"error": "use POST"}, (("Allow", "POST"),)
+        formula = FORMULAS.get(name)
+        if formula is None:
+            return 404, {"error": f"unknown formula '{name}'"}, ()
+
+        if kind == "formulas":
+            # microseconds of work: computed on the event loop
+            try:
+                kwargs = json.loads(request.body or b"{}")
+                return 200, run_single(formula, kwargs), ()
+            except json.JSONDecodeError as e:
+                return 400, {"error": f"invalid JSON: {e}"}, ()
+            except _INPUT_ERRORS as e:
+                return 422, {"error": str(e)}, ()
+
+        if self.waiting >= self.max_queued:
+            self.rejected += 1
+            return 503, {"error": "too many batches queued, retry later"}, (("Retry-After", "1"),)
+        self.waiting += 1
+        try:
+            await self._batch_slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return 200, await loop.run_in_executor(self._pool, run_batch, formula, request.body), ()
+        except json.JSONDecodeError as e:
+            return 400, {"error": f"invalid JSON: {e}"}, ()
+        except _INPUT_ERRORS as e:
+            return 422, {"error": str(e)}, ()
+        finally:
+            self.running -= 1
+            self._batch_slots.release()
+
+
+async def serve(host="127.0.0.1", port=8080, **options):
+    service = CalcService(**options)
+    await service.start(host, port)
+    host, port = service.address()
+    print(f"ChemCalc service on http://{host}:{port}", file=sys.stderr, flush=True)
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the ChemCalc formulas as HTTP/JSON endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="0 picks a free port")
+    parser.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS)
+    parser.add_argument("--max-batches", type=int, default=None, help="batches computed at once (default: CPU count)")
+    parser.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED, help="batches waiting before 503")
+    parser.add_argument("--max-body", type=int, default=DEFAULT_MAX_BODY, help="largest request body in bytes")
+    parser.add_argument("--metrics", action="store_true", help="instrument the formulas and serve GET /metrics")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT, help="seconds before an idle connection is closed")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, max_connections=args.max_connections, max_batches=args.max_batches,
+                          max_queued=args.max_queued, max_body=args.max_body, idle_timeout=args.idle_timeout,
+                          metrics=args.metrics))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+# specs.py
+# The formulas, declared once as expressions.
+#
+# Each Spec lists its inputs (canonical units), named intermediate steps, guards and the
+# result as an expression tree built with ordinary Python operators. At import every
+# spec is compiled (generated Python source, exec'd once) into
+#   spec.scalar(*inputs)   plain-float function, rounded like the original formula;
+#                          a guard that fails raises ValueError
+#   spec.vector(*inputs)   NumPy version over broadcast arrays -> (unrounded result, invalid
+#                          mask or None); compiled on first use so importing formulas.py
+#                          does not import NumPy
+#   spec.row(*inputs)      plain-float function for compiled per-row loops (formulas_jit):
+#                          unrounded, a failing guard returns NaN instead of raising
+#   spec.trace(inputs, result_text)   the equation with the patient's values filled in,
+#                          rendered from the same expressions only when it is shown
+# formulas.py, formulas_batch.py, panel.py and engine.py use these, so the arithmetic, the vectorised
+# arithmetic and the equation shown to the user cannot drift apart.
+#
+# The generated source is fully parenthesised in the order the expression was written, so
+# the scalar functions compute exactly what the hand-written formulas did.
+import math
+import operator
+
+# -----------------------
+# Expressions
+# -----------------------
+_SYMBOLS = {"+": " + ", "-": " - ", "*": " × ", "/": " / ", "**": "^",
+            "<": " < ", "<=": " ≤ ", ">": " > ", ">=": " ≥ "}
+_PRECEDENCE = {"<": 1, "<=": 1, ">": 1, ">=": 1, "+": 2, "-": 2, "*": 3, "/": 3, "**": 5}
+_SCALAR_CALLS = {"min": "min", "max": "max", "abs": "abs", "sqrt": "_sqrt", "isnan": "_isnan"}
+_VECTOR_CALLS = {"min": "_np.minimum", "max": "_np.maximum", "abs": "_np.abs", "sqrt": "_np.sqrt", "isnan": "_np.isnan"}
+_OPERATORS = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv, "**": operator.pow,
+              "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+_EVALUATE_CALLS = {"min": min, "max": max, "abs": abs, "sqrt": math.sqrt, "isnan": math.isnan}
+
+
+def _wrap(value):
+    return value if isinstance(value, Expr) else Const(value)
+
+
+class Expr:
+    precedence = 6
+
+    def __add__(self, other): return BinOp("+", self, _wrap(other))
+    def __radd__(self, other): return BinOp("+", _wrap(other), self)
+    def __sub__(self, other): return BinOp("-", self, _wrap(other))
+    def __rsub__(self, other): return BinOp("-", _wrap(other), self)
+    def __mul__(self, other): return BinOp("*", self, _wrap(other))
+    def __rmul__(self, other): return BinOp("*", _wrap(other), self)
+    def __truediv__(self, other): return BinOp("/", self, _wrap(other))
+    def __rtruediv__(self, other): return BinOp("/", _wrap(other), self)
+    def __pow__(self, other): return BinOp("**", self, _wrap(other))
+    def __rpow__(self, other): return BinOp("**", _wrap(other), self)
+    def __lt__(self, other): return BinOp("<", self, _wrap(other))
+    def __le__(self, other): return BinOp("<=", self, _wrap(other))
+    def __gt__(self, other): return BinOp(">", self, _wrap(other))
+    def __ge__(self, other): return BinOp(">=", self, _wrap(other))
+
+    def names(self):
+        """Names of the variables the expression reads."""
+        return set()
+
+
+class Const(Expr):
+    def __init__(self, value):
+        self.value = value
+
+    def source(self, vector):
+        return f"({self.value!r})" if self.value < 0 else repr(self.value)
+
+    def evaluate(self, values):
+        return self.value
+
+    def render(self, values):
+        return f"{self.value:g}" if isinstance(self.value, float) and abs(self.value) >= 1e-4 else repr(self.value)
+
+
+class Var(Expr):
+    """
+    A named input or step. label/fmt: how the trace shows it (fmt None: label only, for
+    flags such as `female`).
+    """
+    def __init__(self, name, label=None, fmt="g"):
+        self.name = name
+        self.label = label or name
+        self.fmt = fmt
+
+    def source(self, vector):
+        return self.name
+
+    def evaluate(self, values):
+        return values[self.name]
+
+    def render(self, values):
+        if self.fmt is None:
+            return self.label
+        return f"{self.label}[{values[self.name]:{self.fmt}}]"
+
+    def names(self):
+        return {self.name}
+
+
+class BinOp(Expr):
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.precedence = _PRECEDENCE[op]
+
+    def source(self, vector):
+        return f"({self.left.source(vector)} {self.op} {self.right.source(vector)})"
+
+    def evaluate(self, values):
+        return _OPERATORS[self.op](self.left.evaluate(values), self.right.evaluate(values))
+
+    def render(self, values):
+        left = self.left.render(values)
+        right = self.right.render(values)
+        # ** binds to the right; - and / to the left
+        if self.left.precedence < self.precedence or (self.op == "**" and self.left.precedence == self.precedence):
+            left = f"({left})"
+        if self.right.precedence < self.precedence or (self.op in ("-", "/", "**") and self.right.precedence == self.precedence):
+            right = f"({right})"
+        return f"{left}{_SYMBOLS[self.op]}{right}"
+
+    def names(self):
+        return self.left.names() | self.right.names()
+
+
+class Call(Expr):
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = [_wrap(a) for a in args]
+
+    def source(self, vector):
+        table = _VECTOR_CALLS if vector else _SCALAR_CALLS
+        return f"{table[self.func]}({', '.join(a.source(vector) for a in self.args)})"
+
+    def evaluate(self, values):
+        return _EVALUATE_CALLS[self.func](*(a.evaluate(values) for a in self.args))
+
+    def render(self, values):
+        if self.func == "sqrt":
+            return f"√({self.args[0].render(values)})"
+        return f"{self.func}({', '.join(a.render(values) for a in self.args)})"
+
+    def names(self):
+        return set().union(*(a.names() for a in self.args))
+
+
+class Where(Expr):
+    precedence = 0
+
+    def __init__(self, condition, then, otherwise):
+        self.condition = _wrap(condition)
+        self.then = _wrap(then)
+        self.otherwise = _wrap(otherwise)
+
+    def source(self, vector):
+        c, a, b = (e.source(vector) for e in (self.condition, self.then, self.otherwise))
+        return f"_np.where({c}, {a}, {b})" if vector else f"({a} if {c} else {b})"
+
+    def evaluate(self, values):
+        return self.then.evaluate(values) if self.condition.evaluate(values) else self.otherwise.evaluate(values)
+
+    def render(self, values):
+        return f"{self.then.render(values)} if {self.condition.render(values)} else {self.otherwise.render(values)}"
+
+    def names(self):
+        return self.condition.names() | self.then.names() | self.otherwise.names()
+
+
+def minimum(a, b): return Call("min", a, b)
+def maximum(a, b): return Call("max", a, b)
+def sqrt(a): return Call("sqrt", a)
+def absolute(a): return Call("abs", a)
+def isnan(a): return Call("isnan", a)
+
+# -----------------------
+# Specs
+# -----------------------
+class Spec:
+    """
+    name: function name used in the generated code; title/notes: trace header.
+    inputs: Vars in call order; steps: ((Var, expr), ...) evaluated in order;
+    guards: ((condition, message), ...) -- a true condition makes the row invalid
+    (ValueError in the scalar form). digits: rounding of the scalar result.
+    """
+    def __init__(self, name, title, label, inputs, result, steps=(), guards=(), digits=None, notes=()):
+        self.name = name
+        self.title = title
+        self.label = label
+        self.inputs = tuple(inputs)
+        self.steps = tuple(steps)
+        self.guards = tuple(guards)
+        self.result = result
+        self.digits = digits
+        self.notes = tuple(notes)
+        self._vector = None
+        self._row = None
+        self.scalar = self._compile(vector=False)
+
+    def extend(self, name, title, inputs, steps, result, as_var, guards=(), digits=None, notes=()):
+        """A spec that takes this spec's (unrounded) result as step `as_var` and goes on from there."""
+        return Spec(name, title, self.label, self.inputs + tuple(inputs), result,
+                    self.steps + ((as_var, self.result),) + tuple(steps), self.guards + tuple(guards),
+                    digits, self.notes + tuple(notes))
+
+    # ---------- compilation ----------
+    def source(self, vector, row=False):
+        """The generated Python source of the scalar, the vector or (row=True) the row function."""
+        args = ", ".join(v.name for v in self.inputs)
+        body = []
+        defined = {v.name for v in self.inputs}
+        pending = list(self.guards)
+
+        def emit_guards():
+            # a guard goes right after the last name it reads is available, as in the hand-written code
+            for guard in [g for g in pending if g[0].names() <= defined]:
+                pending.remove(guard)
+                condition, message = guard
+                if vector:
+                    body.append(f"_bad = {condition.source(True)}")
+                    body.append("_invalid = _bad if _invalid is None else (_invalid | _bad)")
+                elif row:
+                    body.append(f"if {condition.source(False)}:")
+                    body.append("    return _nan")
+                else:
+                    body.append(f"if {condition.source(False)}:")
+                    body.append(f"    raise ValueError({message!r})")
+
+        if vector:
+            body.append("_invalid = None")
+        emit_guards()
+        for var, expr in self.steps:
+            body.append(f"{var.name} = {expr.source(vector)}")
+            defined.add(var.name)
+            emit_guards()
+        result = self.result.source(vector)
+        if vector:
+            body.append(f"return {result}, _invalid")
+        elif row or self.digits is None:
+            body.append(f"return {result}")
+        else:
+            body.append(f"return round({result}, {self.digits})")
+        if vector:
+            body = ["with _np.errstate(all='ignore'):"] + [f"    {line}" for line in body]
+        suffix = "_vector" if vector else "_row" if row else ""
+        return f"def {self.name}{suffix}({args}):\n" + "".join(f"    {line}\n" for line in body)
+
+    def _compile(self, vector, row=False):
+        # builtins and math functions as module globals of the generated code: one lookup each
+        namespace = {"round": round, "min": min, "max": max, "abs": abs, "_sqrt": math.sqrt, "_isnan": math.isnan,
+                     "_nan": math.nan}
+        if vector:
+            import numpy
+            namespace["_np"] = numpy
+        code = compile(self.source(vector, row), f"<spec {self.name}>", "exec")
+        exec(code, namespace)
+        return namespace[f"{self.name}_vector" if vector else f"{self.name}_row" if row else self.name]
+
+    @property
+    def vector(self):
+        if self._vector is None:
+            self._vector = self._compile(vector=True)
+        return self._vector
+
+    @property
+    def row(self):
+        if self._row is None:
+            self._row = self._compile(vector=False, row=True)
+        return self._row
+
+    # ---------- trace ----------
+    def evaluate(self, inputs):
+        """All input and step values for one patient (dict keyed by name), unrounded."""
+        values = dict(inputs)
+        for var, expr in self.steps:
+            values[var.name] = expr.evaluate(values)
+        return values
+
+    def trace(self, inputs, result_text):
+        """The equation with the patient's values; `result_text` is the reported result with its unit."""
+        values = self.evaluate(inputs)
+        lines = [f"Equation Used: {self.title}"]
+        lines += self.notes
+        for var, expr in self.steps:
+            value = values[var.name]
+            shown = f" = {value:{var.fmt}}" if var.fmt and not isinstance(expr, Const) else ""
+            lines.append(f"{var.label} = {expr.render(values)}{shown}")
+        lines.append(f"{self.label} = {self.result.render(values)}")
+        lines.append(f"{self.label} = {result_text}")
+        return "\n".join(lines)
+
+# -----------------------
+# Kidney function
+# -----------------------
+scr = Var("scr_mgdl", "Creatinine", ".2f")
+age = Var("age", "Age")
+female = Var("female", "female", None)
+male = Var("male", "male", None)
+height = Var("height_cm", "Height")
+weight = Var("weight_kg", "Weight")
+bsa = Var("bsa", "BSA", ".2f")
+
+kappa = Var("kappa", "kappa")
+alpha = Var("alpha", "alpha")
+sex_factor = Var("sex_factor", "sex_factor")
+y = Var("y", "y", ".3f")
+egfr_normalised = Var("egfr", "eGFR", ".2f")
+
+EGFR_CKDEPI2021 = Spec(
+    "egfr_ckdepi2021", "CKD-EPI 2021", "eGFR",
+    inputs=(scr, age, female),
+    steps=(
+        (kappa, Where(female, 0.7, 0.9)),
+        (alpha, Where(female, -0.241, -0.302)),
+        (sex_factor, Where(female, 1.012, 1.0)),
+        (y, scr / kappa),
+    ),
+    guards=((scr <= 0, "Creatinine must be a positive number."),),
+    result=142 * (minimum(y, 1) ** alpha) * (maximum(y, 1) ** -1.200) * (0.9938 ** age) * sex_factor,
+    digits=2,
+    notes=("NB: creatinine is first converted to mg/dL",),
+)
+
+# de-normalised to the patient's Mosteller BSA: absolute mL/min
+EGFR_CKDEPI2021_BSA = EGFR_CKDEPI2021.extend(
+    "egfr_ckdepi2021_bsa", "CKD-EPI 2021, adjusted to BSA",
+    inputs=(height, weight),
+    steps=((bsa, sqrt((height * weight) / 3600.0)),),
+    result=egfr_normalised * (bsa / 1.73),
+    as_var=egfr_normalised,
+    digits=2,
+)
+
+crcl = Var("crcl", "CrCl", ".2f")
+crcl_male = Var("crcl_male", "CrCl (male)", ".2f")
+
+COCKCROFT_GAULT = Spec(
+    "cockcroft_gault", "Cockcroft-Gault", "CrCl",
+    inputs=(age, weight, scr, female),
+    steps=((crcl_male, ((140 - age) * weight) / (72.0 * scr)),),
+    result=Where(female, crcl_male * 0.85, crcl_male),
+    digits=2,
+)
+
+COCKCROFT_GAULT_BSA = COCKCROFT_GAULT.extend(
+    "cockcroft_gault_bsa", "Cockcroft-Gault, normalised to 1.73 m²",
+    inputs=(height,),
+    steps=((bsa, sqrt((height * weight) / 3600.0)),),
+    result=crcl * (1.73 / bsa),
+    as_var=crcl,
+    digits=2,
+)
+
+EGFR_SCHWARTZ = Spec(
+    "egfr_schwartz", "Bedside Schwartz", "eGFR",
+    inputs=(height, scr),
+    guards=(((scr <= 0), "Height and creatinine must be positive numbers."),
+            ((height <= 0), "Height and creatinine must be positive numbers.")),
+    result=(0.413 * height) / scr,
+    digits=2,
+)
+
+k_schwartz = Var("k", "k")
+PEDIATRIC_EGFR = Spec(
+    "calc_pediatric_egfr", "Bedside Schwartz (age- and sex-specific k)", "eGFR",
+    inputs=(height, age, male, scr),
+    guards=(((scr <= 0), "Height and creatinine must be positive numbers."),
+            ((height <= 0), "Height and creatinine must be positive numbers."),
+            (isnan(age), "Invalid numeric input")),
+    steps=((k_schwartz, Where(age < 1, 0.45, Where(age < 13, 0.55, Where(male, 0.70, 0.55)))),),
+    result=(k_schwartz * height) / scr,
+    digits=2,
+    notes=("NB: creatinine is first converted to mg/dL and height to cm",
+           "k = 0.45 below 1 year, 0.55 from 1 to 12, 0.70 for males from 13 and 0.55 for females"),
+)
+
+albumin = Var("alb_mgdl", "Albumin", ".2f")
+urine_creat = Var("creat_mgdl", "Creatinine", ".2f")
+
+UACR = Spec(
+    "calc_uacr", "UACR", "UACR",
+    inputs=(albumin, urine_creat),
+    guards=(((urine_creat <= 0), "Creatinine must be a positive number."),),
+    result=(albumin / urine_creat) * 1000,
+    digits=2,
+    notes=("NB: albumin and creatinine are first converted to mg/dL",),
+)
+
+# -----------------------
+# Osmolality
+# -----------------------
+na = Var("na", "Na")
+k = Var("k", "K")
+glucose = Var("glucose_mgdl", "Glucose", ".2f")
+urea = Var("urea_mgdl", "Urea", ".2f")
+
+SERUM_OSM = Spec(
+    "calc_serum_osm", "Serum osmolality", "Serum Osm",
+    inputs=(na, k, glucose, urea),
+    result=2.0 * (na + k) + (glucose / 18.0) + (urea / 6.006),
+    digits=2,
+    notes=("NB: glucose and urea are first converted to mg/dL",),
+)
+
+URINE_OSM = Spec(
+    "calc_urine_osm", "Urine osmolality", "Uosm",
+    inputs=(na, k, urea, glucose),
+    result=2.0 * (na + k) + (urea / 6.006) + (glucose / 18.0),
+    digits=1,
+    notes=("NB: glucose and urea are first converted to mg/dL",),
+)
+
+# -----------------------
+# Lipids
+# -----------------------
+tc = Var("tc_mgdl", "TC", ".2f")
+tg = Var("tg_mgdl", "TG", ".2f")
+hdl = Var("hdl_mgdl", "HDL", ".2f")
+ldl = Var("ldl_mgdl", "LDL", ".2f")
+non_hdl = Var("non_hdl", "non_hdl", ".2f")
+numerator = Var("numerator", "numerator", ".2f")
+denominator = Var("denominator", "denominator", ".5f")
+
+LDL_SAMPSON = Spec(
+    "calc_ldl_sampson", "Sampson", "LDL",
+    inputs=(tc, tg, hdl),
+    guards=(((tg > 800), "Triglycerides too high for Sampson equation"),),
+    steps=((non_hdl, tc - hdl),),
+    result=(tc/0.948) - (hdl/0.971) - ((tg/8.56) + (tg * non_hdl/2140) - ((tg * tc)/16100)) - 9.44,
+    notes=("NB: values are first converted to mg/dL",),
+)
+
+HDL_FROM_SAMPSON = Spec(
+    "calc_hdl_from_sampson", "Reverse Sampson", "HDL",
+    inputs=(tc, tg, ldl),
+    guards=(((tg > 800), "Triglycerides too high for Sampson equation"),
+            ((absolute(denominator) < 1e-6), "Unstable Sampson HDL calculation (denominator ≈ 0)")),
+    steps=(
+        (numerator, (ldl - (tc / 0.948) + (tg / 8.56) + (tg * tc / 2140) - (tg ** 2 / 16100) + 9.44)),
+        (denominator, (tg / 2140) - (Const(1) / 0.971)),
+    ),
+    result=numerator / denominator,
+    notes=("NB: values are first converted to mg/dL",),
+)
+
+# -----------------------
+# Body size
+# -----------------------
+height_m = Var("h_m", "h_m", ".2f")
+weight_any = Var("w", "Weight")
+
+BMI = Spec(
+    "calc_bmi", "BMI", "BMI",
+    inputs=(weight_any, height),
+    steps=((height_m, height / 100.0),),
+    guards=(((height_m <= 0), "Height must be > 0"),),
+    result=weight_any / (height_m * height_m),
+    digits=1,
+)
+
+BSA_DUBOIS = Spec(
+    "calculate_bsa", "Du Bois", "BSA",
+    inputs=(weight, height),
+    result=0.007184 * (weight ** 0.425) * (height ** 0.725),
+)
+
+SPECS = {spec.name: spec for spec in (
+    EGFR_CKDEPI2021, EGFR_CKDEPI2021_BSA, COCKCROFT_GAULT, COCKCROFT_GAULT_BSA, EGFR_SCHWARTZ, PEDIATRIC_EGFR,
+    UACR, SERUM_OSM, URINE_OSM, LDL_SAMPSON, HDL_FROM_SAMPSON, BMI, BSA_DUBOIS)}
@@ -0,0 +1,220 @@
+# trajectory.py
+# Per-patient eGFR trajectories for KDIGO progression: a running least-squares slope
+# (mL/min/1.73 m² per year), the last value and the number of results of every patient.
+#
+# Each new result updates the patient's statistics in O(1) (Welford-style running means
+# and co-moments, so there is no cancellation however far times are from the epoch);
+# history is never reloaded. The statistics live in NumPy columns, one row per patient,
+# grown by doubling; a dict maps patient id -> row. update_many() folds a whole batch in
+# with vectorised group statistics.
+#
+#   tracker = EGFRTracker()
+#   tracker.update_creatinine("MRN0042", "2025-03-01", 92, "µmol/L", age=61, sex="female")
+#   tracker.slope("MRN0042")
+#   tracker.rapid_decliners()        # slope below -5 mL/min/1.73 m²/yr
+from datetime import datetime
+
+import numpy as np
+
+import formulas
+
+RAPID_DECLINE = 5.0       # mL/min/1.73 m² per year (KDIGO rapid progression)
+MIN_POINTS = 3            # results needed before a patient can be flagged
+MIN_SPAN_YEARS = 0.5      # ... spread over at least this long
+_EPOCH = np.datetime64("2000-01-01T00:00:00", "s")
+_SECONDS_PER_YEAR = 365.25 * 86400
+
+
+def years(when):
+    """Time as fractional years since 2000 (accepts datetime, np.datetime64, ISO strings, arrays of those, or years)."""
+    if isinstance(when, (int, float, np.floating, np.integer)):
+        return float(when)
+    if isinstance(when, datetime):
+        when = np.datetime64(when.replace(tzinfo=None) if when.tzinfo else when)
+    when = np.asarray(when)
+    if when.dtype.kind in "fiu":
+        return when.astype(float)
+    seconds = (when.astype("datetime64[s]") - _EPOCH).astype(float)
+    out = seconds / _SECONDS_PER_YEAR
+    return float(out) if out.ndim == 0 else out
+
+
+class EGFRTracker:
+    """Running eGFR slope per patient; see the module comment."""
+    _COLUMNS = ("mean_t", "mean_y", "m2_t", "c_ty", "first_t", "last_t", "last_y")
+
+    def __init__(self, capacity=1024, threshold=RAPID_DECLINE, min_points=MIN_POINTS, min_span=MIN_SPAN_YEARS):
+        self.threshold = threshold
+        self.min_points = min_points
+        self.min_span = min_span
+        self.ids = []          # row -> patient id
+        self.rows = {}         # patient id -> row
+        self.n = np.zeros(capacity, dtype=np.uint32)
+        for name in self._COLUMNS:
+            setattr(self, name, np.zeros(capacity))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _row(self, patient_id):
+        row = self.rows.get(patient_id)
+        if row is None:
+            row = self.rows[patient_id] = len(self.ids)
+            self.ids.append(patient_id)
+            if row == len(self.n):
+                self._grow(2 * len(self.n))
+        return row
+
+    def _grow(self, capacity):
+        for name in ("n",) + self._COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            setattr(self, name, grown)
+
+    # ---------- updates ----------
+    def update(self, patient_id, when, egfr):
+        """Adds one eGFR result; returns the patient's new slope (NaN until there are two distinct times)."""
+        t = years(when)
+        y = float(egfr)
+        r = self._row(patient_id)
+        n = int(self.n[r]) + 1
+        self.n[r] = n
+        dt = t - self.mean_t[r]
+        self.mean_t[r] += dt / n
+        dy = y - self.mean_y[r]
+        self.mean_y[r] += dy / n
+        self.m2_t[r] += dt * (t - self.mean_t[r])
+        self.c_ty[r] += dt * (y - self.mean_y[r])
+        if n == 1 or t < self.first_t[r]:
+            self.first_t[r] = t
+        if n == 1 or t >= self.last_t[r]:
+            self.last_t[r] = t
+            self.last_y[r] = y
+        return self._slope_at(r)
+
+    def update_creatinine(self, patient_id, when, creat_value, creat_unit, age, sex):
+        """Computes the CKD-EPI 2021 eGFR (formulas.egfr_ckdepi2021) and adds it; returns the new slope."""
+        egfr = formulas.egfr_ckdepi2021(creat_value, creat_unit, age=age, sex=sex.lower())
+        return self.update(patient_id, when, egfr)
+
+    def update_many(self, patient_ids, when, egfr):
+        """
+        Adds a batch of results (equal-length sequences). The batch's per-patient
+        statistics are computed with np.bincount and merged into the running ones
+        (pairwise update of Chan et al.), which gives the same slope as adding the
+        rows one by one. NaN results are ignored.
+        """
+        t = np.atleast_1d(years(when)).astype(float)
+        y = np.asarray(egfr, dtype=float)
+        ids = np.asarray(patient_ids, dtype=object)
+        keep = ~(np.isnan(t) | np.isnan(y))
+        t, y, ids = t[keep], y[keep], ids[keep]
+        if not len(y):
+            return
+        unique, group = np.unique(ids, return_inverse=True)
+        rows = np.array([self._row(p) for p in unique.tolist()], dtype=np.int64)
+
+        nb = np.bincount(group).astype(float)
+        mt_b = np.bincount(group, t) / nb
+        my_b = np.bincount(group, y) / nb
+        dt = t - mt_b[group]
+        m2_b = np.bincount(group, dt * dt)
+        c_b = np.bincount(group, dt * (y - my_b[group]))
+        first_b = np.full(len(unique), np.inf)
+        np.minimum.at(first_b, group, t)
+        # latest result of each patient in the batch: last index per group after sorting by time
+        order = np.lexsort((t, group))
+        last_idx = order[np.r_[np.flatnonzero(np.diff(group[order])), len(order) - 1]]
+
+        na = self.n[rows].astype(float)
+        n = na + nb
+        delta_t = mt_b - self.mean_t[rows]
+        delta_y = my_b - self.mean_y[rows]
+        weight = na * nb / n
+        self.m2_t[rows] += m2_b + delta_t * delta_t * weight
+        self.c_ty[rows] += c_b + delta_t * delta_y * weight
+        self.mean_t[rows] += delta_t * nb / n
+        self.mean_y[rows] += delta_y * nb / n
+
+        new = na == 0
+        self.first_t[rows] = np.where(new, first_b, np.minimum(self.first_t[rows], first_b))
+        later = new | (t[last_idx] >= self.last_t[rows])
+        self.last_t[rows] = np.where(later, t[last_idx], self.last_t[rows])
+        self.last_y[rows] = np.where(later, y[last_idx], self.last_y[rows])
+        self.n[rows] = n.astype(np.uint32)
+
+    # ---------- queries ----------
+    def _slope_at(self, r):
+        m2 = self.m2_t[r]
+        return float(self.c_ty[r] / m2) if m2 > 0 else float("nan")
+
+    def slope(self, patient_id):
+        """Least-squares slope in mL/min/1.73 m² per year; NaN for an unknown patient or a single time point."""
+        r = self.rows.get(patient_id)
+        return float("nan") if r is None else self._slope_at(r)
+
+    def slopes(self):
+        """Slope of every patient, in the order of self.ids."""
+        count = len(self.ids)
+        m2 = self.m2_t[:count]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(m2 > 0, self.c_ty[:count] / m2, np.nan)
+
+    def get(self, patient_id):
+        r = self.rows.get(patient_id)
+        if r is None:
+            return None
+        return {
+            "count": int(self.n[r]),
+            "slope": self._slope_at(r),
+            "last_value": float(self.last_y[r]),
+            "last_time": float(self.last_t[r]),
+            "span_years": float(self.last_t[r] - self.first_t[r]),
+            "rapid_decline": bool(self._flags(slice(r, r + 1))[0]),
+        }
+
+    def _flags(self, rows):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = np.where(self.m2_t[rows] > 0, self.c_ty[rows] / self.m2_t[rows], np.nan)
+        return ((slope < -self.threshold)
+                & (self.n[rows] >= self.min_points)
+                & (self.last_t[rows] - self.first_t[rows] >= self.min_span))
+
+    def rapid_decliners(self):
+        """Ids of the patients whose eGFR falls faster than the threshold."""
+        flagged = np.flatnonzero(self._flags(slice(0, len(self.ids))))
+        return [self.ids[i] for i in flagged]
+
+    # ---------- persistence ----------
+    def save(self, path):
+        """
+        Writes the statistics to an .npz file. Patient ids are stored as a fixed-width
+        string array (no pickle), so a loaded tracker has str ids whatever was saved.
+        """
+        count = len(self.ids)
+        columns = {name: getattr(self, name)[:count] for name in ("n",) + self._COLUMNS}
+        np.savez(path, ids=np.array([str(p) for p in self.ids], dtype=str), **columns)
+
+    @classmethod
+    def load(cls, path, **options):
+        with np.load(path, allow_pickle=False) as data:
+            ids = data["ids"].tolist()
+            tracker = cls(capacity=max(len(ids), 1), **options)
+            tracker.ids = ids
+            tracker.rows = {p: i for i, p in enumerate(ids)}
+            for name in ("n",) + cls._COLUMNS:
+                getattr(tracker, name)[:len(ids)] = data[name]
+        return tracker
+
+    @classmethod
+    def from_store(cls, store, **options):
+        """Builds the trajectories from the eGFR rows of a result_store.ResultStore."""
+        import result_store
+        rows = store.rows()
+        egfr = rows[rows["formula"] == result_store.FORMULAS.index("egfr")]
+        # eGFRs adjusted to BSA are absolute (mL/min) and not comparable: they carry a height
+        egfr = egfr[np.isnan(egfr["inputs"][:, result_store.INPUTS["egfr"].index("height_cm")])]
+        tracker = cls(**options)
+        tracker.update_many(np.char.decode(egfr["patient"], "utf-8"), egfr["time"], egfr["value"])
+        return tracker
@@ -0,0 +1,95 @@
+# units.py
+# Central unit registry.
+# Every accepted spelling of every unit is mapped once, at import, to an interned unit
+# code and its conversion to the canonical unit of the analyte (mg/dL for chemistry,
+# cm for height, kg for weight). A conversion is then one dict lookup and arithmetic.
+import sys
+from collections import namedtuple
+
+# code: interned display code; multiplier/divisor: value_canonical = value * multiplier / divisor
+# (µmol/L and mg/L keep a divisor so results stay bit-identical with the original formulas)
+Unit = namedtuple("Unit", "code multiplier divisor")
+
+# analyte -> canonical unit
+CANONICAL = {
+    "creatinine": "mg/dL",
+    "albumin": "mg/dL",
+    "glucose": "mg/dL",
+    "urea": "mg/dL",
+    "TC": "mg/dL",
+    "LDL": "mg/dL",
+    "HDL": "mg/dL",
+    "TG": "mg/dL",
+    "sodium": "mmol/L",
+    "potassium": "mmol/L",
+    "height": "cm",
+    "weight": "kg",
+}
+
+# code -> accepted spellings (matched case-insensitively, surrounding spaces ignored)
+SPELLINGS = {
+    "µmol/L": ("µmol/L", "µmol", "μmol/L", "μmol", "umol/L", "umol"),
+    "mmol/L": ("mmol/L", "mmol"),
+    "mg/dL": ("mg/dL", "mg/100mL"),
+    "mg/L": ("mg/L",),
+    "cm": ("cm",),
+    "m": ("m",),
+    "kg": ("kg",),
+    "lb": ("lb", "lbs"),
+}
+
+# analyte -> {code: (multiplier, divisor)}
+CONVERSIONS = {
+    "creatinine": {"mg/dL": (1.0, 1.0), "µmol/L": (1.0, 88.4), "mg/L": (1.0, 10.0)},
+    "albumin": {"mg/dL": (1.0, 1.0), "mg/L": (1.0, 10.0)},
+    "glucose": {"mg/dL": (1.0, 1.0), "mmol/L": (18.0, 1.0)},
+    "urea": {"mg/dL": (1.0, 1.0), "mmol/L": (6.006, 1.0)},
+    "TC": {"mg/dL": (1.0, 1.0), "mmol/L": (38.67, 1.0)},
+    "LDL": {"mg/dL": (1.0, 1.0), "mmol/L": (38.67, 1.0)},
+    "HDL": {"mg/dL": (1.0, 1.0), "mmol/L": (38.67, 1.0)},
+    "TG": {"mg/dL": (1.0, 1.0), "mmol/L": (88.57, 1.0)},
+    "sodium": {"mmol/L": (1.0, 1.0)},
+    "potassium": {"mmol/L": (1.0, 1.0)},
+    "height": {"cm": (1.0, 1.0), "m": (100.0, 1.0)},
+    "weight": {"kg": (1.0, 1.0), "lb": (0.45359237, 1.0)},
+}
+
+
+def _build_registry():
+    # analyte -> {spelling: Unit}
+    registry = {}
+    for analyte, conversions in CONVERSIONS.items():
+        table = registry[analyte] = {}
+        for code, (multiplier, divisor) in conversions.items():
+            unit = Unit(sys.intern(code), multiplier, divisor)
+            for spelling in SPELLINGS[code]:
+                # register the spelling as written and lower-cased, so the usual
+                # spellings never need .lower() at call time
+                table[spelling] = unit
+                table[spelling.lower()] = unit
+    return registry
+
+
+_REGISTRY = _build_registry()
+
+
+def resolve(analyte, unit):
+    """Returns the Unit for `unit` as used for `analyte`; raises ValueError if it is not supported."""
+    table = _REGISTRY[analyte]
+    found = table.get(unit)
+    if found is None:
+        if isinstance(unit, str):
+            found = table.get(unit.strip().lower())
+        if found is None:
+            raise ValueError(f"Unsupported {analyte} unit: {unit!r}")
+    return found
+
+
+def to_canonical(value, analyte, unit):
+    code, multiplier, divisor = _REGISTRY[analyte].get(unit) or resolve(analyte, unit)
+    return value * multiplier / divisor
+
+
+def from_canonical(value, analyte, unit):
+    code, multiplier, divisor = _REGISTRY[analyte].get(unit) or resolve(analyte, unit)
+    return value * divisor / multiplier